@@ -0,0 +1,145 @@
+from concurrent.futures import Future
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any, Callable, Optional, Tuple, TypeVar
+
+from chat_checker.models.breakdowns import BreakdownAnnotation, BreakdownProvenance
+from chat_checker.models.chatbot import ChatbotInfo
+from chat_checker.models.dialogue import DialogueTurn
+
+DEFAULT_ANNOTATION_STORE_FILE_NAME = "breakdown_annotations.sqlite"
+
+R = TypeVar("R")
+
+
+def get_context_fingerprint(
+    provenance: BreakdownProvenance,
+    chatbot_info: Optional[ChatbotInfo],
+    chat_history: list[DialogueTurn],
+    annotated_turn_index: Optional[int] = None,
+) -> str:
+    """
+    Compute the key of the annotation of a turn of a chat history.
+    Args:
+        provenance (BreakdownProvenance): The detector model and prompt version of the annotation.
+        chatbot_info (Optional[ChatbotInfo]): The chatbot info used in the prompt.
+        chat_history (list[DialogueTurn]): The chat history shown to the LLM, up to and including the annotated system turn.
+        annotated_turn_index (Optional[int]): The index of the annotated turn if several turns were annotated with the chat history in one call (batched detection). The last turn of the chat history if None.
+    Returns:
+        str: The SHA-256 hash of everything the annotation depends on.
+    """
+    context: dict[str, Any] = {
+        "detector_model": provenance.detector_model,
+        "prompt_version": provenance.prompt_version,
+        "chatbot_info": chatbot_info.model_dump(mode="json") if chatbot_info else None,
+        "chat_history": [[turn.role, turn.content] for turn in chat_history],
+    }
+    if annotated_turn_index is not None:
+        context["annotated_turn_index"] = annotated_turn_index
+    context_json = json.dumps(context, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(context_json.encode("utf-8")).hexdigest()
+
+
+class BreakdownAnnotationStore:
+    """
+    Persistent content-addressed store of breakdown annotations backed by SQLite.
+    Lets identical turn contexts (e.g. the greeting of a chatbot) be annotated once within a run and across runs.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path (Path): The path of the SQLite database file. Created if it does not exist.
+        """
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The connection is shared by all worker threads, access is serialized by the lock
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # The analyses in progress by key, so that concurrent workers analyze identical contexts only once
+        self._in_flight: dict[str, Future[BreakdownAnnotation]] = {}
+        self._in_flight_lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS annotations ("
+                "key TEXT PRIMARY KEY, annotation TEXT NOT NULL)"
+            )
+
+    def get_or_analyze(
+        self, key: str, analyze: Callable[[], Tuple[BreakdownAnnotation, R]]
+    ) -> Tuple[BreakdownAnnotation, Optional[R]]:
+        """
+        Get the stored annotation of a context or analyze the context and store its annotation.
+        A caller with the same key as an analysis in progress waits for its annotation instead of analyzing the context again. Callers with different keys never wait for each other.
+        Args:
+            key (str): The key of the context (see get_context_fingerprint).
+            analyze (Callable[[], Tuple[BreakdownAnnotation, R]]): Analyzes the context, returns the annotation and any further result of the analysis (e.g. the prompt and the LLM response).
+        Returns:
+            Tuple[BreakdownAnnotation, Optional[R]]: The annotation and the further result of the analysis, None if the annotation was stored or analyzed by another caller.
+        """
+        while True:
+            with self._in_flight_lock:
+                in_flight_analysis = self._in_flight.get(key)
+                if in_flight_analysis is None:
+                    analysis: Future[BreakdownAnnotation] = Future()
+                    self._in_flight[key] = analysis
+                    break
+            try:
+                # Every caller gets its own copy, as callers modify the annotations of their turns
+                return in_flight_analysis.result().model_copy(deep=True), None
+            except Exception:
+                # The analysis failed, the context is analyzed again by one of the waiting callers
+                continue
+        try:
+            stored_annotation = self.get(key)
+            if stored_annotation is not None:
+                analysis.set_result(stored_annotation)
+                return stored_annotation.model_copy(deep=True), None
+            annotation, result = analyze()
+            self.put(key, annotation)
+            analysis.set_result(annotation.model_copy(deep=True))
+            return annotation, result
+        except BaseException as e:
+            analysis.set_exception(e)
+            raise
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+
+    def get(self, key: str) -> Optional[BreakdownAnnotation]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT annotation FROM annotations WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return BreakdownAnnotation.model_validate_json(row[0])
+
+    def put(self, key: str, annotation: BreakdownAnnotation) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO annotations (key, annotation) VALUES (?, ?)",
+                (key, annotation.model_dump_json()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_annotation_store: Optional[BreakdownAnnotationStore] = None
+
+
+def get_breakdown_annotation_store() -> Optional[BreakdownAnnotationStore]:
+    return _annotation_store
+
+
+def set_breakdown_annotation_store(
+    annotation_store: Optional[BreakdownAnnotationStore],
+) -> None:
+    """Set the process-wide annotation store used by find_dialogue_breakdowns. Disables the reuse of annotations if None."""
+    global _annotation_store
+    _annotation_store = annotation_store
@@ -45,6 +45,44 @@ breakdown_identification_user_prompt = """# Dialogue Context
 """
 
 
+batched_output_format_str = """
+# Output Format
+Output your response as a JSON object with the field "annotations": a list with one object per analysed chatbot utterance. Each object has the following fields:
+- "turn_id" (int): The number of the analysed chatbot utterance
+- "annotation" (object): The annotation of the utterance with the following fields:
+  - "reasoning" (str): "The reason for the decision and classification"
+  - "score" (float): the score
+  - "decision" (str): "breakdown" or "no_breakdown"
+  - "breakdown_types" (list[str]): A list of all fitting breakdown types that occurred in the turn. Empty if no breakdown was detected.
+"""
+
+batched_breakdown_identification_system_prompt = """# Role
+You are an expert in identifying dialogue breakdowns in conversations between a chatbot and a user. You are given a dialogue and a list of chatbot utterances in it to analyse.
+
+# Breakdown Definition
+A dialogue breakdown is any response of the chatbot that makes it difficult for the user to continue the conversation (smoothly).
+
+## Breakdown Taxonomy
+When evaluating the chatbot's responses, consider the following breakdown types, which represent common disruptions:
+{breakdown_taxonomy}
+{chatbot_info_desc}
+# Task
+For each chatbot utterance to analyse, identify whether it leads to a dialogue breakdown. Judge every utterance only by the dialogue up to and including that utterance, as if the later turns had not happened yet. If a breakdown is detected, classify it according to the breakdown taxonomy above.
+Additionally, provide a score ranging from 0 to 1 for every utterance, where 0 indicates a complete breakdown and 1 indicates a seamless conversation.
+If a breakdown is detected, provide a list of all fitting breakdown types.
+
+Think step by step and provide a reason for each decision. Provide exactly one annotation per chatbot utterance to analyse, identified by its turn number.
+{output_format}"""
+
+batched_breakdown_identification_user_prompt = """# Dialogue
+{chat_history_str}
+
+# Chatbot Utterances to Analyse
+Turn numbers: {turn_numbers}
+
+# Your Analysis
+"""
+
 ghassel_breakdown_definition = "Dialogue breakdown is characterized by incoherence, irrelevance, or any disruption that significantly hampers the flow of the conversation, making it challenging for the user to continue the conversation smoothly."
 
 ghassel_output_format = """Please output your response in JSON format as a list of objects. For each bot's last utterance, provide a JSON object with the fields: 'reasoning', 'decision', and 'score'. Format each object as follows:
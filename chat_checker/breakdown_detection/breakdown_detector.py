@@ -1,32 +1,47 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
-from pathlib import Path
-from typing import List, Optional, Tuple
-from dotenv import load_dotenv
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import json
 from tqdm import tqdm
 
-from openai.types.chat import ChatCompletionMessageParam
-from litellm import (
-    get_supported_openai_params,
-    completion,
+from chat_checker.breakdown_detection.annotation_store import (
+    get_breakdown_annotation_store,
+    get_context_fingerprint,
 )
-from litellm.types.utils import ModelResponse, Choices
-
-from chat_checker.breakdown_detection.breakdown_taxonomy import (
-    get_flattened_taxonomy,
+from chat_checker.breakdown_detection.breakdown_taxonomy import get_taxonomy_index
+from chat_checker.breakdown_detection.heuristic_prefilter import (
+    CHATBOT_ERROR_CONTENT,
+    find_heuristic_breakdown,
+    get_supported_scripts,
+)
+from chat_checker.models.breakdowns import (
+    BreakdownAnnotation,
+    BreakdownDecision,
+    BreakdownDetectionMode,
+    BreakdownProvenance,
+    CascadeDetectionInfo,
+    CascadeTier,
+    DialogueBreakdownAnnotations,
 )
-from chat_checker.models.breakdowns import BreakdownAnnotation, BreakdownDecision
 from chat_checker.models.chatbot import ChatbotInfo
 from chat_checker.models.dialogue import DialogueTurn, SpeakerRole
-from chat_checker.utils.llm_utils import DEFAULT_LLM, supports_structured_outputs
-from chat_checker.utils.misc_utils import get_matching_api_key
+from chat_checker.utils.llm_gateway import completion
+from chat_checker.utils.llm_utils import (
+    get_default_llm,
+    compute_total_usage,
+    estimate_cost,
+    get_model_capabilities,
+)
 from chat_checker.utils.prompt_utils import (
+    UNQUOTED_TURN_FORMAT,
+    ChatHistoryRenderer,
     generate_chat_history_str,
     generate_ghassel_chat_history_str,
 )
 from chat_checker.breakdown_detection.breakdown_detection_prompts import (
-    taxonomy_item_str,
     chatbot_info_description_str,
     output_format_str,
     breakdown_identification_system_prompt,
@@ -34,16 +49,46 @@ from chat_checker.breakdown_detection.breakdown_detection_prompts import (
     ghassel_breakdown_definition,
     ghassel_output_format,
     ghassel_breakdown_detection_prompt,
+    batched_output_format_str,
+    batched_breakdown_identification_system_prompt,
+    batched_breakdown_identification_user_prompt,
 )
 
-# Build the path to the .env file
-BASE_DIR = Path(__file__).parent
-env_path = BASE_DIR.parent / ".env"
-# Load the environment variables from the .env file
-load_dotenv(env_path, override=True)
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+    from openai.types.chat import ChatCompletionMessageParam
+
+DEFAULT_CHEAP_DETECTOR_LLM = "gpt-4o-mini-2024-07-18"
+# Hidden parameter of a response that lists the responses of all LLM calls behind it (e.g. of both tiers of a cascade)
+TIER_RESPONSES_PARAM = "tier_responses"
 
 
 class BreakdownIdentifier(ABC):
+    def create_history_renderer(self) -> ChatHistoryRenderer:
+        """Create the renderer for the chat history in the prompt. The renderer lets a dialogue be rendered once for the analysis of all of its turns."""
+        return ChatHistoryRenderer(user_tag="User", chatbot_tag="Chatbot")
+
+    def get_prompt_templates(self) -> List[str]:
+        """The prompt templates (and prompt options) of the identifier. A change of them changes the prompt version."""
+        return []
+
+    def get_prompt_version(self, is_task_oriented: bool = True) -> str:
+        """
+        Get a short hash of the prompts of the identifier.
+        Args:
+            is_task_oriented (bool): Whether the breakdown taxonomy for task-oriented chatbots is used.
+        Returns:
+            str: The prompt version, which changes whenever the identifier, its prompt templates or the breakdown taxonomy change.
+        """
+        prompt_parts = [
+            type(self).__name__,
+            *self.get_prompt_templates(),
+            get_taxonomy_index(is_task_oriented).prompt_str,
+        ]
+        return hashlib.sha256("\n\n".join(prompt_parts).encode("utf-8")).hexdigest()[
+            :12
+        ]
+
     @abstractmethod
     def identify_breakdowns(
         self,
@@ -51,40 +96,51 @@ class BreakdownIdentifier(ABC):
         last_bot_utterance: str,
         is_task_oriented: bool = True,
         chatbot_info: Optional[ChatbotInfo] = None,
-        llm_name: str = DEFAULT_LLM,
+        llm_name: Optional[str] = None,
         seed: Optional[int] = 42,
-    ) -> Tuple[BreakdownAnnotation, List[ChatCompletionMessageParam], ModelResponse]:
+        chat_history_str: Optional[str] = None,
+    ) -> Tuple[
+        BreakdownAnnotation, List["ChatCompletionMessageParam"], "ModelResponse"
+    ]:
+        """Identify breakdowns in the last bot utterance given the preceding chat history.
+
+        If chat_history_str is provided, it is used as the pre-rendered chat history (see create_history_renderer) instead of rendering chat_history again.
+        """
         pass
 
 
 class OurBreakdownIdentifier(BreakdownIdentifier):
+    def get_prompt_templates(self) -> List[str]:
+        return [
+            breakdown_identification_system_prompt,
+            breakdown_identification_user_prompt,
+            chatbot_info_description_str,
+            output_format_str,
+        ]
+
     def identify_breakdowns(
         self,
         chat_history: list[DialogueTurn],
         last_bot_utterance: str,
         is_task_oriented: bool = True,
         chatbot_info: Optional[ChatbotInfo] = None,
-        llm_name: str = DEFAULT_LLM,
+        llm_name: Optional[str] = None,
         seed: Optional[int] = 42,
-    ) -> Tuple[BreakdownAnnotation, List[ChatCompletionMessageParam], ModelResponse]:
+        chat_history_str: Optional[str] = None,
+    ) -> Tuple[
+        BreakdownAnnotation, List["ChatCompletionMessageParam"], "ModelResponse"
+    ]:
+        llm_name = llm_name or get_default_llm()
         use_structured_outputs = True
         output_format = ""  # By default, we use the structured output mode with the BreakdownAnnotation class
-        if not supports_structured_outputs(llm_name):
+        model_capabilities = get_model_capabilities(llm_name)
+        if not model_capabilities.supports_structured_outputs:
             # Make sure the model at least supports json mode
-            assert "response_format" in (get_supported_openai_params(llm_name) or [])
+            assert model_capabilities.supports_json_mode
             use_structured_outputs = False
             output_format = output_format_str
 
-        breakdowns_with_descriptions = get_flattened_taxonomy(is_task_oriented)
-        breakdown_taxonomy_str = "\n".join(
-            [
-                taxonomy_item_str.format(
-                    breakdown_name=breakdown.title,
-                    breakdown_description=breakdown.description,
-                )
-                for breakdown in breakdowns_with_descriptions.values()
-            ]
-        )
+        breakdown_taxonomy_str = get_taxonomy_index(is_task_oriented).prompt_str
 
         chatbot_info_desc = ""
         if chatbot_info:
@@ -98,23 +154,26 @@ class OurBreakdownIdentifier(BreakdownIdentifier):
             output_format=output_format,
         )
 
-        dialogue_str = generate_chat_history_str(chat_history, "User", "Chatbot")
+        if chat_history_str is None:
+            chat_history_str = generate_chat_history_str(
+                chat_history, "User", "Chatbot"
+            )
 
         latest_bot_utterance_str = (
             f'{len(chat_history) + 1}. Chatbot: "{last_bot_utterance}"'
         )
 
         user_prompt = breakdown_identification_user_prompt.format(
-            chat_history_str=dialogue_str,
+            chat_history_str=chat_history_str,
             last_bot_utterance=latest_bot_utterance_str,
         )
 
-        messages: List[ChatCompletionMessageParam] = [
+        messages: List["ChatCompletionMessageParam"] = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
 
-        identification_response: ModelResponse = completion(
+        identification_response: "ModelResponse" = completion(
             model=llm_name,
             temperature=0,
             seed=seed,
@@ -122,9 +181,10 @@ class OurBreakdownIdentifier(BreakdownIdentifier):
             response_format=BreakdownAnnotation
             if use_structured_outputs
             else {"type": "json_object"},
-            api_key=get_matching_api_key(llm_name).get_secret_value(),
-            drop_params=True,  # drop all params that are not supported by the model (e.g., temperature 0 is not supported by o-series models)
+            use_cache=True,
         )
+        from litellm.types.utils import Choices, ModelResponse
+
         # for type-checking
         assert isinstance(identification_response, ModelResponse)
         assert isinstance(identification_response.choices[0], Choices)
@@ -139,38 +199,164 @@ class OurBreakdownIdentifier(BreakdownIdentifier):
         return breakdown_annotation, messages, identification_response
 
 
+class BatchedBreakdownIdentifier(OurBreakdownIdentifier):
+    """
+    Annotates all system turns of a dialogue in a single LLM call, so the dialogue history is sent once instead of once per turn.
+    Single turns (e.g. turns missing in a batched response) are analyzed with the per-turn prompts of OurBreakdownIdentifier.
+    """
+
+    def __init__(self, max_turns_per_call: Optional[int] = None):
+        """
+        Args:
+            max_turns_per_call (Optional[int]): The maximum number of turns annotated in one call, limits the response length for long dialogues. All turns of a dialogue are annotated in one call if None.
+        """
+        self.max_turns_per_call = max_turns_per_call
+        super().__init__()
+
+    def get_prompt_templates(self) -> List[str]:
+        return [
+            *super().get_prompt_templates(),
+            batched_breakdown_identification_system_prompt,
+            batched_breakdown_identification_user_prompt,
+            batched_output_format_str,
+        ]
+
+    def get_turn_prompt_version(self, is_task_oriented: bool = True) -> str:
+        """The prompt version of the turns analyzed separately, which use the per-turn prompts of OurBreakdownIdentifier."""
+        return OurBreakdownIdentifier().get_prompt_version(is_task_oriented)
+
+    def identify_dialogue_breakdowns(
+        self,
+        chat_history: list[DialogueTurn],
+        turn_indices: list[int],
+        is_task_oriented: bool = True,
+        chatbot_info: Optional[ChatbotInfo] = None,
+        llm_name: Optional[str] = None,
+        seed: Optional[int] = 42,
+        chat_history_str: Optional[str] = None,
+    ) -> Tuple[
+        Dict[int, BreakdownAnnotation],
+        List["ChatCompletionMessageParam"],
+        "ModelResponse",
+    ]:
+        """Identify breakdowns in several system turns of the chat history with a single call.
+
+        The chat history has to include all turns to analyze, the LLM sees all of it. If chat_history_str is provided, it is used as the pre-rendered chat history (see create_history_renderer).
+        Returns the annotations keyed by the turn_id of the analyzed turns. Turns missing in the response of the LLM are left out.
+        """
+        llm_name = llm_name or get_default_llm()
+        use_structured_outputs = True
+        output_format = ""  # By default, we use the structured output mode with the DialogueBreakdownAnnotations class
+        model_capabilities = get_model_capabilities(llm_name)
+        if not model_capabilities.supports_structured_outputs:
+            # Make sure the model at least supports json mode
+            assert model_capabilities.supports_json_mode
+            use_structured_outputs = False
+            output_format = batched_output_format_str
+
+        breakdown_taxonomy_str = get_taxonomy_index(is_task_oriented).prompt_str
+
+        chatbot_info_desc = ""
+        if chatbot_info:
+            chatbot_info_desc = chatbot_info_description_str.format(
+                chatbot_info=chatbot_info
+            )
+
+        system_prompt = batched_breakdown_identification_system_prompt.format(
+            breakdown_taxonomy=breakdown_taxonomy_str,
+            chatbot_info_desc=chatbot_info_desc,
+            output_format=output_format,
+        )
+
+        if chat_history_str is None:
+            chat_history_str = generate_chat_history_str(
+                chat_history, "User", "Chatbot"
+            )
+
+        # The turns are numbered by their position in the rendered history
+        turn_numbers = {i + 1: i for i in turn_indices}
+        user_prompt = batched_breakdown_identification_user_prompt.format(
+            chat_history_str=chat_history_str,
+            turn_numbers=", ".join(str(number) for number in turn_numbers),
+        )
+
+        messages: List["ChatCompletionMessageParam"] = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+        identification_response: "ModelResponse" = completion(
+            model=llm_name,
+            temperature=0,
+            seed=seed,
+            messages=messages,
+            response_format=DialogueBreakdownAnnotations
+            if use_structured_outputs
+            else {"type": "json_object"},
+            use_cache=True,
+        )
+        from litellm.types.utils import Choices, ModelResponse
+
+        # for type-checking
+        assert isinstance(identification_response, ModelResponse)
+        assert isinstance(identification_response.choices[0], Choices)
+        if not identification_response.choices[0].message.content:
+            raise ValueError("Missing breakdown classification")
+
+        dialogue_annotations = DialogueBreakdownAnnotations(
+            **json.loads(identification_response.choices[0].message.content)
+        )
+        annotations: Dict[int, BreakdownAnnotation] = {}
+        for turn_annotation in dialogue_annotations.annotations:
+            # Ignore annotations of turns that were not asked for and duplicates
+            if turn_annotation.turn_id not in turn_numbers:
+                continue
+            turn_id = chat_history[turn_numbers[turn_annotation.turn_id]].turn_id
+            annotations.setdefault(turn_id, turn_annotation.annotation)
+
+        return annotations, messages, identification_response
+
+
 class GhasselBreakdownIdentifier(BreakdownIdentifier):
     def __init__(self, use_breakdown_taxonomy=False):
         self.use_breakdown_taxonomy = use_breakdown_taxonomy
         super().__init__()
 
+    def create_history_renderer(self) -> ChatHistoryRenderer:
+        return ChatHistoryRenderer(
+            user_tag="User", chatbot_tag="Bot", turn_format=UNQUOTED_TURN_FORMAT
+        )
+
+    def get_prompt_templates(self) -> List[str]:
+        return [
+            ghassel_breakdown_definition,
+            ghassel_output_format,
+            ghassel_breakdown_detection_prompt,
+            f"use_breakdown_taxonomy={self.use_breakdown_taxonomy}",
+        ]
+
     def identify_breakdowns(
         self,
         chat_history: list[DialogueTurn],
         last_bot_utterance: str,
         is_task_oriented: bool = True,
         chatbot_info: Optional[ChatbotInfo] = None,
-        llm_name: str = DEFAULT_LLM,
+        llm_name: Optional[str] = None,
         seed: Optional[int] = 42,
-    ) -> Tuple[BreakdownAnnotation, List[ChatCompletionMessageParam], ModelResponse]:
+        chat_history_str: Optional[str] = None,
+    ) -> Tuple[
+        BreakdownAnnotation, List["ChatCompletionMessageParam"], "ModelResponse"
+    ]:
+        llm_name = llm_name or get_default_llm()
         # Make sure the model supports json mode
-        assert "response_format" in (get_supported_openai_params(llm_name) or [])
+        assert get_model_capabilities(llm_name).supports_json_mode
         # Adapted from paper "Are Large Language Models General-Purpose Solvers for Dialogue Breakdown Detection? An Empirical Investigation" (https://ieeexplore.ieee.org/document/10667232)
         breakdown_definition = ""
         if self.use_breakdown_taxonomy:
             # Using my own breakdown taxonomy
             breakdown_taxonomy_header = "## Breakdown Taxonomy"
             breakdown_taxonomy_str = "When evaluating the chatbot's response, consider the following breakdown types, which represent common disruptions:\n"
-            breakdowns_with_descriptions = get_flattened_taxonomy(is_task_oriented)
-            breakdown_taxonomy_str += "\n".join(
-                [
-                    taxonomy_item_str.format(
-                        breakdown_name=breakdown.title,
-                        breakdown_description=breakdown.description,
-                    )
-                    for breakdown in breakdowns_with_descriptions.values()
-                ]
-            )
+            breakdown_taxonomy_str += get_taxonomy_index(is_task_oriented).prompt_str
             breakdown_definition = ghassel_breakdown_definition + "\n\n"
             breakdown_definition += (
                 f"{breakdown_taxonomy_header}\n{breakdown_taxonomy_str}"
@@ -179,7 +365,8 @@ class GhasselBreakdownIdentifier(BreakdownIdentifier):
             # From paper
             breakdown_definition = ghassel_breakdown_definition
 
-        chat_history_str = generate_ghassel_chat_history_str(chat_history)
+        if chat_history_str is None:
+            chat_history_str = generate_ghassel_chat_history_str(chat_history)
 
         latest_bot_utterance_str = f"{len(chat_history) + 1}. Bot: {last_bot_utterance}"
 
@@ -194,7 +381,7 @@ class GhasselBreakdownIdentifier(BreakdownIdentifier):
         message_role = (
             "system" if not llm_name.startswith("gemini/") else "user"
         )  # Gemini requires a user role message to be present (https://github.com/BerriAI/litellm/issues/8467)
-        messages: List[ChatCompletionMessageParam] = [
+        messages: List["ChatCompletionMessageParam"] = [
             {"role": message_role, "content": prompt},
         ]
 
@@ -203,15 +390,16 @@ class GhasselBreakdownIdentifier(BreakdownIdentifier):
             # 'response_format' of type 'json_object' is not supported with this model
             response_format = None
 
-        detection_response: ModelResponse = completion(
+        detection_response: "ModelResponse" = completion(
             model=llm_name,
             temperature=0,
             seed=seed,
             response_format=response_format,
             messages=messages,
-            api_key=get_matching_api_key(llm_name).get_secret_value(),
-            drop_params=True,  # drop all params that are not supported by the model (e.g., temperature 0 is not supported by o-series models)
+            use_cache=True,
         )
+        from litellm.types.utils import Choices, ModelResponse
+
         # for type-checking
         assert isinstance(detection_response, ModelResponse)
         assert isinstance(detection_response.choices[0], Choices)
@@ -233,6 +421,141 @@ class GhasselBreakdownIdentifier(BreakdownIdentifier):
         return breakdown_annotation, messages, detection_response
 
 
+class CascadeBreakdownIdentifier(BreakdownIdentifier):
+    """
+    Annotates every turn with a cheap model first. Only turns that the cheap model flags as breakdowns or whose score falls into the uncertainty band are annotated again by the strong model (the llm_name of identify_breakdowns).
+    The annotation records which tier decided the turn and the cost and latency of both tiers.
+    """
+
+    def __init__(
+        self,
+        cheap_model: str = DEFAULT_CHEAP_DETECTOR_LLM,
+        uncertainty_band: Tuple[float, float] = (0.0, 0.8),
+        base_identifier: Optional[BreakdownIdentifier] = None,
+    ):
+        """
+        Args:
+            cheap_model (str): The model that annotates every turn first.
+            uncertainty_band (Tuple[float, float]): The lowest and highest score of the cheap model (inclusive) for which a turn is escalated to the strong model.
+            base_identifier (Optional[BreakdownIdentifier]): The identifier used by both tiers. OurBreakdownIdentifier if None.
+        """
+        self.cheap_model = cheap_model
+        self.uncertainty_band = uncertainty_band
+        self.base_identifier = base_identifier or OurBreakdownIdentifier()
+        super().__init__()
+
+    def create_history_renderer(self) -> ChatHistoryRenderer:
+        return self.base_identifier.create_history_renderer()
+
+    def get_prompt_templates(self) -> List[str]:
+        return [
+            type(self.base_identifier).__name__,
+            *self.base_identifier.get_prompt_templates(),
+            f"cheap_model={self.cheap_model}",
+            f"uncertainty_band={self.uncertainty_band}",
+        ]
+
+    def needs_escalation(self, annotation: BreakdownAnnotation) -> bool:
+        lowest_score, highest_score = self.uncertainty_band
+        return (
+            annotation.decision == BreakdownDecision.BREAKDOWN
+            or lowest_score <= annotation.score <= highest_score
+        )
+
+    def identify_breakdowns(
+        self,
+        chat_history: list[DialogueTurn],
+        last_bot_utterance: str,
+        is_task_oriented: bool = True,
+        chatbot_info: Optional[ChatbotInfo] = None,
+        llm_name: Optional[str] = None,
+        seed: Optional[int] = 42,
+        chat_history_str: Optional[str] = None,
+    ) -> Tuple[
+        BreakdownAnnotation, List["ChatCompletionMessageParam"], "ModelResponse"
+    ]:
+        llm_name = llm_name or get_default_llm()
+        cheap_start_time = time.perf_counter()
+        annotation, messages, cheap_response = self.base_identifier.identify_breakdowns(
+            chat_history,
+            last_bot_utterance,
+            is_task_oriented,
+            chatbot_info,
+            self.cheap_model,
+            seed=seed,
+            chat_history_str=chat_history_str,
+        )
+        cheap_latency = time.perf_counter() - cheap_start_time
+        cheap_usage = compute_total_usage([cheap_response])
+
+        if not self.needs_escalation(annotation):
+            annotation.cascade = CascadeDetectionInfo(
+                decided_by=CascadeTier.CHEAP,
+                cheap_model=self.cheap_model,
+                strong_model=llm_name,
+                cheap_cost=cheap_usage.cost,
+                cheap_latency=cheap_latency,
+                # The strong model gets the same prompt, its completion length is approximated by the one of the cheap model
+                strong_only_cost=estimate_cost(
+                    llm_name, cheap_usage.prompt_tokens, cheap_usage.completion_tokens
+                ),
+            )
+            return annotation, messages, cheap_response
+
+        strong_start_time = time.perf_counter()
+        annotation, messages, strong_response = (
+            self.base_identifier.identify_breakdowns(
+                chat_history,
+                last_bot_utterance,
+                is_task_oriented,
+                chatbot_info,
+                llm_name,
+                seed=seed,
+                chat_history_str=chat_history_str,
+            )
+        )
+        strong_latency = time.perf_counter() - strong_start_time
+        strong_usage = compute_total_usage([strong_response])
+        annotation.cascade = CascadeDetectionInfo(
+            decided_by=CascadeTier.STRONG,
+            cheap_model=self.cheap_model,
+            strong_model=llm_name,
+            cheap_cost=cheap_usage.cost,
+            cheap_latency=cheap_latency,
+            strong_cost=strong_usage.cost,
+            strong_latency=strong_latency,
+            # Priced like the turns that were not escalated, also if the strong response was cached
+            strong_only_cost=estimate_cost(
+                llm_name, strong_usage.prompt_tokens, strong_usage.completion_tokens
+            ),
+        )
+        # The usage of both calls is counted (see get_call_responses)
+        strong_response._hidden_params[TIER_RESPONSES_PARAM] = [
+            cheap_response,
+            strong_response,
+        ]
+        return annotation, messages, strong_response
+
+
+def get_call_responses(model_response: "ModelResponse") -> List["ModelResponse"]:
+    """Get the responses of all LLM calls behind the response of an identifier (several for a cascade)."""
+    return model_response._hidden_params.get(TIER_RESPONSES_PARAM, [model_response])
+
+
+def get_breakdown_identifier(
+    detection_mode: BreakdownDetectionMode = BreakdownDetectionMode.PER_TURN,
+) -> BreakdownIdentifier:
+    if detection_mode == BreakdownDetectionMode.BATCHED:
+        return BatchedBreakdownIdentifier()
+    if detection_mode == BreakdownDetectionMode.CASCADE:
+        return CascadeBreakdownIdentifier(
+            cheap_model=os.getenv(
+                "CHAT_CHECKER_BREAKDOWN_DETECTOR_CHEAP_LLM", DEFAULT_CHEAP_DETECTOR_LLM
+            )
+        )
+    return OurBreakdownIdentifier()
+
+
 def find_dialogue_breakdowns(
     chat_history: list[DialogueTurn],
     is_task_oriented: bool = True,
@@ -240,39 +563,273 @@ def find_dialogue_breakdowns(
     breakdown_identifier: BreakdownIdentifier = OurBreakdownIdentifier(),
     save_prompts=False,
     save_dir="./prompts/breakdown_detection",
-    breakdown_detector_model: str = DEFAULT_LLM,
+    breakdown_detector_model: Optional[str] = None,
     seed: Optional[int] = None,
-) -> list[ModelResponse]:
-    model_responses = []
-    for i, turn in tqdm(
-        enumerate(chat_history),
-        desc="Finding dialogue breakdowns",
-        total=len(chat_history),
-    ):
-        if turn.role == SpeakerRole.DIALOGUE_SYSTEM:
-            conversation_history = chat_history[:i]
-            last_bot_utterance = turn.content
-            if last_bot_utterance != "chatbot_error":
-                breakdown_info, prompt, model_response = (
-                    breakdown_identifier.identify_breakdowns(
-                        conversation_history,
-                        last_bot_utterance,
-                        is_task_oriented,
-                        chatbot_info,
-                        breakdown_detector_model,
-                        seed=seed,
+    max_workers: int = 1,
+    incremental: bool = False,
+    heuristic_prefilter: bool = False,
+) -> list["ModelResponse"]:
+    """
+    Annotate the system turns of the chat history with breakdown annotations (in place).
+    If an annotation store is set (see set_breakdown_annotation_store), turns whose context was already annotated with the same detector model, prompt version and chatbot info reuse the stored annotation instead of calling the LLM.
+    Args:
+        incremental (bool): If True, only analyze system turns without an annotation of the same detector model and prompt version (e.g. to continue an interrupted analysis or to re-analyze only the turns of an outdated detector).
+        heuristic_prefilter (bool): If True, system turns with obvious breakdowns (chatbot crashes, empty replies, exact repetitions of the previous reply, replies in an unsupported script) are annotated by rules without calling the LLM (see heuristic_prefilter). Off by default, as the rule-based annotations differ from the ones of the LLM.
+    Returns:
+        list[ModelResponse]: The responses of the turns analyzed by the LLM.
+    """
+    breakdown_detector_model = breakdown_detector_model or get_default_llm()
+    provenance = BreakdownProvenance(
+        detector_model=breakdown_detector_model,
+        prompt_version=breakdown_identifier.get_prompt_version(is_task_oriented),
+    )
+    # Provenance of the turns analyzed one at a time, differs from the provenance of the batched calls of a batched identifier
+    turn_provenance = provenance
+    if isinstance(breakdown_identifier, BatchedBreakdownIdentifier):
+        turn_provenance = BreakdownProvenance(
+            detector_model=breakdown_detector_model,
+            prompt_version=breakdown_identifier.get_turn_prompt_version(
+                is_task_oriented
+            ),
+        )
+    # Turns annotated by the rule-based pre-filter are not sent to the LLM
+    heuristic_turns: set[int] = set()
+    if heuristic_prefilter:
+        supported_scripts = get_supported_scripts(chatbot_info)
+        for i, turn in enumerate(chat_history):
+            if turn.role != SpeakerRole.DIALOGUE_SYSTEM:
+                continue
+            heuristic_annotation = find_heuristic_breakdown(
+                chat_history, i, supported_scripts
+            )
+            if heuristic_annotation is None:
+                continue
+            heuristic_turns.add(i)
+            # Keep the crash annotations of the simulation, they contain the error
+            if (
+                turn.content == CHATBOT_ERROR_CONTENT
+                and turn.breakdown_annotation is not None
+            ):
+                continue
+            turn.breakdown_annotation = heuristic_annotation
+        if heuristic_turns:
+            print(
+                f"Annotated {len(heuristic_turns)} turns with obvious breakdowns by rules"
+            )
+    # The identification of a turn only depends on the preceding history and the turn itself (not on earlier annotations)
+    # Hence, all system turns can be analyzed in parallel (if max_workers > 1)
+    turn_indices = [
+        i
+        for i, turn in enumerate(chat_history)
+        if turn.role == SpeakerRole.DIALOGUE_SYSTEM
+        and turn.content != CHATBOT_ERROR_CONTENT
+        and i not in heuristic_turns
+        and not (
+            incremental
+            and turn.breakdown_annotation is not None
+            and turn.breakdown_annotation.provenance in (provenance, turn_provenance)
+        )
+    ]
+    # The history is rendered once (before the workers start) and each turn is analyzed with a prefix of it
+    history_renderer = breakdown_identifier.create_history_renderer()
+    history_renderer.extend(chat_history)
+
+    annotation_store = get_breakdown_annotation_store()
+    # Turns whose annotation was taken from the annotation store
+    reused_turns: set[int] = set()
+
+    def get_context_key(i: int) -> str:
+        return get_context_fingerprint(
+            turn_provenance, chatbot_info, chat_history[: i + 1]
+        )
+
+    def get_batched_context_key(i: int, history_end: int) -> str:
+        # The LLM saw the history up to the last turn of the batch, not only up to turn i
+        return get_context_fingerprint(
+            provenance,
+            chatbot_info,
+            chat_history[:history_end],
+            annotated_turn_index=i,
+        )
+
+    def mark_reused(i: int, stored_annotation: BreakdownAnnotation) -> None:
+        reused_turns.add(i)
+        # The cascade costs were paid by the run that stored the annotation, they are left out of the cascade stats of this run
+        if stored_annotation.cascade is not None:
+            stored_annotation.cascade.reused = True
+
+    def get_stored_annotation(
+        i: int, context_key: str
+    ) -> Optional[BreakdownAnnotation]:
+        assert annotation_store is not None
+        stored_annotation = annotation_store.get(context_key)
+        if stored_annotation is not None:
+            mark_reused(i, stored_annotation)
+        return stored_annotation
+
+    def analyze_turn(
+        i: int,
+    ) -> Tuple[
+        BreakdownAnnotation,
+        Tuple[List["ChatCompletionMessageParam"], "ModelResponse"],
+    ]:
+        breakdown_info, prompt, model_response = (
+            breakdown_identifier.identify_breakdowns(
+                chat_history[:i],
+                chat_history[i].content,
+                is_task_oriented,
+                chatbot_info,
+                breakdown_detector_model,
+                seed=seed,
+                chat_history_str=history_renderer.render(i),
+            )
+        )
+        breakdown_info.provenance = turn_provenance
+        return breakdown_info, (prompt, model_response)
+
+    def identify_turn_breakdowns(
+        i: int,
+    ) -> Tuple[
+        BreakdownAnnotation,
+        Optional[List["ChatCompletionMessageParam"]],
+        Optional["ModelResponse"],
+    ]:
+        if annotation_store is None:
+            breakdown_info, (prompt, model_response) = analyze_turn(i)
+            return breakdown_info, prompt, model_response
+        # Workers analyzing the same context wait for the first one, the LLM call runs without holding any lock
+        breakdown_info, call = annotation_store.get_or_analyze(
+            get_context_key(i), lambda: analyze_turn(i)
+        )
+        if call is None:
+            mark_reused(i, breakdown_info)
+            # No prompt and response as the turn was not sent to the LLM
+            return breakdown_info, None, None
+        prompt, model_response = call
+        return breakdown_info, prompt, model_response
+
+    # Prompts and responses of the calls that annotated several turns at once, with the name of their prompt file
+    batched_calls: list[
+        Tuple[str, List["ChatCompletionMessageParam"], "ModelResponse"]
+    ] = []
+
+    def identify_batched_turn_breakdowns(
+        batched_identifier: BatchedBreakdownIdentifier,
+    ) -> list[
+        Tuple[
+            BreakdownAnnotation,
+            Optional[List["ChatCompletionMessageParam"]],
+            Optional["ModelResponse"],
+        ]
+    ]:
+        annotations: Dict[int, BreakdownAnnotation] = {}
+        chunk_size = batched_identifier.max_turns_per_call or len(turn_indices)
+        for chunk_start in tqdm(
+            range(0, len(turn_indices), max(chunk_size, 1)),
+            desc="Finding dialogue breakdowns (batched)",
+        ):
+            chunk = turn_indices[chunk_start : chunk_start + chunk_size]
+            # The history ends with the last turn of the chunk
+            history_end = chunk[-1] + 1
+            pending_indices = chunk
+            if annotation_store is not None:
+                for i in chunk:
+                    # A turn that was analyzed separately in an earlier run is stored under its per-turn key
+                    stored_annotation = get_stored_annotation(
+                        i, get_batched_context_key(i, history_end)
+                    ) or get_stored_annotation(i, get_context_key(i))
+                    if stored_annotation is not None:
+                        annotations[i] = stored_annotation
+                pending_indices = [i for i in chunk if i not in annotations]
+            if not pending_indices:
+                continue
+            chunk_annotations, prompt, model_response = (
+                batched_identifier.identify_dialogue_breakdowns(
+                    chat_history[:history_end],
+                    pending_indices,
+                    is_task_oriented,
+                    chatbot_info,
+                    breakdown_detector_model,
+                    seed=seed,
+                    chat_history_str=history_renderer.render(history_end),
+                )
+            )
+            batched_calls.append(
+                (
+                    f"turns_{pending_indices[0] + 1}-{pending_indices[-1] + 1}",
+                    prompt,
+                    model_response,
+                )
+            )
+            for i in pending_indices:
+                breakdown_info = chunk_annotations.get(chat_history[i].turn_id)
+                if breakdown_info is None:
+                    continue
+                breakdown_info.provenance = provenance
+                annotations[i] = breakdown_info
+                if annotation_store is not None:
+                    annotation_store.put(
+                        get_batched_context_key(i, history_end), breakdown_info
                     )
+        results: list[
+            Tuple[
+                BreakdownAnnotation,
+                Optional[List["ChatCompletionMessageParam"]],
+                Optional["ModelResponse"],
+            ]
+        ] = []
+        for i in turn_indices:
+            if i in annotations:
+                results.append((annotations[i], None, None))
+            else:
+                print(
+                    f"Turn {i + 1} is missing in the batched response, analyzing it separately..."
                 )
-                turn.breakdown_annotation = breakdown_info
-                model_responses.append(model_response)
+                # Analyzed and stored like in the per-turn mode (see turn_provenance)
+                results.append(identify_turn_breakdowns(i))
+        return results
 
-                prompt_str = "\n\n".join(
-                    [f"{message['role']}: {message['content']}" for message in prompt]
+    if isinstance(breakdown_identifier, BatchedBreakdownIdentifier):
+        results = identify_batched_turn_breakdowns(breakdown_identifier)
+    elif max_workers > 1 and len(turn_indices) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # executor.map returns the results in turn order
+            results = list(
+                tqdm(
+                    executor.map(identify_turn_breakdowns, turn_indices),
+                    desc="Finding dialogue breakdowns",
+                    total=len(turn_indices),
                 )
-                os.makedirs(save_dir, exist_ok=True)
-                if save_prompts:
-                    with open(
-                        f"{save_dir}/turn_{i + 1}_prompt.txt", "w", encoding="utf-8"
-                    ) as f:
-                        f.write(prompt_str)
+            )
+    else:
+        results = [
+            identify_turn_breakdowns(i)
+            for i in tqdm(turn_indices, desc="Finding dialogue breakdowns")
+        ]
+
+    # Write the annotations and prompts back in turn order to keep the outputs deterministic
+    calls: list[Tuple[str, List["ChatCompletionMessageParam"], "ModelResponse"]] = []
+    for i, (breakdown_info, prompt, model_response) in zip(turn_indices, results):
+        chat_history[i].breakdown_annotation = breakdown_info
+        if prompt is not None and model_response is not None:
+            calls.append((f"turn_{i + 1}", prompt, model_response))
+    calls.extend(batched_calls)
+
+    model_responses = []
+    for prompt_name, prompt, model_response in calls:
+        model_responses.extend(get_call_responses(model_response))
+
+        prompt_str = "\n\n".join(
+            [f"{message['role']}: {message['content']}" for message in prompt]
+        )
+        os.makedirs(save_dir, exist_ok=True)
+        if save_prompts:
+            with open(
+                f"{save_dir}/{prompt_name}_prompt.txt", "w", encoding="utf-8"
+            ) as f:
+                f.write(prompt_str)
+    if reused_turns:
+        print(
+            f"Reused {len(reused_turns)} stored breakdown annotations of identical turn contexts"
+        )
     return model_responses
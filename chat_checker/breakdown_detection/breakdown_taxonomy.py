@@ -1,5 +1,11 @@
-from typing import Any, List
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, List, Mapping
 
+from chat_checker.breakdown_detection.breakdown_detection_prompts import (
+    taxonomy_item_str,
+)
 from chat_checker.models.breakdowns import BreakdownDescription
 
 
@@ -283,16 +289,7 @@ def build_taxonomy_str(taxonomy: dict, level=0) -> str:
 
 def get_breakdown_taxonomy_str(task_oriented: bool, start_level=0) -> str:
     # Return a string representation of the breakdown taxonomy using the title of each error type
-    # Only include task-oriented breakdowns for task-oriented dialogue systems
-    # Always include conversational breakdowns
-    if not task_oriented:
-        breakdowns = breakdown_taxonomy.get("conversational")
-        if not breakdowns:
-            raise ValueError("No conversational breakdowns found in the taxonomy.")
-    else:
-        breakdowns = breakdown_taxonomy
-
-    return build_taxonomy_str(breakdowns, start_level)
+    return build_taxonomy_str(_select_breakdowns(task_oriented), start_level)
 
 
 def flatten_taxonomy(
@@ -307,30 +304,61 @@ def flatten_taxonomy(
     return flat_taxonomy
 
 
-def get_flattened_taxonomy(task_oriented: bool) -> dict[str, BreakdownDescription]:
+def _select_breakdowns(task_oriented: bool) -> dict:
+    # Only include task-oriented breakdowns for task-oriented dialogue systems
+    # Always include conversational breakdowns
     if not task_oriented:
         breakdowns: dict | None = breakdown_taxonomy.get("conversational")
         if not breakdowns:
             raise ValueError("No conversational breakdowns found in the taxonomy.")
     else:
         breakdowns = breakdown_taxonomy
+    return breakdowns
 
-    return flatten_taxonomy(breakdowns, {})
+
+def get_flattened_taxonomy(task_oriented: bool) -> dict[str, BreakdownDescription]:
+    # Copy of the precomputed flattened taxonomy (use get_taxonomy_index for read-only access without copying)
+    return dict(get_taxonomy_index(task_oriented).breakdowns)
+
+
+@dataclass(frozen=True)
+class TaxonomyIndex:
+    """Precomputed, read-only views of the breakdown taxonomy for task-oriented or conversational chatbots."""
+
+    # Flattened taxonomy (breakdown key -> breakdown description) in taxonomy order
+    breakdowns: Mapping[str, BreakdownDescription]
+    # Lower-cased breakdown title -> breakdown key
+    key_by_title: Mapping[str, str]
+    # Breakdown list with descriptions as used in the breakdown detection prompts
+    prompt_str: str
+
+
+@lru_cache(maxsize=None)
+def get_taxonomy_index(task_oriented: bool) -> TaxonomyIndex:
+    breakdowns = flatten_taxonomy(_select_breakdowns(task_oriented), {})
+    prompt_str = "\n".join(
+        [
+            taxonomy_item_str.format(
+                breakdown_name=breakdown.title,
+                breakdown_description=breakdown.description,
+            )
+            for breakdown in breakdowns.values()
+        ]
+    )
+    return TaxonomyIndex(
+        breakdowns=MappingProxyType(breakdowns),
+        key_by_title=MappingProxyType(
+            {breakdown.title.lower(): key for key, breakdown in breakdowns.items()}
+        ),
+        prompt_str=prompt_str,
+    )
 
 
 def get_breakdown_title_list(task_oriented: bool) -> List[str]:
     # Return a list of the titles of all error types in the breakdown taxonomy
-    # Only include task-oriented breakdowns for task-oriented dialogue systems
-    # Always include conversational breakdowns
-    if not task_oriented:
-        breakdowns: dict | None = breakdown_taxonomy.get("conversational")
-        if not breakdowns:
-            raise ValueError("No conversational breakdowns found in the taxonomy.")
-    else:
-        breakdowns = breakdown_taxonomy
-
-    flat_taxonomy = flatten_taxonomy(breakdowns, {})
-    return [value.title for value in flat_taxonomy.values()]
+    return [
+        value.title for value in get_taxonomy_index(task_oriented).breakdowns.values()
+    ]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,316 @@
+"""
+Comparison of the accuracy and throughput of the breakdown detection modes on the dialogues of a run.
+
+Every mode annotates fresh copies of the dialogues, the stored annotations are not modified.
+All turns are sent to the LLM: the rule-based pre-filter, the annotation store and the response cache are disabled, so that every mode is measured on the same turns with real calls.
+The accuracy is measured as the agreement with a reference: the first mode (default: per_turn) or the annotations stored in the dialogues (--reference existing, e.g. human labels).
+Usage: python -m chat_checker.breakdown_detection.detection_mode_benchmark <chatbot> <run_id> [--modes per_turn batched] [--max-dialogues N] [--workers N] [--output results.yaml]
+"""
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from chat_checker.breakdown_detection.annotation_store import (
+    set_breakdown_annotation_store,
+)
+from chat_checker.breakdown_detection.breakdown_detector import (
+    find_dialogue_breakdowns,
+    get_breakdown_identifier,
+)
+from chat_checker.data_management.chatbot_registry import get_chatbot, load_chatbot
+from chat_checker.data_management.storage_manager import load_dialogues
+from chat_checker.models.breakdowns import (
+    BreakdownAnnotation,
+    BreakdownDecision,
+    BreakdownDetectionMode,
+)
+from chat_checker.models.chatbot import Chatbot, ChatbotType
+from chat_checker.models.dialogue import Dialogue, DialogueTurn, SpeakerRole
+from chat_checker.utils import yaml_utils
+from chat_checker.utils.llm_gateway import set_llm_response_cache
+from chat_checker.utils.llm_utils import get_default_llm, compute_total_usage
+from chat_checker.utils.misc_utils import load_env_file, map_in_order
+
+EXISTING_REFERENCE = "existing"
+
+
+def _load_chatbot(chatbot: str) -> Chatbot:
+    # Accept the directory of an unregistered chatbot as well
+    if Path(chatbot).is_dir():
+        return load_chatbot(Path(chatbot))
+    return get_chatbot(chatbot)
+
+
+def annotate_dialogues(
+    dialogues: List[Dialogue],
+    chatbot: Chatbot,
+    detection_mode: BreakdownDetectionMode,
+    breakdown_detector_model: Optional[str] = None,
+    seed: Optional[int] = None,
+    workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Annotate copies of the dialogues with the given detection mode. Obvious breakdowns are not annotated by rules, every turn is analyzed by the mode.
+    Args:
+        dialogues (List[Dialogue]): The dialogues to annotate.
+        chatbot (Chatbot): The chatbot of the dialogues.
+        detection_mode (BreakdownDetectionMode): The detection mode to use.
+        breakdown_detector_model (Optional[str]): The LLM of the breakdown detector. The default LLM (see get_default_llm) if None.
+        seed (Optional[int]): The seed of the LLM requests.
+        workers (int): The number of dialogues annotated concurrently.
+    Returns:
+        Dict[str, Any]: The annotated chat histories (key "chat_histories") and the throughput statistics.
+    """
+    breakdown_detector_model = breakdown_detector_model or get_default_llm()
+    is_task_oriented = chatbot.info.type == ChatbotType.TASK_ORIENTED
+    breakdown_identifier = get_breakdown_identifier(detection_mode)
+
+    def annotate(dialogue: Dialogue) -> tuple[List[DialogueTurn], list]:
+        chat_history = [
+            turn.model_copy(update={"breakdown_annotation": None})
+            for turn in dialogue.chat_history
+        ]
+        model_responses = find_dialogue_breakdowns(
+            chat_history,
+            is_task_oriented,
+            chatbot.info,
+            breakdown_identifier=breakdown_identifier,
+            breakdown_detector_model=breakdown_detector_model,
+            seed=seed,
+            heuristic_prefilter=False,
+        )
+        return chat_history, model_responses
+
+    start_time = time.perf_counter()
+    chat_histories: List[List[DialogueTurn]] = []
+    all_model_responses: list = []
+    for chat_history, model_responses in map_in_order(
+        annotate, dialogues, workers=workers
+    ):
+        chat_histories.append(chat_history)
+        all_model_responses.extend(model_responses)
+    seconds = time.perf_counter() - start_time
+
+    usage = compute_total_usage(all_model_responses)
+    num_turns = sum(
+        1
+        for chat_history in chat_histories
+        for turn in chat_history
+        if turn.breakdown_annotation is not None
+    )
+    return {
+        "chat_histories": chat_histories,
+        "num_turns": num_turns,
+        "llm_calls": len(all_model_responses),
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cost": usage.cost,
+        "seconds": seconds,
+        "turns_per_second": num_turns / seconds if seconds > 0 else 0.0,
+    }
+
+
+def compare_annotations(
+    annotations: List[Optional[BreakdownAnnotation]],
+    reference_annotations: List[Optional[BreakdownAnnotation]],
+) -> Dict[str, Any]:
+    """
+    Compare the annotations of a mode with the reference annotations of the same turns. Turns without an annotation on either side are skipped.
+    Args:
+        annotations (List[Optional[BreakdownAnnotation]]): The annotations of the mode.
+        reference_annotations (List[Optional[BreakdownAnnotation]]): The reference annotations.
+    Returns:
+        Dict[str, Any]: The decision agreement, the precision, recall and F1 score of the breakdown decisions, the mean absolute score difference and the mean Jaccard similarity of the breakdown types.
+    """
+    pairs = [
+        (annotation, reference)
+        for annotation, reference in zip(annotations, reference_annotations)
+        if annotation is not None and reference is not None
+    ]
+    if not pairs:
+        return {"compared_turns": 0}
+    true_positives = sum(
+        1
+        for annotation, reference in pairs
+        if annotation.decision == BreakdownDecision.BREAKDOWN
+        and reference.decision == BreakdownDecision.BREAKDOWN
+    )
+    predicted_positives = sum(
+        1
+        for annotation, _ in pairs
+        if annotation.decision == BreakdownDecision.BREAKDOWN
+    )
+    reference_positives = sum(
+        1 for _, reference in pairs if reference.decision == BreakdownDecision.BREAKDOWN
+    )
+    precision = true_positives / predicted_positives if predicted_positives else 1.0
+    recall = true_positives / reference_positives if reference_positives else 1.0
+    f1 = (
+        2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    )
+    type_similarities = []
+    for annotation, reference in pairs:
+        types = set(annotation.breakdown_types)
+        reference_types = set(reference.breakdown_types)
+        if types or reference_types:
+            type_similarities.append(
+                len(types & reference_types) / len(types | reference_types)
+            )
+    return {
+        "compared_turns": len(pairs),
+        "decision_agreement": sum(
+            1
+            for annotation, reference in pairs
+            if annotation.decision == reference.decision
+        )
+        / len(pairs),
+        "breakdown_precision": precision,
+        "breakdown_recall": recall,
+        "breakdown_f1": f1,
+        "score_mae": sum(
+            abs(annotation.score - reference.score) for annotation, reference in pairs
+        )
+        / len(pairs),
+        "breakdown_type_jaccard": sum(type_similarities) / len(type_similarities)
+        if type_similarities
+        else 1.0,
+    }
+
+
+def _get_system_turn_annotations(
+    chat_histories: List[List[DialogueTurn]],
+) -> List[Optional[BreakdownAnnotation]]:
+    return [
+        turn.breakdown_annotation
+        for chat_history in chat_histories
+        for turn in chat_history
+        if turn.role == SpeakerRole.DIALOGUE_SYSTEM
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "chatbot", help="ID of a registered chatbot or path of a chatbot directory"
+    )
+    parser.add_argument("run_id", help="ID of the run with the dialogues to annotate")
+    parser.add_argument("--subfolder", default=None, help="Subfolder of the run")
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        type=BreakdownDetectionMode,
+        default=[BreakdownDetectionMode.PER_TURN, BreakdownDetectionMode.BATCHED],
+        help="Detection modes to compare (default: per_turn batched)",
+    )
+    parser.add_argument(
+        "--reference",
+        default=None,
+        help=f"Mode whose annotations are the reference, or '{EXISTING_REFERENCE}' for the annotations stored in the dialogues (default: the first mode)",
+    )
+    parser.add_argument(
+        "--max-dialogues",
+        type=int,
+        default=None,
+        help="Only annotate the first N dialogues of the run",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of dialogues annotated concurrently",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed of the LLM requests"
+    )
+    parser.add_argument(
+        "--output", type=Path, default=None, help="Save the results to this yaml file"
+    )
+    args = parser.parse_args(argv)
+    reference = args.reference or args.modes[0]
+    # Checked before any LLM call is paid for
+    if reference != EXISTING_REFERENCE and reference not in args.modes:
+        print(
+            f"The reference {reference} is neither a compared mode nor '{EXISTING_REFERENCE}'"
+        )
+        return 1
+    load_env_file()
+    # Stored annotations and cached responses would make the modes look faster and cheaper than they are
+    set_breakdown_annotation_store(None)
+    set_llm_response_cache(None)
+
+    chatbot = _load_chatbot(args.chatbot)
+    _, dialogues = load_dialogues(chatbot.base_directory, args.run_id, args.subfolder)
+    dialogues = dialogues[: args.max_dialogues]
+    if not dialogues:
+        print(f"No dialogues found in run {args.run_id}")
+        return 1
+    breakdown_detector_model = os.getenv(
+        "CHAT_CHECKER_BREAKDOWN_DETECTOR_LLM", get_default_llm()
+    )
+    print(
+        f"Comparing the detection modes {', '.join(args.modes)} on {len(dialogues)} dialogues (reference: {reference}, detector: {breakdown_detector_model})"
+    )
+
+    annotations_per_mode: Dict[str, List[Optional[BreakdownAnnotation]]] = {}
+    if reference == EXISTING_REFERENCE:
+        annotations_per_mode[EXISTING_REFERENCE] = _get_system_turn_annotations(
+            [dialogue.chat_history for dialogue in dialogues]
+        )
+    results: Dict[str, Dict[str, Any]] = {}
+    for mode in args.modes:
+        print(f"Annotating with the {mode} mode...")
+        mode_results = annotate_dialogues(
+            dialogues,
+            chatbot,
+            mode,
+            breakdown_detector_model=breakdown_detector_model,
+            seed=args.seed,
+            workers=args.workers,
+        )
+        annotations_per_mode[mode] = _get_system_turn_annotations(
+            mode_results.pop("chat_histories")
+        )
+        results[mode] = mode_results
+    for mode in args.modes:
+        results[mode]["accuracy"] = compare_annotations(
+            annotations_per_mode[mode], annotations_per_mode[reference]
+        )
+
+    for mode, mode_results in results.items():
+        accuracy = mode_results["accuracy"]
+        print(
+            f"{mode}: {mode_results['num_turns']} turns, {mode_results['llm_calls']} LLM calls, "
+            f"{mode_results['prompt_tokens']} prompt tokens, {mode_results['completion_tokens']} completion tokens, "
+            f"cost {mode_results['cost']:.4f}, {mode_results['seconds']:.2f}s ({mode_results['turns_per_second']:.2f} turns/s)"
+        )
+        if accuracy["compared_turns"] > 0:
+            print(
+                f"  vs {reference} on {accuracy['compared_turns']} turns: decision agreement {accuracy['decision_agreement']:.3f}, "
+                f"breakdown F1 {accuracy['breakdown_f1']:.3f} (precision {accuracy['breakdown_precision']:.3f}, recall {accuracy['breakdown_recall']:.3f}), "
+                f"score MAE {accuracy['score_mae']:.3f}, type Jaccard {accuracy['breakdown_type_jaccard']:.3f}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            yaml_utils.safe_dump(
+                {
+                    "chatbot": chatbot.id,
+                    "run_id": args.run_id,
+                    "num_dialogues": len(dialogues),
+                    "detector_model": breakdown_detector_model,
+                    "reference": str(reference),
+                    "modes": {str(mode): results[mode] for mode in results},
+                },
+                f,
+                sort_keys=False,
+            )
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+from collections import Counter
+from typing import Optional
+import unicodedata
+
+from chat_checker.models.breakdowns import (
+    BreakdownAnnotation,
+    BreakdownDecision,
+    BreakdownProvenance,
+)
+from chat_checker.models.chatbot import ChatbotInfo
+from chat_checker.models.dialogue import DialogueTurn, SpeakerRole
+
+# Bump when a rule changes, so that incremental runs can tell the annotations of the old rules apart
+HEURISTIC_RULES_VERSION = "1"
+HEURISTIC_PROVENANCE = BreakdownProvenance(
+    detector_model="heuristic_prefilter", prompt_version=HEURISTIC_RULES_VERSION
+)
+CHATBOT_ERROR_CONTENT = "chatbot_error"
+
+# Languages (by name and ISO 639-1 code) per Unicode script
+# Languages written in the same script (e.g. English and German) can not be told apart, the language rule only catches replies in a different script
+LANGUAGES_BY_SCRIPT: dict[str, list[str]] = {
+    "LATIN": "english en german de french fr spanish es italian it portuguese pt dutch nl polish pl turkish tr swedish sv danish da norwegian no finnish fi czech cs romanian ro hungarian hu vietnamese vi indonesian id".split(),
+    "CYRILLIC": "russian ru ukrainian uk bulgarian bg".split(),
+    "GREEK": "greek el".split(),
+    "ARABIC": "arabic ar persian fa".split(),
+    "HEBREW": "hebrew he".split(),
+    "DEVANAGARI": "hindi hi".split(),
+    "THAI": "thai th".split(),
+    "HANGUL": "korean ko".split(),
+    "CJK": "chinese zh japanese ja".split(),
+    "HIRAGANA": "japanese ja".split(),
+    "KATAKANA": "japanese ja".split(),
+}
+# Minimum number of letters and share of the dominant script for the language rule, so that names or single foreign words do not trigger it
+MIN_LETTERS_FOR_SCRIPT = 10
+MIN_DOMINANT_SCRIPT_SHARE = 0.8
+
+
+def detect_script(text: str) -> Optional[str]:
+    """
+    Detect the dominant Unicode script of the letters of a text.
+    Args:
+        text (str): The text.
+    Returns:
+        Optional[str]: The dominant script (e.g. "LATIN" or "CYRILLIC"), None if the text is too short or mixes scripts.
+    """
+    script_counts: Counter[str] = Counter()
+    for character in text:
+        if not character.isalpha():
+            continue
+        # The first word of the character name is the script (e.g. "LATIN SMALL LETTER A", "CJK UNIFIED IDEOGRAPH-4E00")
+        script_counts[unicodedata.name(character, "UNKNOWN").split(" ")[0]] += 1
+    num_letters = sum(script_counts.values())
+    if num_letters < MIN_LETTERS_FOR_SCRIPT:
+        return None
+    script, count = script_counts.most_common(1)[0]
+    if count / num_letters < MIN_DOMINANT_SCRIPT_SHARE:
+        return None
+    return script
+
+
+def get_supported_scripts(chatbot_info: Optional[ChatbotInfo]) -> Optional[set[str]]:
+    """Get the scripts of the languages of the chatbot. None if any language is unknown, then the language rule is not applied."""
+    if not chatbot_info or not chatbot_info.available_languages:
+        return None
+    supported_scripts: set[str] = set()
+    for language in chatbot_info.available_languages:
+        scripts = {
+            script
+            for script, languages in LANGUAGES_BY_SCRIPT.items()
+            if language.strip().lower() in languages
+        }
+        if not scripts:
+            return None
+        supported_scripts |= scripts
+    return supported_scripts
+
+
+def _create_heuristic_annotation(
+    reasoning: str, score: float, breakdown_type: str
+) -> BreakdownAnnotation:
+    return BreakdownAnnotation(
+        reasoning=f"Rule-based pre-filter: {reasoning}",
+        score=score,
+        decision=BreakdownDecision.BREAKDOWN,
+        breakdown_types=[breakdown_type],
+        provenance=HEURISTIC_PROVENANCE.model_copy(),
+    )
+
+
+def find_heuristic_breakdown(
+    chat_history: list[DialogueTurn],
+    i: int,
+    supported_scripts: Optional[set[str]] = None,
+) -> Optional[BreakdownAnnotation]:
+    """
+    Check the system turn i of the chat history for breakdowns that are obvious without an LLM.
+    Args:
+        chat_history (list[DialogueTurn]): The chat history.
+        i (int): The index of the system turn to check.
+        supported_scripts (Optional[set[str]]): The scripts of the languages of the chatbot (see get_supported_scripts). The language rule is skipped if None.
+    Returns:
+        Optional[BreakdownAnnotation]: The annotation of the breakdown, None if no rule applies.
+    """
+    content = chat_history[i].content
+    if content == CHATBOT_ERROR_CONTENT:
+        return _create_heuristic_annotation(
+            "The chatbot crashed and did not reply.", 0.0, "Chatbot Crash"
+        )
+    if not content.strip():
+        return _create_heuristic_annotation(
+            "The chatbot reply is empty.", 0.0, "Uninterpretable"
+        )
+    previous_system_turn = next(
+        (
+            turn
+            for turn in reversed(chat_history[:i])
+            if turn.role == SpeakerRole.DIALOGUE_SYSTEM
+        ),
+        None,
+    )
+    if (
+        previous_system_turn is not None
+        and previous_system_turn.content.strip() == content.strip()
+    ):
+        return _create_heuristic_annotation(
+            "The chatbot repeats its previous reply word for word.", 0.2, "Repetition"
+        )
+    if supported_scripts is not None:
+        script = detect_script(content)
+        if script is not None and script not in supported_scripts:
+            return _create_heuristic_annotation(
+                f"The chatbot replies in {script.lower()} script, which is not used by any of its available languages.",
+                0.1,
+                "Uninterpretable",
+            )
+    return None
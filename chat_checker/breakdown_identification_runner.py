@@ -1,34 +1,44 @@
 import os
 from pathlib import Path
-from typing import List, Tuple, Dict, Any, Optional
-import yaml
+from typing import Iterable, List, Sized, Tuple, Dict, Any, Optional
 from datetime import datetime
 
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-
-from chat_checker.breakdown_detection.breakdown_detector import find_dialogue_breakdowns
-from chat_checker.breakdown_detection.breakdown_taxonomy import get_flattened_taxonomy
-from chat_checker.data_management.storage_manager import load_dialogues
-from chat_checker.models.breakdowns import BreakdownDecision
+from chat_checker.breakdown_detection.breakdown_detector import (
+    find_dialogue_breakdowns,
+    get_breakdown_identifier,
+)
+from chat_checker.breakdown_detection.breakdown_taxonomy import get_taxonomy_index
+from chat_checker.data_management.storage_manager import (
+    compact_dialogues_logs,
+    get_dialogues_dir,
+    iter_dialogues,
+    load_dialogues,
+    save_dialogue,
+)
+from chat_checker.models.breakdowns import (
+    BreakdownDecision,
+    BreakdownDetectionMode,
+    CascadeTier,
+)
 from chat_checker.models.chatbot import Chatbot, ChatbotType
 from chat_checker.models.dialogue import Dialogue, DialogueTurn, SpeakerRole
 from chat_checker.models.llm import UsageCost
-from chat_checker.utils.llm_utils import compute_total_usage, DEFAULT_LLM
+from chat_checker.utils.llm_utils import (
+    compute_total_usage,
+    merge_usage,
+    get_default_llm,
+)
 from chat_checker.utils.misc_utils import (
     compute_analysis_cost_statistics,
     five_num_summary,
+    load_env_file,
+    map_in_order,
 )
+from chat_checker.utils import yaml_utils
 
 # Build the path to the .env file
 BASE_DIR = Path(__file__).parent
 
-# set tick and label font size
-plt.rcParams["axes.labelsize"] = "large"
-plt.rcParams["xtick.labelsize"] = "large"
-plt.rcParams["ytick.labelsize"] = "large"
-plt.rcParams["legend.fontsize"] = "large"
-
 
 def compute_dialogue_breakdown_stats(
     dialogue_start_time: datetime,
@@ -58,24 +68,19 @@ def compute_dialogue_breakdown_stats(
                 scores.append(turn.breakdown_annotation.score)
         avg_score = sum(scores if scores else [0.0]) / len(system_turns)
     breakdown_turn_ids = [turn.turn_id for turn in turns_with_breakdowns]
-    counts_per_type: Dict[str, int] = {}
-    for key, value in get_flattened_taxonomy(is_task_oriented).items():
-        breakdowns_for_key = []
-        for turn in system_turns:
-            target_error_type = value.title.lower()
-            predicted_error_types = (
-                [
-                    error_type.lower()
-                    for error_type in turn.breakdown_annotation.breakdown_types
-                ]
-                if turn.breakdown_annotation
-                else []
-            )
-            if target_error_type in predicted_error_types:
-                breakdowns_for_key.append(turn)
-
-        counts_for_key = len(breakdowns_for_key)
-        counts_per_type[key] = counts_for_key
+    taxonomy_index = get_taxonomy_index(is_task_oriented)
+    counts_per_type: Dict[str, int] = {key: 0 for key in taxonomy_index.breakdowns}
+    for turn in system_turns:
+        if not turn.breakdown_annotation:
+            continue
+        # Each turn counts at most once per breakdown type
+        predicted_keys = {
+            taxonomy_index.key_by_title.get(error_type.lower())
+            for error_type in turn.breakdown_annotation.breakdown_types
+        }
+        for key in predicted_keys:
+            if key is not None:
+                counts_per_type[key] += 1
     crash_turns = []
     for turn in system_turns:
         if (
@@ -107,38 +112,26 @@ def compute_dialogue_breakdown_stats(
 
 
 def plot_and_save_heatmap(
-    dialogues: list[Dialogue], dialogues_dir: Path
-) -> Dict[str, Dict[str, int]]:
-    # Compute a heatmap of the breakdown types per simulated user (dialogues of each user are aggregated)
-    heatmap: Dict[str, Dict[str, int]] = {}
-    flattened_taxonomy = get_flattened_taxonomy(True)
-    for dialogue in dialogues:
-        user_name = dialogue.user_name
-        counts_per_type_by_key = (
-            dialogue.breakdown_stats.get("counts_per_breakdown_type", {})
-            if dialogue.breakdown_stats
-            else {}
-        )
-        # replace the breakdown type keys with the breakdown titles
-        counts_per_type_by_title = {
-            (
-                flattened_taxonomy[key].title
-                if key != "chatbot_crash"
-                else "Chatbot crash"
-            ): value
-            for key, value in counts_per_type_by_key.items()
-        }
-        if user_name not in heatmap:
-            heatmap[user_name] = counts_per_type_by_key
-        else:
-            # Add the counts per breakdown type to the existing counts for the user
-            for key, value in counts_per_type_by_key.items():
-                if key in heatmap[user_name]:
-                    heatmap[user_name][key] += value
-                else:
-                    heatmap[user_name][key] = value
+    heatmap: Dict[str, Dict[str, int]], breakdown_keys: List[str], dialogues_dir: Path
+) -> None:
     # plot the heatmap with matplotlib (x-axis: dialogue IDs, y-axis: breakdown types)
     if len(heatmap) > 0:
+        # matplotlib is slow to import, so it is only imported when a heatmap is drawn
+        import matplotlib.pyplot as plt
+        from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+        # set tick and label font size
+        plt.rcParams["axes.labelsize"] = "large"
+        plt.rcParams["xtick.labelsize"] = "large"
+        plt.rcParams["ytick.labelsize"] = "large"
+        plt.rcParams["legend.fontsize"] = "large"
+
+        flattened_taxonomy = get_taxonomy_index(True).breakdowns
+        # replace the breakdown type keys with the breakdown titles
+        breakdown_titles = [
+            flattened_taxonomy[key].title if key != "chatbot_crash" else "Chatbot crash"
+            for key in breakdown_keys
+        ]
         fig, ax = plt.subplots(layout="constrained")
 
         heatmap_data = []
@@ -151,9 +144,9 @@ def plot_and_save_heatmap(
         heatmap_data = list(map(list, zip(*heatmap_data)))
         im = ax.imshow(heatmap_data)
         ax.set_xticks(range(len(heatmap.keys())))
-        ax.set_yticks(range(len(counts_per_type_by_title.keys())))
+        ax.set_yticks(range(len(breakdown_titles)))
         ax.set_xticklabels(heatmap.keys(), rotation=45, ha="right")
-        ax.set_yticklabels(reversed(counts_per_type_by_title.keys()))
+        ax.set_yticklabels(reversed(breakdown_titles))
 
         # Create a colorbar
         divider = make_axes_locatable(ax)
@@ -172,7 +165,6 @@ def plot_and_save_heatmap(
         print(
             f"Heatmap of breakdown types saved to {dialogues_dir / 'breakdown_heatmap.png'}"
         )
-    return heatmap
 
 
 def compute_breakdown_matches_per_test_user(
@@ -193,12 +185,177 @@ def compute_breakdown_matches_per_test_user(
     )
 
 
+class BreakdownStatsAccumulator:
+    """
+    Running aggregates of the breakdown statistics of a run.
+    Dialogues are added one at a time, so that the run statistics can be computed without holding all dialogues in memory.
+    """
+
+    def __init__(self, is_task_oriented: bool):
+        self.num_dialogues = 0
+        self.num_chatbot_turns = 0
+        self.total_breakdown_count = 0
+        self.sum_avg_scores = 0.0
+        self.num_avg_scores = 0
+        self.sum_ids_of_first_breakdowns = 0
+        self.num_first_breakdowns = 0
+        self.dialogues_with_breakdowns: list[str] = []
+        self.scores_of_turns_with_breakdowns: list[float] = []
+        self.scores_of_turns_with_breakdowns_excluding_chatbot_crashes: list[float] = []
+        self.counts_per_type: Dict[str, int] = {
+            key: 0 for key in get_taxonomy_index(is_task_oriented).breakdowns
+        }
+        self.counts_per_type["chatbot_crash"] = 0
+        self.breakdown_excerpts: list[dict] = []
+        # Breakdown counts per breakdown type and simulated user (dialogues of each user are aggregated)
+        self.heatmap: Dict[str, Dict[str, int]] = {}
+        self.heatmap_breakdown_keys: list[str] = []
+        # Totals of the turns annotated by a cascade breakdown identifier
+        self.cascade_models: set[Tuple[str, str]] = set()
+        self.cascade_num_turns = 0
+        self.cascade_num_reused_turns = 0
+        self.cascade_num_escalated_turns = 0
+        self.cascade_cheap_cost = 0.0
+        self.cascade_strong_cost = 0.0
+        self.cascade_strong_only_cost = 0.0
+        self.cascade_cheap_latency = 0.0
+        self.cascade_strong_latency = 0.0
+
+    def add(self, dialogue: Dialogue) -> None:
+        self.num_dialogues += 1
+        if dialogue.chat_statistics:
+            self.num_chatbot_turns += dialogue.chat_statistics["num_chatbot_turns"]
+        breakdown_stats = dialogue.breakdown_stats
+        counts_per_type_by_key = (
+            breakdown_stats.get("counts_per_breakdown_type", {})
+            if breakdown_stats
+            else {}
+        )
+        user_counts = self.heatmap.setdefault(dialogue.user_name, {})
+        for key, value in counts_per_type_by_key.items():
+            user_counts[key] = user_counts.get(key, 0) + value
+        self.heatmap_breakdown_keys = list(counts_per_type_by_key)
+        if not breakdown_stats:
+            return
+        for turn in dialogue.chat_history:
+            if not turn.breakdown_annotation or not turn.breakdown_annotation.cascade:
+                continue
+            cascade = turn.breakdown_annotation.cascade
+            self.cascade_models.add((cascade.cheap_model, cascade.strong_model))
+            if cascade.reused:
+                # No LLM call was made for the turn, its costs and latencies belong to the run that stored it
+                self.cascade_num_reused_turns += 1
+                continue
+            self.cascade_num_turns += 1
+            if cascade.decided_by == CascadeTier.STRONG:
+                self.cascade_num_escalated_turns += 1
+            self.cascade_cheap_cost += cascade.cheap_cost
+            self.cascade_strong_cost += cascade.strong_cost
+            self.cascade_strong_only_cost += cascade.strong_only_cost
+            self.cascade_cheap_latency += cascade.cheap_latency
+            self.cascade_strong_latency += cascade.strong_latency
+        self.total_breakdown_count += breakdown_stats.get("count", 0)
+        self.sum_avg_scores += breakdown_stats.get("avg_score", 0)
+        self.num_avg_scores += 1
+        if breakdown_stats.get("count", 0) == 0:
+            return
+
+        self.dialogues_with_breakdowns.append(dialogue.dialogue_id)
+        self.sum_ids_of_first_breakdowns += breakdown_stats.get(
+            "turn_ids_of_breakdowns", []
+        )[0]
+        self.num_first_breakdowns += 1
+        for key in self.counts_per_type:
+            self.counts_per_type[key] += breakdown_stats[
+                "counts_per_breakdown_type"
+            ].get(key, 0)
+        chat_history = dialogue.chat_history
+        for i, turn in enumerate(chat_history):
+            if (
+                not turn.breakdown_annotation
+                or turn.breakdown_annotation.decision != BreakdownDecision.BREAKDOWN
+            ):
+                continue
+            self.scores_of_turns_with_breakdowns.append(turn.breakdown_annotation.score)
+            if turn.breakdown_annotation.breakdown_types != ["Chatbot Crash"]:
+                self.scores_of_turns_with_breakdowns_excluding_chatbot_crashes.append(
+                    turn.breakdown_annotation.score
+                )
+            # Create a breakdown excerpt for every turn with a breakdown
+            previous_turn = chat_history[i - 1] if i > 0 else None
+            self.breakdown_excerpts.append(
+                {
+                    "dialogue_id": dialogue.dialogue_id,
+                    "previous_turn": previous_turn.model_dump()
+                    if previous_turn
+                    else None,
+                    "breakdown_turn": turn.model_dump(),
+                }
+            )
+
+
+def compute_cascade_stats(run_stats: BreakdownStatsAccumulator) -> Optional[dict]:
+    """
+    Compute the statistics of the turns annotated by a cascade breakdown identifier.
+    Args:
+        run_stats (BreakdownStatsAccumulator): The accumulated statistics of the run.
+    Returns:
+        Optional[dict]: The escalation rate and the cost and latency of both tiers compared to annotating every turn with the strong model. None if no turn was annotated by a cascade.
+    """
+    num_turns = run_stats.cascade_num_turns
+    if num_turns == 0 and run_stats.cascade_num_reused_turns == 0:
+        return None
+    num_escalated_turns = run_stats.cascade_num_escalated_turns
+    total_cost = run_stats.cascade_cheap_cost + run_stats.cascade_strong_cost
+    total_latency = run_stats.cascade_cheap_latency + run_stats.cascade_strong_latency
+    # The strong model latency of the turns that were not escalated is estimated with the average latency of the escalated turns
+    strong_only_latency = (
+        run_stats.cascade_strong_latency * num_turns / num_escalated_turns
+        if num_escalated_turns > 0
+        else None
+    )
+    strong_only_cost = run_stats.cascade_strong_only_cost
+    return {
+        "models": [
+            {"cheap_model": cheap_model, "strong_model": strong_model}
+            for cheap_model, strong_model in sorted(run_stats.cascade_models)
+        ],
+        "n_annotated_turns": num_turns,
+        # Turns whose annotation was reused from the annotation store are not included in the other stats
+        "n_reused_turns": run_stats.cascade_num_reused_turns,
+        "n_turns_decided_by_cheap_model": num_turns - num_escalated_turns,
+        "n_escalated_turns": num_escalated_turns,
+        "escalation_rate": num_escalated_turns / num_turns if num_turns > 0 else None,
+        "cost": {
+            "cheap_tier": run_stats.cascade_cheap_cost,
+            "strong_tier": run_stats.cascade_strong_cost,
+            "total": total_cost,
+            "strong_model_only_estimate": strong_only_cost,
+            "strong_model_only_estimate_method": "List price of the strong model for the token counts of the strong calls of escalated turns and of the cheap calls of the other turns (approximates the completion length of the strong model by the one of the cheap model). Cached responses are priced as if they had been sent.",
+            "savings": strong_only_cost - total_cost,
+            "savings_ratio": (strong_only_cost - total_cost) / strong_only_cost
+            if strong_only_cost > 0
+            else None,
+        },
+        # Summed over the LLM calls of the turns
+        "latency_seconds": {
+            "cheap_tier": run_stats.cascade_cheap_latency,
+            "strong_tier": run_stats.cascade_strong_latency,
+            "total": total_latency,
+            "strong_model_only_estimate": strong_only_latency,
+            "strong_model_only_estimate_method": "Average latency of the strong calls of escalated turns for every annotated turn.",
+            "savings": strong_only_latency - total_latency
+            if strong_only_latency is not None
+            else None,
+        },
+    }
+
+
 def compute_run_breakdown_stats(
     analysis_start_time: datetime,
     analysis_end_time: datetime,
-    dialogues: list[Dialogue],
+    run_stats: BreakdownStatsAccumulator,
     total_breakdown_detection_usage: UsageCost,
-    is_task_oriented: bool,
     dialogues_dir: Path,
     chatbot_id: Optional[str] = None,
     real_dialogue: bool = False,
@@ -207,130 +364,44 @@ def compute_run_breakdown_stats(
     dialogue_file_name: Optional[str] = None,
     extra_output_file: bool = False,
 ) -> None:
-    dialogues_with_breakdowns = [
-        dialogue
-        for dialogue in dialogues
-        if dialogue.breakdown_stats and dialogue.breakdown_stats.get("count", 0) > 0
-    ]
-    num_chatbot_turns = sum(
-        [
-            dialogue.chat_statistics["num_chatbot_turns"]
-            for dialogue in dialogues
-            if dialogue.chat_statistics
-        ]
+    num_chatbot_turns = run_stats.num_chatbot_turns
+    total_breakdown_count = run_stats.total_breakdown_count
+    total_avg_score = (
+        run_stats.sum_avg_scores / run_stats.num_avg_scores
+        if run_stats.num_avg_scores > 0
+        else None
     )
-    breakdown_counts = [
-        dialogue.breakdown_stats.get("count", 0)
-        for dialogue in dialogues
-        if dialogue.breakdown_stats
-    ]
-    avg_scores = [
-        dialogue.breakdown_stats.get("avg_score", 0)
-        for dialogue in dialogues
-        if dialogue.breakdown_stats
-    ]
-
-    total_breakdown_count = sum(breakdown_counts)
-    total_avg_score = sum(avg_scores) / len(avg_scores) if len(avg_scores) > 0 else None
     print(f"Total number of detected breakdowns: {total_breakdown_count}")
     print(f"Average score: {total_avg_score}")
-    print(
-        f"Dialogues with breakdowns: {[dialogue.dialogue_id for dialogue in dialogues_with_breakdowns]}"
-    )
+    print(f"Dialogues with breakdowns: {run_stats.dialogues_with_breakdowns}")
 
-    ids_of_first_breakdowns = [
-        dialogue.breakdown_stats.get("turn_ids_of_breakdowns", [])[0]
-        for dialogue in dialogues_with_breakdowns
-        if dialogue.breakdown_stats
-    ]
     avg_turn_number_of_first_breakdown = (
-        sum(ids_of_first_breakdowns) / len(ids_of_first_breakdowns)
-        if len(ids_of_first_breakdowns) > 0
+        run_stats.sum_ids_of_first_breakdowns / run_stats.num_first_breakdowns
+        if run_stats.num_first_breakdowns > 0
         else None
     )
 
-    turns_with_breakdowns: list[DialogueTurn] = []
-    for dialogue in dialogues_with_breakdowns:
-        chat_history = dialogue.chat_history
-        for turn in chat_history:
-            if (
-                turn.breakdown_annotation
-                and turn.breakdown_annotation.decision == BreakdownDecision.BREAKDOWN
-            ):
-                turns_with_breakdowns.append(turn)
-
-    scores_of_turns_with_breakdowns = [
-        turn.breakdown_annotation.score
-        for turn in turns_with_breakdowns
-        if turn.breakdown_annotation
-    ]
-
-    scores_of_turns_with_breakdowns_excluding_chatbot_crashes = []
-    for turn in turns_with_breakdowns:
-        if turn.breakdown_annotation and turn.breakdown_annotation.breakdown_types != [
-            "Chatbot Crash"
-        ]:
-            scores_of_turns_with_breakdowns_excluding_chatbot_crashes.append(
-                turn.breakdown_annotation.score
-            )
-
     five_num_summary_of_breakdown_scores = five_num_summary(
-        scores_of_turns_with_breakdowns
+        run_stats.scores_of_turns_with_breakdowns
     )
     five_num_summary_of_breakdown_scores_excluding_chatbot_crashes = five_num_summary(
-        scores_of_turns_with_breakdowns_excluding_chatbot_crashes
+        run_stats.scores_of_turns_with_breakdowns_excluding_chatbot_crashes
     )
 
-    # Compute the counts per breakdown type
-    counts_per_type = {}
-    for key, value in get_flattened_taxonomy(is_task_oriented).items():
-        counts_for_key = sum(
-            [
-                dialogue.breakdown_stats["counts_per_breakdown_type"].get(key, 0)
-                for dialogue in dialogues_with_breakdowns
-                if dialogue.breakdown_stats
-            ]
-        )
-        counts_per_type[key] = counts_for_key
-    counts_per_type["chatbot_crash"] = sum(
-        [
-            dialogue.breakdown_stats["counts_per_breakdown_type"].get(
-                "chatbot_crash", 0
-            )
-            for dialogue in dialogues_with_breakdowns
-            if dialogue.breakdown_stats
-        ]
-    )
+    counts_per_type = run_stats.counts_per_type
     n_unique_breakdown_types = len(
         [key for key, value in counts_per_type.items() if value > 0]
     )
 
-    # Create breakdown excerpts for all dialogues with breakdowns
-    breakdown_excerpts = []
-    for dialogue in dialogues_with_breakdowns:
-        chat_history = dialogue.chat_history
-        for i, turn in enumerate(chat_history):
-            if (
-                turn.breakdown_annotation
-                and turn.breakdown_annotation.decision == BreakdownDecision.BREAKDOWN
-            ):
-                previous_turn = chat_history[i - 1] if i > 0 else None
-                excerpt = {
-                    "dialogue_id": dialogue.dialogue_id,
-                    "previous_turn": previous_turn.model_dump()
-                    if previous_turn
-                    else None,
-                    "breakdown_turn": turn.model_dump(),
-                }
-                breakdown_excerpts.append(excerpt)
-
-    heatmap = plot_and_save_heatmap(dialogues, dialogues_dir)
+    plot_and_save_heatmap(
+        run_stats.heatmap, run_stats.heatmap_breakdown_keys, dialogues_dir
+    )
     breakdown_matches, breakdown_matches_str, users_with_matches = (
-        compute_breakdown_matches_per_test_user(heatmap)
+        compute_breakdown_matches_per_test_user(run_stats.heatmap)
     )
 
     cost_stats = compute_analysis_cost_statistics(
-        dialogues, total_breakdown_detection_usage
+        run_stats.num_dialogues, total_breakdown_detection_usage
     )
 
     # Save the overall statistics
@@ -344,8 +415,8 @@ def compute_run_breakdown_stats(
         "stats": {
             "start_time": analysis_start_time.strftime("%Y-%m-%d %H:%M:%S"),
             "end_time": analysis_end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "n_analyzed_dialogues": len(dialogues),
-            "n_dialogues_with_breakdowns": len(dialogues_with_breakdowns),
+            "n_analyzed_dialogues": run_stats.num_dialogues,
+            "n_dialogues_with_breakdowns": len(run_stats.dialogues_with_breakdowns),
             "total_breakdown_count": total_breakdown_count,
             "n_analyzed_chatbot_turns": num_chatbot_turns,
             "breakdowns_per_chatbot_turn": total_breakdown_count / num_chatbot_turns
@@ -355,9 +426,7 @@ def compute_run_breakdown_stats(
             "avg_turn_quality_score": total_avg_score,
             "scores_of_turns_with_breakdowns": five_num_summary_of_breakdown_scores,
             "scores_of_turns_with_breakdowns_excluding_chatbot_crashes": five_num_summary_of_breakdown_scores_excluding_chatbot_crashes,
-            "dialogues_with_breakdowns": [
-                dialogue.dialogue_id for dialogue in dialogues_with_breakdowns
-            ],
+            "dialogues_with_breakdowns": run_stats.dialogues_with_breakdowns,
             "counts_per_breakdown_type": counts_per_type,
             "n_unique_breakdown_types": n_unique_breakdown_types,
             "breakdown_matches_per_user": breakdown_matches,
@@ -365,19 +434,39 @@ def compute_run_breakdown_stats(
             "users_with_matches": users_with_matches,
             "detection_cost_stats": cost_stats,
         },
-        "breakdown_excerpts": breakdown_excerpts,
+        "breakdown_excerpts": run_stats.breakdown_excerpts,
     }
+    cascade_stats = compute_cascade_stats(run_stats)
+    if cascade_stats is not None:
+        test_run_info["stats"]["cascade_stats"] = cascade_stats
+        print(
+            f"Cascade: {cascade_stats['n_escalated_turns']} of {cascade_stats['n_annotated_turns']} turns escalated to the strong model, estimated savings of {cascade_stats['cost']['savings']:.4f} USD"
+        )
 
     test_run_info_path = dialogues_dir / "breakdown_detection_stats.yaml"
     with open(test_run_info_path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(test_run_info, f, indent=4, sort_keys=False, allow_unicode=True)
+        yaml_utils.safe_dump(
+            test_run_info, f, indent=4, sort_keys=False, allow_unicode=True
+        )
     print(f"Aggregated statistics saved to {test_run_info_path}")
 
 
+def _get_dialogue_analysis_times(dialogue: Dialogue) -> Tuple[datetime, datetime]:
+    assert dialogue.breakdown_stats is not None
+    return (
+        datetime.strptime(
+            dialogue.breakdown_stats["analysis_start_time"], "%Y-%m-%d %H:%M:%S"
+        ),
+        datetime.strptime(
+            dialogue.breakdown_stats["analysis_end_time"], "%Y-%m-%d %H:%M:%S"
+        ),
+    )
+
+
 def test_dialogues(
     run_id: str,
     dialogues_dir: Path,
-    dialogues: List[Dialogue],
+    dialogues: Iterable[Dialogue],
     chatbot: Chatbot,
     is_task_oriented: bool = True,
     real_dialogue: bool = False,
@@ -386,9 +475,15 @@ def test_dialogues(
     save_prompts: bool = True,
     extra_output_file: bool = False,
     recompute_stats: bool = False,
-    breakdown_detector_model: str = DEFAULT_LLM,
+    breakdown_detector_model: Optional[str] = None,
     seed: Optional[int] = None,
+    turn_workers: int = 1,
+    workers: int = 1,
+    incremental: bool = False,
+    detection_mode: BreakdownDetectionMode = BreakdownDetectionMode.PER_TURN,
+    heuristic_prefilter: bool = False,
 ):
+    breakdown_detector_model = breakdown_detector_model or get_default_llm()
     if recompute_stats:
         # Load the existing breakdown_detection_stats.yaml file
         breakdown_detection_stats_file = (
@@ -399,26 +494,35 @@ def test_dialogues(
                 f"Can not recompute stats, as the file {breakdown_detection_stats_file} does not exist."
             )
         with open(breakdown_detection_stats_file, "r", encoding="utf-8") as f:
-            existing_breakdown_detection_stats = yaml.safe_load(f)
+            existing_breakdown_detection_stats = yaml_utils.safe_load(f)
 
         analysis_start_time = datetime.strptime(
             existing_breakdown_detection_stats["stats"]["start_time"],
             "%Y-%m-%d %H:%M:%S",
         )
+    else:
+        analysis_start_time = datetime.now()
+    # The number of dialogues is not known in advance when they are streamed
+    num_dialogues = len(dialogues) if isinstance(dialogues, Sized) else None
+    num_dialogues_str = str(num_dialogues) if num_dialogues is not None else "all"
+    if recompute_stats:
         print(
-            f"Recomputing breakdown detection statistics for {len(dialogues)} dialogues..."
+            f"Recomputing breakdown detection statistics for {num_dialogues_str} dialogues..."
         )
     else:
-        analysis_start_time = datetime.now()
-        print(f"Analyzing {len(dialogues)} dialogues...")
-    total_breakdown_detection_usage = UsageCost(
-        prompt_tokens=0, completion_tokens=0, total_tokens=0, cost=0.0
-    )
-    for i, dialogue in enumerate(dialogues):
         print(
-            f"Analyzing dialogue {dialogue.dialogue_id} ({i + 1}/{len(dialogues)})..."
+            f"Analyzing {num_dialogues_str} dialogues{' (only turns without a current annotation)' if incremental else ''}..."
         )
 
+    breakdown_identifier = get_breakdown_identifier(detection_mode)
+
+    def analyze_dialogue(
+        indexed_dialogue: tuple[int, Dialogue],
+    ) -> tuple[Dialogue, UsageCost]:
+        i, dialogue = indexed_dialogue
+        progress_str = f"{i + 1}/{num_dialogues}" if num_dialogues else f"{i + 1}"
+        print(f"Analyzing dialogue {dialogue.dialogue_id} ({progress_str})...")
+
         chat_history = dialogue.chat_history
 
         if recompute_stats:
@@ -426,11 +530,8 @@ def test_dialogues(
                 raise ValueError(
                     f"Can not run in stats_only mode, as the dialogue {dialogue.path} does not have breakdown statistics."
                 )
-            detection_start_time = datetime.strptime(
-                dialogue.breakdown_stats["analysis_start_time"], "%Y-%m-%d %H:%M:%S"
-            )
-            detection_end_time = datetime.strptime(
-                dialogue.breakdown_stats["analysis_end_time"], "%Y-%m-%d %H:%M:%S"
+            detection_start_time, detection_end_time = _get_dialogue_analysis_times(
+                dialogue
             )
             breakdown_detection_usage = UsageCost(
                 **dialogue.breakdown_stats["detection_cost_stats"]
@@ -441,14 +542,55 @@ def test_dialogues(
                 chat_history,
                 is_task_oriented,
                 chatbot.info,
+                breakdown_identifier=breakdown_identifier,
                 save_prompts=save_prompts,
-                save_dir=(dialogue.path.parent / "breakdown_detection_prompts"),
+                # One prompt directory per dialogue as several dialogues of a user share the same directory
+                save_dir=(
+                    dialogue.path.parent
+                    / "breakdown_detection_prompts"
+                    / dialogue.path.stem
+                ),
                 breakdown_detector_model=breakdown_detector_model,
                 seed=seed,
+                max_workers=turn_workers,
+                incremental=incremental,
+                heuristic_prefilter=heuristic_prefilter,
             )
             detection_end_time = datetime.now()
             breakdown_detection_usage = compute_total_usage(model_responses)
+            if incremental and dialogue.breakdown_stats:
+                # Keep the usage of the earlier analyses, so the cost statistics cover all detection requests of the dialogue
+                breakdown_detection_usage = merge_usage(
+                    [
+                        UsageCost(**dialogue.breakdown_stats["detection_cost_stats"]),
+                        breakdown_detection_usage,
+                    ]
+                )
+                if not model_responses:
+                    # All turns were already annotated, so the dialogue keeps the times of its earlier analysis
+                    detection_start_time, detection_end_time = (
+                        _get_dialogue_analysis_times(dialogue)
+                    )
 
+        compute_dialogue_breakdown_stats(
+            detection_start_time,
+            detection_end_time,
+            breakdown_detection_usage,
+            chat_history,
+            dialogue,
+            is_task_oriented,
+        )
+
+        output_path = save_dialogue(dialogue, annotated=extra_output_file)
+
+        print(f"Annotated dialogue saved to {output_path}")
+        return dialogue, breakdown_detection_usage
+
+    total_breakdown_detection_usage = UsageCost(
+        prompt_tokens=0, completion_tokens=0, total_tokens=0, cost=0.0
+    )
+
+    def add_to_total_usage(breakdown_detection_usage: UsageCost) -> None:
         total_breakdown_detection_usage.prompt_tokens += (
             breakdown_detection_usage.prompt_tokens
         )
@@ -460,26 +602,31 @@ def test_dialogues(
             + breakdown_detection_usage.completion_tokens
         )
         total_breakdown_detection_usage.cost += breakdown_detection_usage.cost
-
-        compute_dialogue_breakdown_stats(
-            detection_start_time,
-            detection_end_time,
-            breakdown_detection_usage,
-            chat_history,
-            dialogue,
-            is_task_oriented,
+        total_breakdown_detection_usage.cache_hits += (
+            breakdown_detection_usage.cache_hits
         )
 
-        if extra_output_file:
-            output_path = dialogue.path.parent / f"{dialogue.path.stem}_annotated.yaml"
-        else:
-            output_path = dialogue.path
-        with open(output_path, "w", encoding="utf-8") as f:
-            yaml.safe_dump(
-                dialogue.model_dump(), f, indent=4, sort_keys=False, allow_unicode=True
-            )
+    run_stats = BreakdownStatsAccumulator(is_task_oriented)
+    storage_files: set[Path] = set()
+    if workers > 1 and not recompute_stats:
+        print(f"Analyzing up to {workers} dialogues concurrently...")
+    # The statistics are only accumulated in this thread and in dialogue order, so the totals are deterministic
+    for dialogue, breakdown_detection_usage in map_in_order(
+        analyze_dialogue,
+        enumerate(dialogues),
+        workers=workers if not recompute_stats else 1,
+    ):
+        add_to_total_usage(breakdown_detection_usage)
+        run_stats.add(dialogue)
+        if dialogue.storage_file is not None:
+            storage_files.add(dialogue.storage_file)
+
+    if run_stats.num_dialogues == 0:
+        print(f"No dialogues could be analyzed in {dialogues_dir}. Exiting...")
+        return
 
-        print(f"Annotated dialogue saved to {output_path}")
+    # Drop the superseded records of the dialogues stored in JSONL logs
+    compact_dialogues_logs(storage_files)
 
     analysis_end_time = (
         datetime.now()
@@ -489,14 +636,13 @@ def test_dialogues(
         )
     )
     print(
-        f"Breakdown detection for {len(dialogues)} dialogues completed. Aggregating statistics..."
+        f"Breakdown detection for {run_stats.num_dialogues} dialogues completed. Aggregating statistics..."
     )
     compute_run_breakdown_stats(
         analysis_start_time,
         analysis_end_time,
-        dialogues,
+        run_stats,
         total_breakdown_detection_usage,
-        is_task_oriented,
         dialogues_dir,
         chatbot_id=chatbot.id,
         real_dialogue=real_dialogue,
@@ -518,24 +664,48 @@ def run(
     recompute_stats: bool = False,
     save_prompts: bool = True,
     seed: Optional[int] = None,
+    turn_workers: int = 1,
+    workers: int = 1,
+    load_workers: int = 1,
+    load_in_processes: bool = False,
+    stream: bool = False,
+    incremental: bool = False,
+    detection_mode: BreakdownDetectionMode = BreakdownDetectionMode.PER_TURN,
+    heuristic_prefilter: bool = False,
 ):
     if dialogue_file_name and not subfolder:
         raise ValueError(
             "If a dialogue file is specified, a subfolder must also be specified."
         )
+    load_env_file()
 
     is_task_oriented = chatbot.info.type == ChatbotType.TASK_ORIENTED
 
-    dialogues_dir, dialogues = load_dialogues(
-        chatbot.base_directory, run_id, subfolder, dialogue_file_name, real_dialogue
-    )
-
-    if not dialogues:
-        print(f"No dialogues found to analyze in {dialogues_dir}. Exiting...")
-        return
+    dialogues: Iterable[Dialogue]
+    if stream:
+        # Dialogues are loaded one at a time while they are analyzed, so memory stays flat for large runs
+        dialogues_dir = get_dialogues_dir(
+            chatbot.base_directory, run_id, subfolder, real_dialogue
+        )
+        dialogues = iter_dialogues(
+            chatbot.base_directory, run_id, subfolder, dialogue_file_name, real_dialogue
+        )
+    else:
+        dialogues_dir, dialogues = load_dialogues(
+            chatbot.base_directory,
+            run_id,
+            subfolder,
+            dialogue_file_name,
+            real_dialogue,
+            workers=load_workers,
+            use_processes=load_in_processes,
+        )
+        if not dialogues:
+            print(f"No dialogues found to analyze in {dialogues_dir}. Exiting...")
+            return
 
     breakdown_detector_model = os.getenv(
-        "CHAT_CHECKER_BREAKDOWN_DETECTOR_LLM", DEFAULT_LLM
+        "CHAT_CHECKER_BREAKDOWN_DETECTOR_LLM", get_default_llm()
     )
 
     test_dialogues(
@@ -552,4 +722,9 @@ def run(
         save_prompts=save_prompts,
         breakdown_detector_model=breakdown_detector_model,
         seed=seed,
+        turn_workers=turn_workers,
+        workers=workers,
+        incremental=incremental,
+        detection_mode=detection_mode,
+        heuristic_prefilter=heuristic_prefilter,
     )
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple, Any
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, Optional, Tuple, Any
 
 
 class ChatbotClientInterface(ABC):
@@ -79,3 +81,121 @@ class ChatbotClientInterface(ABC):
             Tuple[str, bool]: The chatbot's response and a boolean indicating if the conversation has ended.
         """
         pass
+
+    def close(self) -> Any:
+        """
+        Release the resources held by this client instance.
+
+        Called once when the client is no longer used, e.g. to close an HTTP session that is shared by the chats of the instance.
+        Class-wide resources are released in tear_down_class.
+
+        Returns:
+            Any: Optional return value that may be used to confirm the release.
+        """
+        pass
+
+
+class AsyncChatbotClientInterface(ABC):
+    """
+    Abstract base class for interacting with chatbots from an asyncio event loop.
+
+    Mirrors ChatbotClientInterface but with coroutine chat methods, so that many dialogues can be driven concurrently on a single event loop.
+    """
+
+    @classmethod
+    def set_up_class(cls) -> Any:
+        """
+        Set up resources needed for the class.
+
+        Returns:
+            Any: Optional return value that may be used to confirm setup success.
+        """
+        pass
+
+    @classmethod
+    def tear_down_class(cls) -> Any:
+        """
+        Tear down resources allocated for the class.
+
+        Returns:
+            Any: Optional return value that may be used to confirm teardown success.
+        """
+        pass
+
+    @abstractmethod
+    async def set_up_chat(self, *args) -> Optional[str]:
+        """
+        Set up resources needed for an individual chat session.
+
+        Args:
+            *args: Variable arguments that may be required to set up the chat.
+
+        Returns:
+            Optional[str]: Greeting/conversation initiation message from the chatbot or None. None --> the user should initiate the conversation.
+        """
+        pass
+
+    @abstractmethod
+    async def tear_down_chat(self, *args) -> Any:
+        """
+        Tear down resources for an individual chat session.
+
+        Args:
+            *args: Variable arguments that may be required to tear down the chat.
+
+        Returns:
+            Any: Response or status indicating the success of the teardown.
+        """
+        pass
+
+    @abstractmethod
+    async def get_response(self, user_message: str) -> Tuple[str, bool]:
+        """
+        Send a user message to the chatbot and get the response.
+
+        Args:
+            user_message (str): The message from the user to be sent to the chatbot.
+
+        Returns:
+            Tuple[str, bool]: The chatbot's response and a boolean indicating if the conversation has ended.
+        """
+        pass
+
+    async def aclose(self) -> Any:
+        """
+        Release the resources held by this client instance.
+
+        Returns:
+            Any: Optional return value that may be used to confirm the release.
+        """
+        pass
+
+
+class SyncChatbotClientAdapter(AsyncChatbotClientInterface):
+    """
+    Adapter that exposes a synchronous ChatbotClientInterface as an AsyncChatbotClientInterface.
+
+    The blocking calls of the wrapped client are run in the given executor, which bounds the number of threads used for existing chatbot clients.
+    """
+
+    def __init__(self, chatbot_client: ChatbotClientInterface, executor: Executor):
+        self.chatbot_client = chatbot_client
+        self.executor = executor
+
+    async def _run_in_executor(self, func: Callable[..., Any], *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def set_up_chat(self, *args) -> Optional[str]:
+        return await self._run_in_executor(self.chatbot_client.set_up_chat, *args)
+
+    async def tear_down_chat(self, *args) -> Any:
+        return await self._run_in_executor(self.chatbot_client.tear_down_chat, *args)
+
+    async def get_response(self, user_message: str) -> Tuple[str, bool]:
+        return await self._run_in_executor(
+            self.chatbot_client.get_response, user_message
+        )
+
+    async def aclose(self) -> Any:
+        return await self._run_in_executor(self.chatbot_client.close)
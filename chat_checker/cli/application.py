@@ -1,18 +1,27 @@
 from pathlib import Path
 import random
-from typing import Annotated, Optional
+from typing import Annotated, List, Optional
 
 import typer
 from rich import print
 
+from chat_checker.breakdown_detection.annotation_store import (
+    DEFAULT_ANNOTATION_STORE_FILE_NAME,
+    BreakdownAnnotationStore,
+    set_breakdown_annotation_store,
+)
+from chat_checker.models.breakdowns import BreakdownDetectionMode
+from chat_checker.models.dialogue import DialogueStorageFormat
 from chat_checker.models.run import UserType
 from chat_checker.models.user_personas import PersonaType
 from chat_checker.data_management.chatbot_registry import register_chatbots, get_chatbot
-from chat_checker.persona_generation.persona_generator import run as run_persona_gen
-from chat_checker.simulation_runner import run as run_simulation
-from chat_checker.breakdown_identification_runner import run as run_spot_errors
-from chat_checker.rating_runner import run as run_evaluation
-from chat_checker.utils.misc_utils import verify_environment
+from chat_checker.models.chatbot import Chatbot
+from chat_checker.utils.llm_cache import DEFAULT_CACHE_FILE_NAME, LLMResponseCache
+from chat_checker.utils.llm_gateway import (
+    configure_llm_gateway,
+    set_llm_response_cache,
+)
+from chat_checker.utils.misc_utils import load_env_file, verify_environment
 
 CHAT_CHECKER_BASE_DIR = Path(__file__).parent.parent
 
@@ -92,6 +101,141 @@ RecomputeStats = Annotated[
         help="Recompute statistics for the existing analysis, don't analyze again",
     ),
 ]
+DetectionMode = Annotated[
+    BreakdownDetectionMode,
+    typer.Option(
+        "--detection-mode",
+        "-dm",
+        help="How the breakdown detector calls the LLM: one call per chatbot turn (per_turn), one call for all chatbot turns of a dialogue (batched, fewer prompt tokens), or a cheap model first and the breakdown detector LLM only for uncertain turns and breakdowns (cascade)",
+    ),
+]
+HeuristicPrefilter = Annotated[
+    bool,
+    typer.Option(
+        "--heuristic-prefilter",
+        help="Annotate obvious breakdowns (chatbot crashes, empty replies, exact repetitions of the previous reply, replies in a script of no available language) by rules instead of sending them to the breakdown detector LLM. The rule-based annotations differ from the LLM ones (e.g. every exact repetition is a breakdown with score 0.2)",
+    ),
+]
+Incremental = Annotated[
+    bool,
+    typer.Option(
+        "--incremental",
+        help="Only analyze the turns without a breakdown annotation of the current detector model and prompts (e.g. to continue an interrupted analysis). Annotations written to extra output files are not reused",
+    ),
+]
+Concurrency = Annotated[
+    int,
+    typer.Option(
+        "--concurrency",
+        "-c",
+        min=1,
+        help="Number of user personas to simulate concurrently. Each worker uses its own chatbot client instance",
+    ),
+]
+UseAsync = Annotated[
+    bool,
+    typer.Option(
+        "--async",
+        "-a",
+        help="Drive the persona dialogues on a single asyncio event loop. Uses the AsyncChatbotClient of the chatbot if available, otherwise the ChatbotClient is run in a thread pool of --concurrency workers",
+    ),
+]
+TurnWorkers = Annotated[
+    int,
+    typer.Option(
+        "--turn-workers",
+        "-tw",
+        min=1,
+        help="Number of system turns of a dialogue to analyze for breakdowns in parallel",
+    ),
+]
+Workers = Annotated[
+    int,
+    typer.Option(
+        "--workers",
+        "-w",
+        min=1,
+        help="Number of dialogues to analyze concurrently",
+    ),
+]
+LoadWorkers = Annotated[
+    int,
+    typer.Option(
+        "--load-workers",
+        "-lw",
+        min=1,
+        help="Number of dialogue files to load in parallel",
+    ),
+]
+LoadInProcesses = Annotated[
+    bool,
+    typer.Option(
+        "--load-processes",
+        help="Load the dialogue files in a process pool instead of a thread pool. Faster for many large yaml files",
+    ),
+]
+Stream = Annotated[
+    bool,
+    typer.Option(
+        "--stream",
+        help="Load and analyze the dialogues one at a time instead of loading all dialogues up front. Keeps the memory usage flat for very large dialogue sets",
+    ),
+]
+MaxInFlightRequests = Annotated[
+    Optional[int],
+    typer.Option(
+        "--max-in-flight",
+        "-mif",
+        min=1,
+        help="Maximum number of LLM requests in flight at the same time across all workers. Unlimited if not provided",
+    ),
+]
+ModelLimits = Annotated[
+    Optional[List[str]],
+    typer.Option(
+        "--model-limit",
+        "-ml",
+        help="Maximum number of LLM requests in flight at the same time for a specific model in the form <model>=<n> (e.g. 'gpt-4o-2024-08-06=4'). Can be provided multiple times",
+    ),
+]
+RequestsPerMinuteLimits = Annotated[
+    Optional[List[str]],
+    typer.Option(
+        "--rpm-limit",
+        "-rpm",
+        help="Maximum number of LLM requests per minute for a specific model in the form <model>=<n>. Can be provided multiple times",
+    ),
+]
+TokensPerMinuteLimits = Annotated[
+    Optional[List[str]],
+    typer.Option(
+        "--tpm-limit",
+        "-tpm",
+        help="Maximum number of LLM tokens per minute for a specific model in the form <model>=<n>. Can be provided multiple times",
+    ),
+]
+NoCache = Annotated[
+    bool,
+    typer.Option(
+        "--no-cache",
+        help="Do not read or write the LLM response cache and the breakdown annotation store in the chatbot directory. Deterministic breakdown detection, rating and persona generation requests are cached otherwise",
+    ),
+]
+StorageFormat = Annotated[
+    DialogueStorageFormat,
+    typer.Option(
+        "--storage-format",
+        "-sf",
+        help="Format in which the simulated dialogues are stored: one yaml (plus txt) or json file per dialogue, or one jsonl file per run. Dialogues in any format can be tested and evaluated",
+    ),
+]
+Resume = Annotated[
+    Optional[str],
+    typer.Option(
+        "--resume",
+        help="ID of an interrupted simulation run to complete. The run continues with the settings it was started with and only the missing dialogues are simulated",
+    ),
+]
 
 Verbose = Annotated[bool, typer.Option("--verbose", "-v", help="Enable verbose mode")]
 Debug = Annotated[bool, typer.Option("--debug", "-d", help="Enable debug mode")]
@@ -101,6 +245,51 @@ Seed = Annotated[
 ]
 
 
+def parse_model_limits(
+    model_limits: Optional[List[str]],
+) -> Optional[dict[str, int]]:
+    if not model_limits:
+        return None
+    limits_per_model: dict[str, int] = {}
+    for model_limit in model_limits:
+        model, _, limit = model_limit.rpartition("=")
+        if not model or not limit.isdigit() or int(limit) < 1:
+            raise typer.BadParameter(
+                f"Invalid model limit '{model_limit}'. Expected the form <model>=<n> with n >= 1"
+            )
+        limits_per_model[model] = int(limit)
+    return limits_per_model
+
+
+def configure_llm_limits(
+    max_in_flight_requests: Optional[int],
+    model_limits: Optional[List[str]],
+    rpm_limits: Optional[List[str]],
+    tpm_limits: Optional[List[str]],
+):
+    configure_llm_gateway(
+        max_in_flight=max_in_flight_requests,
+        max_in_flight_per_model=parse_model_limits(model_limits),
+        requests_per_minute=parse_model_limits(rpm_limits),
+        tokens_per_minute=parse_model_limits(tpm_limits),
+    )
+
+
+def configure_response_cache(chatbot: Chatbot, no_cache: bool):
+    if no_cache:
+        set_llm_response_cache(None)
+        set_breakdown_annotation_store(None)
+    else:
+        set_llm_response_cache(
+            LLMResponseCache(chatbot.base_directory / DEFAULT_CACHE_FILE_NAME)
+        )
+        set_breakdown_annotation_store(
+            BreakdownAnnotationStore(
+                chatbot.base_directory / DEFAULT_ANNOTATION_STORE_FILE_NAME
+            )
+        )
+
+
 @app.command()
 def register(
     chatbots_base_dir: ChatbotsBaseDir = Path("./chatbots"),
@@ -114,6 +303,7 @@ def register(
     """
     Register chatbots contained in the base directory for testing and evaluation.
     """
+    load_env_file()
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
         return
@@ -129,12 +319,16 @@ def generate_personas(
     num_personas: int = typer.Option(
         1, "--num", "-n", help="Number of personas to generate"
     ),
+    no_cache: NoCache = False,
     verbose: Verbose = False,
     seed: Seed = None,
 ):
     """
     Generate user personas for chatbot simulation.
     """
+    from chat_checker.persona_generation.persona_generator import run as run_persona_gen
+
+    load_env_file()
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
         return
@@ -143,6 +337,7 @@ def generate_personas(
     except ValueError as e:
         print(e)
         return
+    configure_response_cache(chatbot, no_cache)
     if seed is not None:
         # set the seed for the random number generator
         random.seed(seed)
@@ -162,12 +357,24 @@ def simulate_users(
     selector: Selector = None,
     runs_per_user: RunsPerUser = 1,
     run_prefix: RunPrefix = None,
+    concurrency: Concurrency = 1,
+    use_async: UseAsync = False,
+    storage_format: StorageFormat = DialogueStorageFormat.YAML,
+    resume: Resume = None,
+    max_in_flight_requests: MaxInFlightRequests = None,
+    model_limits: ModelLimits = None,
+    rpm_limits: RequestsPerMinuteLimits = None,
+    tpm_limits: TokensPerMinuteLimits = None,
     debug: Debug = False,
     seed: Seed = None,
 ):
     """
     Simulate users interacting with a chatbot.
     """
+    from chat_checker.simulation_runner import run as run_simulation
+
+    load_env_file()
+    configure_llm_limits(max_in_flight_requests, model_limits, rpm_limits, tpm_limits)
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
         return
@@ -187,6 +394,10 @@ def simulate_users(
         run_prefix=run_prefix,
         debug=debug,
         seed=seed,
+        concurrency=concurrency,
+        use_async=use_async,
+        storage_format=storage_format,
+        resume_run_id=resume,
     )
 
 
@@ -198,15 +409,32 @@ def test(
     dialogue_file_name: DialogueFileName = None,
     extra_output_file: ExtraOutputFile = False,
     recompute_stats: RecomputeStats = False,
+    incremental: Incremental = False,
+    detection_mode: DetectionMode = BreakdownDetectionMode.PER_TURN,
+    heuristic_prefilter: HeuristicPrefilter = False,
+    turn_workers: TurnWorkers = 1,
+    workers: Workers = 1,
+    load_workers: LoadWorkers = 1,
+    load_in_processes: LoadInProcesses = False,
+    stream: Stream = False,
+    max_in_flight_requests: MaxInFlightRequests = None,
+    model_limits: ModelLimits = None,
+    rpm_limits: RequestsPerMinuteLimits = None,
+    tpm_limits: TokensPerMinuteLimits = None,
+    no_cache: NoCache = False,
     seed: Seed = None,
 ):
     """
     Run tests to spot errors in dialogues from a previous run.
     """
+    from chat_checker.breakdown_identification_runner import run as run_spot_errors
+
     if dialogue_file_name and not subfolder:
         raise typer.BadParameter(
             "If providing a dialogue file name, you must also provide a subfolder"
         )
+    load_env_file()
+    configure_llm_limits(max_in_flight_requests, model_limits, rpm_limits, tpm_limits)
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
         return
@@ -215,6 +443,7 @@ def test(
     except ValueError as e:
         print(e)
         return
+    configure_response_cache(chatbot, no_cache)
     if seed is not None:
         # set the seed for the random number generator
         random.seed(seed)
@@ -227,6 +456,14 @@ def test(
         recompute_stats=recompute_stats,
         save_prompts=True,
         seed=seed,
+        turn_workers=turn_workers,
+        workers=workers,
+        load_workers=load_workers,
+        load_in_processes=load_in_processes,
+        stream=stream,
+        incremental=incremental,
+        detection_mode=detection_mode,
+        heuristic_prefilter=heuristic_prefilter,
     )
 
 
@@ -238,15 +475,28 @@ def evaluate(
     dialogue_file_name: DialogueFileName = None,
     extra_output_file: ExtraOutputFile = False,
     recompute_stats: RecomputeStats = False,
+    workers: Workers = 1,
+    load_workers: LoadWorkers = 1,
+    load_in_processes: LoadInProcesses = False,
+    stream: Stream = False,
+    max_in_flight_requests: MaxInFlightRequests = None,
+    model_limits: ModelLimits = None,
+    rpm_limits: RequestsPerMinuteLimits = None,
+    tpm_limits: TokensPerMinuteLimits = None,
+    no_cache: NoCache = False,
     seed: Seed = None,
 ):
     """
     Evaluate dialogues from a previous run.
     """
+    from chat_checker.rating_runner import run as run_evaluation
+
     if dialogue_file_name and not subfolder:
         raise typer.BadParameter(
             "If providing a dialogue file name, you must also provide a subfolder"
         )
+    load_env_file()
+    configure_llm_limits(max_in_flight_requests, model_limits, rpm_limits, tpm_limits)
 
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
@@ -256,6 +506,7 @@ def evaluate(
     except ValueError as e:
         print(e)
         return
+    configure_response_cache(chatbot, no_cache)
 
     run_evaluation(
         chatbot=chatbot,
@@ -265,6 +516,10 @@ def evaluate(
         extra_output_file=extra_output_file,
         recompute_stats=recompute_stats,
         seed=seed,
+        workers=workers,
+        load_workers=load_workers,
+        load_in_processes=load_in_processes,
+        stream=stream,
     )
 
 
@@ -279,12 +534,35 @@ def run(
     dialogue_file_name: DialogueFileName = None,
     extra_output_file: ExtraOutputFile = False,
     recompute_stats: RecomputeStats = False,
+    incremental: Incremental = False,
+    detection_mode: DetectionMode = BreakdownDetectionMode.PER_TURN,
+    heuristic_prefilter: HeuristicPrefilter = False,
+    concurrency: Concurrency = 1,
+    use_async: UseAsync = False,
+    storage_format: StorageFormat = DialogueStorageFormat.YAML,
+    resume: Resume = None,
+    turn_workers: TurnWorkers = 1,
+    workers: Workers = 1,
+    load_workers: LoadWorkers = 1,
+    load_in_processes: LoadInProcesses = False,
+    stream: Stream = False,
+    max_in_flight_requests: MaxInFlightRequests = None,
+    model_limits: ModelLimits = None,
+    rpm_limits: RequestsPerMinuteLimits = None,
+    tpm_limits: TokensPerMinuteLimits = None,
+    no_cache: NoCache = False,
     debug: Debug = False,
     seed: Seed = None,
 ):
     """
     Run the full pipeline: simulate users, spot errors, and evaluate dialogues.
     """
+    from chat_checker.simulation_runner import run as run_simulation
+    from chat_checker.breakdown_identification_runner import run as run_spot_errors
+    from chat_checker.rating_runner import run as run_evaluation
+
+    load_env_file()
+    configure_llm_limits(max_in_flight_requests, model_limits, rpm_limits, tpm_limits)
     valid_env = verify_environment(is_cli=True)
     if not valid_env:
         return
@@ -293,6 +571,7 @@ def run(
     except ValueError as e:
         print(e)
         return
+    configure_response_cache(chatbot, no_cache)
     print(f"Running full pipeline for chatbot {chatbot_id}")
 
     if seed is not None:
@@ -309,6 +588,10 @@ def run(
         run_prefix=run_prefix,
         debug=debug,
         seed=seed,
+        concurrency=concurrency,
+        use_async=use_async,
+        storage_format=storage_format,
+        resume_run_id=resume,
     )
 
     # Step 2: Spot errors
@@ -321,6 +604,14 @@ def run(
         extra_output_file=extra_output_file,
         recompute_stats=recompute_stats,
         seed=seed,
+        turn_workers=turn_workers,
+        workers=workers,
+        load_workers=load_workers,
+        load_in_processes=load_in_processes,
+        stream=stream,
+        incremental=incremental,
+        detection_mode=detection_mode,
+        heuristic_prefilter=heuristic_prefilter,
     )
 
     # Step 3: Evaluate dialogues
@@ -333,6 +624,10 @@ def run(
         extra_output_file=extra_output_file,
         recompute_stats=recompute_stats,
         seed=seed,
+        workers=workers,
+        load_workers=load_workers,
+        load_in_processes=load_in_processes,
+        stream=stream,
     )
 
     print("Full pipeline completed successfully")
@@ -3,9 +3,9 @@ from pathlib import Path
 from typing import Optional
 
 from pydantic import ValidationError
-import yaml
 
 from chat_checker.models.chatbot import Chatbot
+from chat_checker.utils import yaml_utils
 
 
 CHAT_CHECKER_BASE_DIR = Path(__file__).parent.parent
@@ -18,7 +18,7 @@ def load_chatbot(chatbot_dir: Path) -> Chatbot:
             f"Chatbot configuration file not found at {config_path}"
         )
     with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
+        config = yaml_utils.safe_load(f)
     try:
         chatbot = Chatbot(base_directory=chatbot_dir, **config)
     except ValidationError as e:
@@ -27,39 +27,48 @@ def load_chatbot(chatbot_dir: Path) -> Chatbot:
     return chatbot
 
 
-def load_registry() -> dict[str, Chatbot]:
-    registry_path = CHAT_CHECKER_BASE_DIR / "config/chatbots_registry.yaml"
-    if not registry_path.exists():
+REGISTRY_PATH = CHAT_CHECKER_BASE_DIR / "config/chatbots_registry.yaml"
+
+# Chatbot ID -> chatbot directory, read on first access
+_registry_paths: Optional[dict[str, Path]] = None
+# Chatbot ID -> (modification time of the config file, loaded chatbot)
+_chatbot_cache: dict[str, tuple[int, Chatbot]] = {}
+
+
+def load_registry_paths() -> dict[str, Path]:
+    """Read the chatbot directories of the registered chatbots without loading the chatbots themselves."""
+    if not REGISTRY_PATH.exists():
         return {}
-    with open(registry_path, "r", encoding="utf-8") as f:
-        _registry: dict[str, str] = yaml.safe_load(f)
+    with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+        _registry: Optional[dict[str, str]] = yaml_utils.safe_load(f)
     if not _registry:
         return {}
-    chatbot_registry: dict[str, Chatbot] = {}
-    for chatbot_id, chatbot_dir in _registry.items():
-        chatbot = load_chatbot(Path(chatbot_dir))
-        chatbot_registry[chatbot_id] = chatbot
+    return {
+        chatbot_id: Path(chatbot_dir) for chatbot_id, chatbot_dir in _registry.items()
+    }
 
-    return chatbot_registry
 
+def _get_registry_paths() -> dict[str, Path]:
+    global _registry_paths
+    if _registry_paths is None:
+        _registry_paths = load_registry_paths()
+    return _registry_paths
 
-def save_registry(registry: dict[str, Chatbot]):
-    registry_path = CHAT_CHECKER_BASE_DIR / "config/chatbots_registry.yaml"
-    os.makedirs(registry_path.parent, exist_ok=True)
-    with open(registry_path, "w+", encoding="utf-8") as f:
-        yaml.safe_dump(
+
+def save_registry(registry_paths: dict[str, Path]):
+    os.makedirs(REGISTRY_PATH.parent, exist_ok=True)
+    with open(REGISTRY_PATH, "w+", encoding="utf-8") as f:
+        yaml_utils.safe_dump(
             {
-                chatbot.id: str(chatbot.base_directory.absolute())
-                for chatbot in registry.values()
+                chatbot_id: str(chatbot_dir.absolute())
+                for chatbot_id, chatbot_dir in registry_paths.items()
             },
             f,
         )
 
 
-_REGISTRY: dict[str, Chatbot] = load_registry()
-
-
 def register_chatbots(chatbots_base_dir: Path, chatbot_id: Optional[str] = None):
+    registry_paths = _get_registry_paths()
     chatbot_folders = []
     if chatbot_id:
         print(f"Registering chatbot {chatbot_id} from directory {chatbots_base_dir}...")
@@ -78,18 +87,32 @@ def register_chatbots(chatbots_base_dir: Path, chatbot_id: Optional[str] = None)
                 f"Failed to register chatbot from directory {chatbot_folder.name}: {e}"
             )
             continue
-        if chatbot.id in _REGISTRY:
+        if chatbot.id in registry_paths:
             print(f"Chatbot {chatbot.id} is already registered")
             continue
-        _REGISTRY[chatbot.id] = chatbot
+        registry_paths[chatbot.id] = chatbot.base_directory
         print(f"Registered chatbot {chatbot.id}")
-    save_registry(_REGISTRY)
+    save_registry(registry_paths)
 
 
 def get_chatbot(chatbot_id: str) -> Chatbot:
-    chatbot = _REGISTRY.get(chatbot_id)
-    if not chatbot:
+    """
+    Load a registered chatbot. Loaded chatbots are cached until their config file is modified.
+    """
+    chatbot_dir = _get_registry_paths().get(chatbot_id)
+    if not chatbot_dir:
         raise ValueError(
             f"Chatbot {chatbot_id} not found in the registry. Please make sure to register it first."
         )
+    try:
+        config_mtime = (chatbot_dir / "config.yaml").stat().st_mtime_ns
+    except FileNotFoundError:
+        raise ValueError(
+            f"Chatbot {chatbot_id} is registered with directory {chatbot_dir}, but its config.yaml file was not found."
+        )
+    cached = _chatbot_cache.get(chatbot_id)
+    if cached is not None and cached[0] == config_mtime:
+        return cached[1]
+    chatbot = load_chatbot(chatbot_dir)
+    _chatbot_cache[chatbot_id] = (config_mtime, chatbot)
     return chatbot
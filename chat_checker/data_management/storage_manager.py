@@ -1,58 +1,370 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import json
 import os
 from pathlib import Path
-from typing import Optional
+import threading
+from typing import BinaryIO, Iterable, Iterator, Optional
 
-import yaml
 
 from chat_checker.models.chatbot import Chatbot
-from chat_checker.models.dialogue import Dialogue
+from chat_checker.models.dialogue import Dialogue, DialogueStorageFormat
 from chat_checker.models.user_personas import Persona
+from chat_checker.utils import yaml_utils
 
 
-def load_dialogues(
+DIALOGUES_LOG_FILE_NAME = "dialogues.jsonl"
+ANNOTATED_DIALOGUES_LOG_FILE_NAME = "dialogues_annotated.jsonl"
+
+# Serializes the appends to the JSONL dialogue logs, dialogues are saved from several worker threads
+_dialogues_log_lock = threading.Lock()
+
+
+def get_dialogue_storage_format(dialogue: Dialogue) -> DialogueStorageFormat:
+    if dialogue.storage_file is not None:
+        return DialogueStorageFormat.JSONL
+    if dialogue.path.suffix == ".json":
+        return DialogueStorageFormat.JSON
+    return DialogueStorageFormat.YAML
+
+
+def get_dialogue_path(
+    dialogue_base_dir: Path,
+    dialogue_file_name: str,
+    storage_format: DialogueStorageFormat,
+) -> Path:
+    if storage_format == DialogueStorageFormat.JSONL:
+        # Dialogues stored in a JSONL log have no file of their own, the path only identifies them
+        return dialogue_base_dir / dialogue_file_name
+    return dialogue_base_dir / f"{dialogue_file_name}.{storage_format}"
+
+
+def save_dialogue(dialogue: Dialogue, annotated: bool = False) -> Path:
+    """
+    Save the dialogue in the storage format it was loaded from or created with.
+
+    Args:
+        dialogue (Dialogue): The dialogue to save.
+        annotated (bool): Whether to save the dialogue to a separate annotated file instead of overwriting the original one.
+
+    Returns:
+        Path: The path of the file the dialogue was written to.
+    """
+    storage_format = get_dialogue_storage_format(dialogue)
+    if storage_format == DialogueStorageFormat.JSONL:
+        assert dialogue.storage_file is not None
+        output_path = dialogue.storage_file
+        if annotated:
+            output_path = output_path.parent / ANNOTATED_DIALOGUES_LOG_FILE_NAME
+        # The log is append-only, the last record of a dialogue supersedes the earlier ones
+        record = {
+            "path": dialogue.path.relative_to(dialogue.storage_file.parent).as_posix(),
+            **dialogue.model_dump(mode="json"),
+        }
+        record_str = json.dumps(record, ensure_ascii=False)
+        with _dialogues_log_lock:
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write(record_str + "\n")
+        return output_path
+
+    output_path = dialogue.path
+    if annotated:
+        output_path = output_path.with_name(
+            f"{output_path.stem}_annotated{output_path.suffix}"
+        )
+    # Write to a temporary file first so that an interrupted run never leaves a truncated dialogue behind
+    tmp_path = output_path.with_name(f"{output_path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if storage_format == DialogueStorageFormat.JSON:
+            f.write(dialogue.model_dump_json())
+        else:
+            yaml_utils.safe_dump(
+                dialogue.model_dump(), f, indent=4, sort_keys=False, allow_unicode=True
+            )
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def compact_dialogues_logs(storage_files: Iterable[Path]) -> None:
+    """Rewrite the JSONL dialogue logs so that they only keep the latest record of every dialogue."""
+    dialogues_logs = [
+        storage_file.parent / file_name
+        for storage_file in set(storage_files)
+        for file_name in (DIALOGUES_LOG_FILE_NAME, ANNOTATED_DIALOGUES_LOG_FILE_NAME)
+    ]
+    with _dialogues_log_lock:
+        for dialogues_log in dialogues_logs:
+            if not dialogues_log.exists():
+                continue
+            records: dict[str, str] = {}
+            with open(dialogues_log, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        records[json.loads(line)["path"]] = line
+                    except (ValueError, KeyError, TypeError) as e:
+                        # e.g. the last record was cut off when a run was interrupted
+                        print(
+                            f"Dropping invalid record {dialogues_log}:{line_number} ({type(e).__name__}: {e})"
+                        )
+            # Write to a temporary file first so that the log survives a crash while compacting
+            tmp_log = dialogues_log.with_name(f"{dialogues_log.name}.tmp")
+            with open(tmp_log, "w", encoding="utf-8") as f:
+                f.writelines(records.values())
+            os.replace(tmp_log, dialogues_log)
+
+
+def _load_dialogue_file(dialogue_file: Path) -> Dialogue:
+    if dialogue_file.suffix == ".json":
+        with open(dialogue_file, "r", encoding="utf-8") as f:
+            return Dialogue.model_validate_json(
+                f.read(), context={"path": dialogue_file}
+            )
+    with open(dialogue_file, "r", encoding="utf-8") as f:
+        dialogue_dict = yaml_utils.safe_load(f)
+    return Dialogue(**dialogue_dict, path=dialogue_file)
+
+
+def _try_load_dialogue_file(
+    dialogue_file: Path,
+) -> tuple[Optional[Dialogue], Optional[str]]:
+    # Module-level function returning the error instead of raising, so that it can be run in a process pool
+    try:
+        return _load_dialogue_file(dialogue_file), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def _index_dialogues_log(
+    dialogues_log: Path, load_failures: dict[str, str]
+) -> dict[Path, int]:
+    """Map the path of every dialogue in the JSONL log to the offset of its latest record (in order of first appearance)."""
+    record_offsets: dict[Path, int] = {}
+    with open(dialogues_log, "rb") as f:
+        line_number = 0
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            line_number += 1
+            if not line.strip():
+                continue
+            try:
+                record_path = json.loads(line)["path"]
+            except (ValueError, KeyError, TypeError) as e:
+                load_failures[f"{dialogues_log}:{line_number}"] = (
+                    f"{type(e).__name__}: {e}"
+                )
+                continue
+            record_offsets[dialogues_log.parent / record_path] = offset
+    return record_offsets
+
+
+def _iter_logged_dialogues(
+    logged_records: list[tuple[Path, int]], load_failures: dict[str, str]
+) -> Iterator[Dialogue]:
+    open_log: Optional[Path] = None
+    f: Optional[BinaryIO] = None
+    try:
+        for dialogues_log, offset in logged_records:
+            if dialogues_log != open_log:
+                if f is not None:
+                    f.close()
+                f = open(dialogues_log, "rb")
+                open_log = dialogues_log
+            assert f is not None
+            f.seek(offset)
+            try:
+                yield Dialogue.model_validate_json(
+                    f.readline(), context={"storage_file": dialogues_log}
+                )
+            except ValueError as e:
+                load_failures[f"{dialogues_log}@{offset}"] = f"{type(e).__name__}: {e}"
+    finally:
+        if f is not None:
+            f.close()
+
+
+def _find_dialogues_logs(dialogues_dir: Path, chatbot_base_dir: Path) -> list[Path]:
+    dialogues_logs = sorted(dialogues_dir.glob(f"**/{DIALOGUES_LOG_FILE_NAME}"))
+    # The log of a run lies in the run directory, also when only a subfolder of the run is loaded
+    for parent_dir in dialogues_dir.parents:
+        if parent_dir == chatbot_base_dir:
+            break
+        if (parent_dir / DIALOGUES_LOG_FILE_NAME).exists():
+            dialogues_logs.append(parent_dir / DIALOGUES_LOG_FILE_NAME)
+    return dialogues_logs
+
+
+def _load_dialogue_files(
+    dialogue_files: list[Path],
+    load_failures: dict[str, str],
+    workers: int = 1,
+    use_processes: bool = False,
+) -> list[Dialogue]:
+    if workers > 1 and len(dialogue_files) > 1:
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=workers) as executor:
+            # executor.map returns the results in the order of the files. Larger chunks amortize the inter-process communication
+            results = list(
+                executor.map(
+                    _try_load_dialogue_file,
+                    dialogue_files,
+                    chunksize=max(1, len(dialogue_files) // (workers * 4)),
+                )
+            )
+    else:
+        results = [
+            _try_load_dialogue_file(dialogue_file) for dialogue_file in dialogue_files
+        ]
+    dialogues = []
+    for dialogue_file, (dialogue, error) in zip(dialogue_files, results):
+        if dialogue is None:
+            load_failures[str(dialogue_file)] = error or "Unknown error"
+        else:
+            dialogues.append(dialogue)
+    return dialogues
+
+
+def _report_load_failures(load_failures: dict[str, str]) -> None:
+    if not load_failures:
+        return
+    print(
+        f"Failed to load {len(load_failures)} dialogues, they are skipped in the analysis:"
+    )
+    for dialogue_location, error in load_failures.items():
+        print(f"  {dialogue_location}: {error}")
+
+
+def get_dialogues_dir(
     chatbot_base_dir: Path,
     run_id: str,
     subfolder: Optional[str] = None,
-    dialogue_file_name: Optional[str] = None,
     real_dialogue: bool = False,
-) -> tuple[Path, list[Dialogue]]:
+) -> Path:
     if real_dialogue:
         dialogues_dir = chatbot_base_dir / "real_dialogues"
     else:
         dialogues_dir = chatbot_base_dir / "runs" / run_id
     if subfolder:
         dialogues_dir = dialogues_dir / subfolder
+    return dialogues_dir
 
+
+def _find_dialogues(
+    chatbot_base_dir: Path,
+    dialogues_dir: Path,
+    dialogue_file_name: Optional[str],
+    load_failures: dict[str, str],
+) -> tuple[list[Path], list[tuple[Path, int]]]:
+    """Find the dialogue files and the JSONL log records (log file and offset) of the dialogues to load."""
+    # Sorting makes the order of the dialogues independent of the file system
+    dialogue_files = sorted(
+        f for pattern in ("**/*.yaml", "**/*.json") for f in dialogues_dir.glob(pattern)
+    )
+    logged_records = [
+        (dialogues_log, offset)
+        for dialogues_log in _find_dialogues_logs(dialogues_dir, chatbot_base_dir)
+        for dialogue_path, offset in _index_dialogues_log(
+            dialogues_log, load_failures
+        ).items()
+        if dialogue_path.is_relative_to(dialogues_dir)
+        and (not dialogue_file_name or dialogue_path.name == dialogue_file_name)
+    ]
     if dialogue_file_name:
         # Find the dialogue file in the specified directory and subdirectories
-        dialogue_files = [
-            f for f in dialogues_dir.glob("**/*.yaml") if f.stem == dialogue_file_name
-        ]
-        if not dialogue_files:
+        dialogue_files = [f for f in dialogue_files if f.stem == dialogue_file_name]
+        if not dialogue_files and not logged_records:
             raise FileNotFoundError(
-                f"Could not find dialogue file {dialogue_file_name}.yaml in the specified directory and subdirectories."
+                f"Could not find dialogue file {dialogue_file_name} in the specified directory and subdirectories."
             )
     else:
         # Find all dialogues in the specified directory and subdirectories
         dialogue_files = [
             f
-            for f in dialogues_dir.glob("**/*.yaml")
+            for f in dialogue_files
             if "dialogue" in f.stem and not f.stem.endswith("_annotated")
         ]
-        if not dialogue_files:
+        if not dialogue_files and not logged_records:
             raise FileNotFoundError(
                 f"Could not find any dialogue files in {dialogues_dir} and its subdirectories."
             )
-    dialogues = []
-    for dialogue_file in dialogue_files:
-        with open(dialogue_file, "r", encoding="utf-8") as f:
-            dialogue_dict = yaml.safe_load(f)
-        # print(f"Loading dialogue from {dialogue_file}...")
-        dialogue = Dialogue(**dialogue_dict, path=dialogue_file)
-        dialogues.append(dialogue)
+    return dialogue_files, logged_records
+
+
+def load_dialogues(
+    chatbot_base_dir: Path,
+    run_id: str,
+    subfolder: Optional[str] = None,
+    dialogue_file_name: Optional[str] = None,
+    real_dialogue: bool = False,
+    workers: int = 1,
+    use_processes: bool = False,
+) -> tuple[Path, list[Dialogue]]:
+    """
+    Load the dialogues of a run (or of the real dialogues) stored as YAML files, JSON files, or in JSONL logs.
+    Dialogues that can not be parsed are reported and skipped.
+
+    Args:
+        chatbot_base_dir (Path): The base directory of the chatbot.
+        run_id (str): The ID of the run to load the dialogues from.
+        subfolder (Optional[str]): The subfolder of the run (or of the real dialogues) to load the dialogues from.
+        dialogue_file_name (Optional[str]): The name of a single dialogue to load.
+        real_dialogue (bool): Whether to load the real dialogues of the chatbot instead of a run.
+        workers (int): The number of dialogue files to parse in parallel.
+        use_processes (bool): Whether to parse the files in a process pool instead of a thread pool (for CPU-bound yaml parsing).
+
+    Returns:
+        tuple[Path, list[Dialogue]]: The dialogues directory and the dialogues sorted by file path (followed by the dialogues of the JSONL logs in log order).
+    """
+    dialogues_dir = get_dialogues_dir(
+        chatbot_base_dir, run_id, subfolder, real_dialogue
+    )
+    load_failures: dict[str, str] = {}
+    dialogue_files, logged_records = _find_dialogues(
+        chatbot_base_dir, dialogues_dir, dialogue_file_name, load_failures
+    )
+    dialogues = _load_dialogue_files(
+        dialogue_files, load_failures, workers=workers, use_processes=use_processes
+    )
+    dialogues.extend(_iter_logged_dialogues(logged_records, load_failures))
+    _report_load_failures(load_failures)
     return dialogues_dir, dialogues
 
 
+def iter_dialogues(
+    chatbot_base_dir: Path,
+    run_id: str,
+    subfolder: Optional[str] = None,
+    dialogue_file_name: Optional[str] = None,
+    real_dialogue: bool = False,
+) -> Iterator[Dialogue]:
+    """
+    Streaming version of load_dialogues that parses one dialogue at a time, so that only the dialogue being analyzed is held in memory.
+    The dialogues are yielded in the same order as returned by load_dialogues. Missing dialogues raise right away, not on the first iteration.
+    """
+    dialogues_dir = get_dialogues_dir(
+        chatbot_base_dir, run_id, subfolder, real_dialogue
+    )
+    load_failures: dict[str, str] = {}
+    dialogue_files, logged_records = _find_dialogues(
+        chatbot_base_dir, dialogues_dir, dialogue_file_name, load_failures
+    )
+
+    def generate_dialogues() -> Iterator[Dialogue]:
+        for dialogue_file in dialogue_files:
+            dialogue, error = _try_load_dialogue_file(dialogue_file)
+            if dialogue is None:
+                load_failures[str(dialogue_file)] = error or "Unknown error"
+            else:
+                yield dialogue
+        yield from _iter_logged_dialogues(logged_records, load_failures)
+        _report_load_failures(load_failures)
+
+    return generate_dialogues()
+
+
 def load_user_personas(chatbot: Chatbot) -> dict[str, Persona]:
     user_personas = {}
     user_personas_dir = chatbot.base_directory / "user_personas"
@@ -62,7 +374,7 @@ def load_user_personas(chatbot: Chatbot) -> dict[str, Persona]:
         if not file.endswith(".yaml"):
             continue
         with open(user_personas_dir / file, "r", encoding="utf-8") as f:
-            user_persona_dict = yaml.safe_load(f)
+            user_persona_dict = yaml_utils.safe_load(f)
             user_persona = Persona(**user_persona_dict)
             user_personas[user_persona.persona_id] = user_persona
     return user_personas
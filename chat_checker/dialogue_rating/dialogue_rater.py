@@ -1,9 +1,5 @@
 import json
-from typing import Optional, Tuple
-
-from openai.types.chat import ChatCompletionMessageParam
-from litellm import completion
-from litellm.types.utils import ModelResponse, Choices
+from typing import TYPE_CHECKING, Optional, Tuple
 
 from chat_checker.models.chatbot import ChatbotInfo
 from chat_checker.models.dialogue import Dialogue, DialogueTurn
@@ -12,8 +8,8 @@ from chat_checker.models.rating import (
     DialogueRating,
     RatingDimension,
 )
-from chat_checker.utils.llm_utils import DEFAULT_LLM, supports_structured_outputs
-from chat_checker.utils.misc_utils import get_matching_api_key
+from chat_checker.utils.llm_gateway import completion
+from chat_checker.utils.llm_utils import get_default_llm, supports_structured_outputs
 from chat_checker.utils.prompt_utils import generate_chat_history_str
 from chat_checker.dialogue_rating.rating_prompts import (
     chatbot_info_description_str,
@@ -24,17 +20,24 @@ from chat_checker.dialogue_rating.rating_prompts import (
     dialogue_rating_user_prompt,
 )
 
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+    from openai.types.chat import ChatCompletionMessageParam
+
 
 def get_dialogue_rating(
     chat_history: list[DialogueTurn],
     rating_dimensions: list[RatingDimension],
     chatbot_info: Optional[ChatbotInfo] = None,
     examples: list[Dialogue] = [],
-    rating_model: str = DEFAULT_LLM,
+    rating_model: Optional[str] = None,
     seed: Optional[int] = 42,
 ) -> Tuple[
-    dict[str, DialogueDimensionRating], list[ChatCompletionMessageParam], ModelResponse
+    dict[str, DialogueDimensionRating],
+    list["ChatCompletionMessageParam"],
+    "ModelResponse",
 ]:
+    rating_model = rating_model or get_default_llm()
     assert supports_structured_outputs(rating_model)
 
     if chatbot_info:
@@ -96,20 +99,21 @@ def get_dialogue_rating(
 
     user_prompt = dialogue_rating_user_prompt.format(chat_history_str=chat_history_str)
 
-    messages: list[ChatCompletionMessageParam] = [
+    messages: list["ChatCompletionMessageParam"] = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt},
     ]
 
-    rating_response: ModelResponse = completion(
+    rating_response: "ModelResponse" = completion(
         model=rating_model,
         temperature=0,
         seed=seed,
         messages=messages,
         response_format=DialogueRating,
-        api_key=get_matching_api_key(rating_model).get_secret_value(),
-        drop_params=True,  # drop all params that are not supported by the model (e.g., temperature 0 is not supported by o-series models)
+        use_cache=True,
     )
+    from litellm.types.utils import Choices, ModelResponse
+
     # for type-checking
     assert isinstance(rating_response, ModelResponse)
     assert isinstance(rating_response.choices[0], Choices)
@@ -2,15 +2,19 @@ from enum import StrEnum
 from pathlib import Path
 import yaml
 
+from chat_checker.utils.yaml_utils import SafeDumper
 
-yaml.SafeDumper.add_multi_representer(
-    StrEnum,
-    yaml.representer.SafeRepresenter.represent_str,
-)
+
+def yaml_equivalent_of_str_enum(dumper, data):
+    # The C dumper only accepts exact str instances
+    return dumper.represent_str(str(data))
 
 
 def yaml_equivalent_of_path(dumper, data):
     return dumper.represent_str(str(data))
 
 
-yaml.SafeDumper.add_multi_representer(Path, yaml_equivalent_of_path)
+# Register the representers for the pure-Python and the (possibly different) C dumper
+for dumper_cls in {yaml.SafeDumper, SafeDumper}:
+    dumper_cls.add_multi_representer(StrEnum, yaml_equivalent_of_str_enum)
+    dumper_cls.add_multi_representer(Path, yaml_equivalent_of_path)
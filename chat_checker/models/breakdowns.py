@@ -2,8 +2,10 @@ from dataclasses import dataclass
 from enum import StrEnum
 from typing import Optional
 
-import yaml
 from pydantic import BaseModel, Field
+from pydantic.json_schema import SkipJsonSchema
+
+from chat_checker.utils import yaml_utils
 
 
 @dataclass
@@ -19,6 +21,42 @@ class BreakdownDecision(StrEnum):
     NO_BREAKDOWN = "no_breakdown"
 
 
+class BreakdownDetectionMode(StrEnum):
+    # One LLM call per system turn
+    PER_TURN = "per_turn"
+    # One LLM call for all system turns of a dialogue
+    BATCHED = "batched"
+    # A cheap model annotates every system turn, uncertain turns and breakdowns are annotated again by the breakdown detector LLM
+    CASCADE = "cascade"
+
+
+class CascadeTier(StrEnum):
+    CHEAP = "cheap"
+    STRONG = "strong"
+
+
+class CascadeDetectionInfo(BaseModel):
+    # The tier whose annotation was kept
+    decided_by: CascadeTier
+    cheap_model: str
+    strong_model: str
+    # Costs in USD and latencies in seconds of the calls of each tier (0 for the strong tier if the turn was not escalated)
+    cheap_cost: float
+    cheap_latency: float
+    strong_cost: float = 0.0
+    strong_latency: float = 0.0
+    # Estimated cost if the turn had only been annotated by the strong model, at its list price (from the token counts of the cheap call if the turn was not escalated)
+    strong_only_cost: float
+    # Whether the annotation was reused from the annotation store, then no LLM call was made for the turn in this run
+    reused: bool = False
+
+
+class BreakdownProvenance(BaseModel):
+    detector_model: str
+    # Hash of the prompts the annotation was produced with (see BreakdownIdentifier.get_prompt_version)
+    prompt_version: str
+
+
 class BreakdownAnnotation(BaseModel):
     reasoning: str = Field(
         ..., description="The reason for the decision and classification."
@@ -34,6 +72,25 @@ class BreakdownAnnotation(BaseModel):
         ...,
         description="All fitting breakdown types that occurred in the turn. Empty if no breakdown was detected.",
     )
+    # Set by the breakdown detector, not part of the schema of the LLM response
+    provenance: SkipJsonSchema[Optional[BreakdownProvenance]] = None
+    # Set by the cascade breakdown identifier
+    cascade: SkipJsonSchema[Optional[CascadeDetectionInfo]] = None
+
+
+class TurnBreakdownAnnotation(BaseModel):
+    turn_id: int = Field(
+        ..., description="The number of the analysed chatbot turn in the dialogue."
+    )
+    annotation: BreakdownAnnotation = Field(
+        ..., description="The breakdown annotation of the turn."
+    )
+
+
+class DialogueBreakdownAnnotations(BaseModel):
+    annotations: list[TurnBreakdownAnnotation] = Field(
+        ..., description="One annotation per analysed chatbot turn."
+    )
 
 
 if __name__ == "__main__":
@@ -43,9 +100,9 @@ if __name__ == "__main__":
         decision=BreakdownDecision.BREAKDOWN,
         breakdown_types=["task_oriented.task_success_failures"],
     )
-    print(yaml.safe_dump({"decision": BreakdownDecision.BREAKDOWN}))
+    print(yaml_utils.safe_dump({"decision": BreakdownDecision.BREAKDOWN}))
     print(
-        yaml.safe_dump(
+        yaml_utils.safe_dump(
             dummy_bd_annotation.model_dump(), default_flow_style=False, sort_keys=False
         )
     )
@@ -2,13 +2,13 @@ from enum import StrEnum
 from pathlib import Path
 from typing import Optional
 from pydantic import BaseModel, Field
-import yaml
 
 from chat_checker.dialogue_rating.rating_dimensions import (
     DEFAULT_CONVERSATIONAL_DIMENSIONS,
     DEFAULT_TASK_ORIENTED_DIMENSIONS,
 )
 from chat_checker.models.rating import RatingDimension
+from chat_checker.utils import yaml_utils
 
 
 class ChatbotType(StrEnum):
@@ -41,12 +41,12 @@ class ChatbotInfo(BaseModel):
     )
 
     def __str__(self) -> str:
-        return yaml.safe_dump(
+        return yaml_utils.safe_dump(
             self.model_dump(), indent=4, sort_keys=False, allow_unicode=True
         )
 
     def dump_as_yaml_without_task(self) -> str:
-        return yaml.safe_dump(
+        return yaml_utils.safe_dump(
             self.model_dump(exclude={"task"}),
             indent=4,
             sort_keys=False,
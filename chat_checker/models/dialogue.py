@@ -1,7 +1,7 @@
 from enum import StrEnum
 from pathlib import Path
-from typing import Optional
-from pydantic import BaseModel, Field
+from typing import Any, Optional
+from pydantic import BaseModel, Field, ValidationInfo, model_validator
 
 from chat_checker.models.breakdowns import BreakdownAnnotation
 from chat_checker.models.rating import (
@@ -32,9 +32,20 @@ class FinishReason(StrEnum):
     CHATBOT_ERROR = "chatbot_error"
 
 
+class DialogueStorageFormat(StrEnum):
+    YAML = "yaml"
+    JSON = "json"
+    JSONL = "jsonl"
+
+
 class Dialogue(BaseModel):
     dialogue_id: str = Field(..., description="The ID of the dialogue")
     path: Path = Field(..., description="The path to the dialogue file", exclude=True)
+    storage_file: Optional[Path] = Field(
+        None,
+        description="The JSONL file storing the dialogue (None if the dialogue has its own file)",
+        exclude=True,
+    )
     user_name: str = Field(..., description="The name of the user who led the dialogue")
     chat_history: list[DialogueTurn] = Field(
         ..., description="The turns of the dialogue"
@@ -65,3 +76,20 @@ class Dialogue(BaseModel):
     eval_stats: Optional[dict] = Field(
         None, description="The evaluation statistics of the dialogue"
     )
+
+    @model_validator(mode="before")
+    @classmethod
+    def set_storage_location(cls, data: Any, info: ValidationInfo) -> Any:
+        # The storage location is not part of the serialized dialogue, it is passed in the validation context when loading
+        if not isinstance(data, dict) or not info.context:
+            return data
+        data = dict(data)
+        # Paths are passed as strings as JSON validation does not accept Path objects
+        if "storage_file" in info.context:
+            storage_file: Path = info.context["storage_file"]
+            # JSONL records store the dialogue path relative to the JSONL file
+            data["path"] = str(storage_file.parent / data["path"])
+            data["storage_file"] = str(storage_file)
+        elif "path" in info.context:
+            data["path"] = str(info.context["path"])
+        return data
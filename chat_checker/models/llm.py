@@ -6,3 +6,5 @@ class UsageCost(BaseModel):
     completion_tokens: int
     total_tokens: int
     cost: float
+    # Number of responses served from the LLM response cache (not included in the cost)
+    cache_hits: int = 0
@@ -1,25 +1,28 @@
 import json
 from pathlib import Path
 import os
-import yaml
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 
 from rich import print
-from litellm import completion
-from litellm.types.utils import ModelResponse, Choices
 
 
 from chat_checker.data_management.storage_manager import load_user_personas
 from chat_checker.models.chatbot import Chatbot
 from chat_checker.models.user_personas import GeneratedPersonas, Persona, PersonaType
-from chat_checker.utils.llm_utils import supports_structured_outputs, DEFAULT_LLM
-from chat_checker.utils.misc_utils import get_matching_api_key
+from chat_checker.utils.llm_gateway import completion
+from chat_checker.utils.llm_utils import supports_structured_outputs, get_default_llm
+from chat_checker.utils.misc_utils import load_env_file
 from chat_checker.persona_generation.persona_gen_prompts import (
     standard_persona_description,
     challenging_persona_description,
     adversarial_persona_description,
     persona_generation_prompt,
 )
+from chat_checker.utils import yaml_utils
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
 
 # Build the path to the .env file
 CHAT_CHECKER_BASE_DIR = Path(__file__).parent
@@ -30,10 +33,11 @@ def gen_personas(
     num_personas: int = 1,
     persona_type: PersonaType = PersonaType.STANDARD,
     start_num=1,
-    model: str = DEFAULT_LLM,
+    model: Optional[str] = None,
     seed: Optional[int] = None,
     save_prompt: bool = True,
 ) -> List[Persona]:
+    model = model or get_default_llm()
     assert supports_structured_outputs(model)
 
     persona_type_description = ""
@@ -64,14 +68,15 @@ def gen_personas(
         ) as f:
             f.write(prompt)
 
-    response: ModelResponse = completion(
+    response: "ModelResponse" = completion(
         model=model,
         messages=[{"role": "user", "content": prompt}],
         response_format=GeneratedPersonas,
         seed=seed,
-        api_key=get_matching_api_key(model).get_secret_value(),
-        drop_params=True,
+        use_cache=True,
     )
+    from litellm.types.utils import Choices, ModelResponse
+
     # for type-checking
     assert isinstance(response, ModelResponse)
     assert isinstance(response.choices[0], Choices)
@@ -112,6 +117,7 @@ def run(
     seed: Optional[int] = None,
     save_prompt: bool = True,
 ):
+    load_env_file()
     existing_personas = load_user_personas(chatbot)
     existing_generated_personas_of_type = [
         persona
@@ -130,7 +136,7 @@ def run(
         f"Generating {num_personas} {persona_type} personas for chatbot {chatbot.id}..."
     )
 
-    model = os.getenv("CHAT_CHECKER_PERSONA_GEN_LLM", DEFAULT_LLM)
+    model = os.getenv("CHAT_CHECKER_PERSONA_GEN_LLM", get_default_llm())
     personas = gen_personas(
         chatbot=chatbot,
         num_personas=num_personas,
@@ -149,7 +155,7 @@ def run(
         persona_id = persona.persona_id
         persona_file = persona_dir / f"{persona_id}.yaml"
         with open(persona_file, "w", encoding="utf-8") as f:
-            yaml.safe_dump(
+            yaml_utils.safe_dump(
                 persona.model_dump(), f, indent=4, allow_unicode=True, sort_keys=False
             )
     print("Personas saved successfully")
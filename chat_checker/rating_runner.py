@@ -1,31 +1,69 @@
 import os
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Iterable, Optional, Sized
 from datetime import datetime
 
-import numpy as np
-import yaml
-from lexical_diversity import lex_div
-
-
-from chat_checker.data_management.storage_manager import load_dialogues
+from chat_checker.data_management.storage_manager import (
+    compact_dialogues_logs,
+    get_dialogues_dir,
+    iter_dialogues,
+    load_dialogues,
+    save_dialogue,
+)
 from chat_checker.dialogue_rating.dialogue_rater import (
     get_dialogue_rating,
 )
 from chat_checker.models.chatbot import Chatbot
 from chat_checker.models.dialogue import Dialogue, SpeakerRole
 from chat_checker.models.llm import UsageCost
-from chat_checker.utils.llm_utils import DEFAULT_LLM, compute_total_usage
+from chat_checker.utils.llm_utils import (
+    get_default_llm,
+    compute_total_usage,
+)
 from chat_checker.utils.misc_utils import (
+    TokenIdSequence,
     compute_analysis_cost_statistics,
     five_num_summary,
+    load_env_file,
+    map_in_order,
 )
+from chat_checker.utils import yaml_utils
+
+
+class EvaluationStatsAccumulator:
+    """
+    Running aggregates of the evaluation statistics of a run.
+    Dialogues are added one at a time, so that the run statistics can be computed without holding all dialogues in memory.
+    """
+
+    def __init__(self, chatbot: Chatbot):
+        self.num_dialogues = 0
+        self.ratings: dict[str, list[float]] = {
+            rating_dimension.key: [] for rating_dimension in chatbot.rating_dimensions
+        }
+        # The MTLD is computed over the tokens of all turns, which are kept as compact token ids
+        self.user_turn_tokens = TokenIdSequence()
+        self.chatbot_turn_tokens = TokenIdSequence()
+
+    def add(self, dialogue: Dialogue) -> None:
+        from lexical_diversity import lex_div
+
+        self.num_dialogues += 1
+        if dialogue.ratings:
+            for key, ratings in self.ratings.items():
+                ratings.append(dialogue.ratings[key].rating)
+        for turn in dialogue.chat_history:
+            tokens = lex_div.tokenize(turn.content)
+            if turn.role == SpeakerRole.USER:
+                self.user_turn_tokens.extend(tokens)
+            elif turn.role == SpeakerRole.DIALOGUE_SYSTEM:
+                self.chatbot_turn_tokens.extend(tokens)
 
 
 def compute_run_evaluation_stats(
     analysis_start_time: datetime,
     analysis_end_time: datetime,
-    dialogues: List[Dialogue],
+    run_stats: EvaluationStatsAccumulator,
     total_evaluation_usage: UsageCost,
     chatbot: Chatbot,
     dialogues_dir: Path,
@@ -35,15 +73,13 @@ def compute_run_evaluation_stats(
     dialogue_file_name: Optional[str] = None,
     extra_output_file: bool = False,
 ):
+    import numpy as np
+
     # Compute averages, std and five number summaries for the individual rating_dimensions
     rating_stats = {}
 
     for rating_dimension in chatbot.rating_dimensions:
-        ratings = [
-            dialogue.ratings[rating_dimension.key].rating
-            for dialogue in dialogues
-            if dialogue.ratings
-        ]
+        ratings = run_stats.ratings[rating_dimension.key]
         avg_rating = float(np.mean(ratings))
         std_rating = float(np.std(ratings))
         five_number_summary = five_num_summary(ratings)
@@ -56,28 +92,9 @@ def compute_run_evaluation_stats(
 
         rating_stats[rating_dimension.key] = rating_dimension_stats
 
-    cost_stats = compute_analysis_cost_statistics(dialogues, total_evaluation_usage)
-
-    all_user_turns = [
-        turn
-        for dialogue in dialogues
-        for turn in dialogue.chat_history
-        if turn.role == SpeakerRole.USER
-    ]
-    all_chatbot_turns = [
-        turn
-        for dialogue in dialogues
-        for turn in dialogue.chat_history
-        if turn.role == SpeakerRole.DIALOGUE_SYSTEM
-    ]
-    all_user_turn_tokens = []
-    for turn in all_user_turns:
-        tokens = lex_div.tokenize(turn.content)
-        all_user_turn_tokens.extend(tokens)
-    all_chatbot_turn_tokens = []
-    for turn in all_chatbot_turns:
-        tokens = lex_div.tokenize(turn.content)
-        all_chatbot_turn_tokens.extend(tokens)
+    cost_stats = compute_analysis_cost_statistics(
+        run_stats.num_dialogues, total_evaluation_usage
+    )
 
     evaluation_run_info: dict[str, Any] = {
         "chatbot_id": chatbot.id,
@@ -89,9 +106,9 @@ def compute_run_evaluation_stats(
         "stats": {
             "start_time": analysis_start_time.strftime("%Y-%m-%d %H:%M:%S"),
             "end_time": analysis_end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "n_analyzed_dialogues": len(dialogues),
-            "user_turn_mtld": lex_div.mtld(all_user_turn_tokens),
-            "chatbot_turn_mtld": lex_div.mtld(all_chatbot_turn_tokens),
+            "n_analyzed_dialogues": run_stats.num_dialogues,
+            "user_turn_mtld": run_stats.user_turn_tokens.mtld(),
+            "chatbot_turn_mtld": run_stats.chatbot_turn_tokens.mtld(),
             "rating_stats": rating_stats,
             "cost_stats": cost_stats,
         },
@@ -99,7 +116,7 @@ def compute_run_evaluation_stats(
 
     evaluation_run_info_path = dialogues_dir / "evaluation_stats.yaml"
     with open(evaluation_run_info_path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(
+        yaml_utils.safe_dump(
             evaluation_run_info, f, indent=4, sort_keys=False, allow_unicode=True
         )
     print(f"Aggregated statistics saved to {evaluation_run_info_path}")
@@ -108,7 +125,7 @@ def compute_run_evaluation_stats(
 def evaluate_dialogues(
     run_id: str,
     dialogues_dir: Path,
-    dialogues: list[Dialogue],
+    dialogues: Iterable[Dialogue],
     chatbot: Chatbot,
     real_dialogue: bool = False,
     subfolder: Optional[str] = None,
@@ -116,9 +133,11 @@ def evaluate_dialogues(
     save_prompts: bool = False,
     extra_output_file: bool = False,
     stats_only: bool = False,
-    rating_model: str = DEFAULT_LLM,
+    rating_model: Optional[str] = None,
     seed: Optional[int] = None,
+    workers: int = 1,
 ):
+    rating_model = rating_model or get_default_llm()
     if stats_only:
         rating_stats_file = dialogues_dir / "evaluation_stats.yaml"
         if not rating_stats_file.exists():
@@ -126,28 +145,28 @@ def evaluate_dialogues(
                 f"Can not run in stats_only mode, as the file {rating_stats_file} does not exist."
             )
         with open(rating_stats_file, "r", encoding="utf-8") as f:
-            existing_rating_stats = yaml.safe_load(f)
+            existing_rating_stats = yaml_utils.safe_load(f)
 
         analysis_start_time = datetime.strptime(
             existing_rating_stats["stats"]["start_time"],
             "%Y-%m-%d %H:%M:%S",
         )
-        print(f"Recomputing evaluation statistics for {len(dialogues)} dialogues...")
     else:
         analysis_start_time = datetime.now()
-        print(f"Analyzing {len(dialogues)} dialogues...")
-    total_eval_usage = UsageCost(
-        prompt_tokens=0,
-        completion_tokens=0,
-        total_tokens=0,
-        cost=0,
-    )
+    # The number of dialogues is not known in advance when they are streamed
+    num_dialogues = len(dialogues) if isinstance(dialogues, Sized) else None
+    num_dialogues_str = str(num_dialogues) if num_dialogues is not None else "all"
+    if stats_only:
+        print(f"Recomputing evaluation statistics for {num_dialogues_str} dialogues...")
+    else:
+        print(f"Analyzing {num_dialogues_str} dialogues...")
 
-    rated_dialogues = []
-    for i, dialogue in enumerate(dialogues):
-        print(
-            f"Analyzing dialogue {dialogue.dialogue_id} ({i + 1}/{len(dialogues)})..."
-        )
+    def rate_dialogue(
+        indexed_dialogue: tuple[int, Dialogue],
+    ) -> tuple[Dialogue, UsageCost]:
+        i, dialogue = indexed_dialogue
+        progress_str = f"{i + 1}/{num_dialogues}" if num_dialogues else f"{i + 1}"
+        print(f"Analyzing dialogue {dialogue.dialogue_id} ({progress_str})...")
 
         chat_history = dialogue.chat_history
 
@@ -192,33 +211,58 @@ def evaluate_dialogues(
             "cost_stats": eval_usage.model_dump(),
         }
 
+        # The dialogue is saved as soon as it is rated so that a crash does not lose finished ratings
+        output_path = save_dialogue(dialogue, annotated=extra_output_file)
+
+        print(f"Rated dialogue saved to {output_path}")
+        return dialogue, eval_usage
+
+    total_eval_usage = UsageCost(
+        prompt_tokens=0,
+        completion_tokens=0,
+        total_tokens=0,
+        cost=0,
+    )
+
+    def add_to_total_usage(eval_usage: UsageCost) -> None:
         total_eval_usage.prompt_tokens += eval_usage.prompt_tokens
         total_eval_usage.completion_tokens += eval_usage.completion_tokens
         total_eval_usage.total_tokens += eval_usage.total_tokens
         total_eval_usage.cost += eval_usage.cost
-        if extra_output_file:
-            output_path = dialogue.path.parent / f"{dialogue.path.stem}_annotated.yaml"
-        else:
-            output_path = dialogue.path
-        with open(output_path, "w", encoding="utf-8") as f:
-            yaml.safe_dump(
-                dialogue.model_dump(), f, indent=4, sort_keys=False, allow_unicode=True
-            )
+        total_eval_usage.cache_hits += eval_usage.cache_hits
 
-        print(f"Rated dialogue saved to {output_path}")
+    run_stats = EvaluationStatsAccumulator(chatbot)
+    storage_files: set[Path] = set()
+    if workers > 1 and not stats_only:
+        print(f"Rating up to {workers} dialogues concurrently...")
+    # Collecting the results in input order keeps the run statistics and the usage totals deterministic
+    for dialogue, eval_usage in map_in_order(
+        rate_dialogue,
+        enumerate(dialogues),
+        workers=workers if not stats_only else 1,
+    ):
+        add_to_total_usage(eval_usage)
+        run_stats.add(dialogue)
+        if dialogue.storage_file is not None:
+            storage_files.add(dialogue.storage_file)
+
+    if run_stats.num_dialogues == 0:
+        print(f"No dialogues could be analyzed in {dialogues_dir}. Exiting...")
+        return
 
-        rated_dialogues.append(dialogue)
+    # Drop the superseded records of the dialogues stored in JSONL logs
+    compact_dialogues_logs(storage_files)
 
     analysis_end_time = datetime.now()
 
     print(
-        f"Evaluation completed for {len(rated_dialogues)} dialogues. Aggregating statistics..."
+        f"Evaluation completed for {run_stats.num_dialogues} dialogues. Aggregating statistics..."
     )
 
     compute_run_evaluation_stats(
         analysis_start_time,
         analysis_end_time,
-        rated_dialogues,
+        run_stats,
         total_eval_usage,
         chatbot,
         dialogues_dir,
@@ -241,21 +285,41 @@ def run(
     recompute_stats: bool = False,
     save_prompts: bool = True,
     seed: Optional[int] = None,
+    workers: int = 1,
+    load_workers: int = 1,
+    load_in_processes: bool = False,
+    stream: bool = False,
 ):
     if dialogue_file_name and not subfolder:
         raise ValueError(
             "If a dialogue file is specified, a subfolder must also be specified."
         )
+    load_env_file()
 
-    dialogues_dir, dialogues = load_dialogues(
-        chatbot.base_directory, run_id, subfolder, dialogue_file_name, real_dialogue
-    )
-
-    if not dialogues:
-        print(f"No dialogues found to analyze in {dialogues_dir}. Exiting...")
-        return
+    dialogues: Iterable[Dialogue]
+    if stream:
+        # Dialogues are loaded one at a time while they are rated, so memory stays flat for large runs
+        dialogues_dir = get_dialogues_dir(
+            chatbot.base_directory, run_id, subfolder, real_dialogue
+        )
+        dialogues = iter_dialogues(
+            chatbot.base_directory, run_id, subfolder, dialogue_file_name, real_dialogue
+        )
+    else:
+        dialogues_dir, dialogues = load_dialogues(
+            chatbot.base_directory,
+            run_id,
+            subfolder,
+            dialogue_file_name,
+            real_dialogue,
+            workers=load_workers,
+            use_processes=load_in_processes,
+        )
+        if not dialogues:
+            print(f"No dialogues found to analyze in {dialogues_dir}. Exiting...")
+            return
 
-    rating_model = os.getenv("CHAT_CHECKER_DIALOGUE_RATER_LLM", DEFAULT_LLM)
+    rating_model = os.getenv("CHAT_CHECKER_DIALOGUE_RATER_LLM", get_default_llm())
 
     evaluate_dialogues(
         run_id,
@@ -270,4 +334,5 @@ def run(
         stats_only=recompute_stats,
         rating_model=rating_model,
         seed=seed,
+        workers=workers,
     )
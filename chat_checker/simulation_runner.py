@@ -1,17 +1,28 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from importlib.machinery import SourceFileLoader
 import json
 from pathlib import Path
 from datetime import datetime
 import random
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, List, Optional
 import os
+import threading
 from tqdm import tqdm
 
-import yaml
-from litellm.types.utils import ModelResponse
-
-from chat_checker.chatbot_connection.chatbot_client_base import ChatbotClientInterface
-from chat_checker.data_management.storage_manager import load_user_personas
+from chat_checker.chatbot_connection.chatbot_client_base import (
+    AsyncChatbotClientInterface,
+    ChatbotClientInterface,
+    SyncChatbotClientAdapter,
+)
+from chat_checker.data_management.storage_manager import (
+    DIALOGUES_LOG_FILE_NAME,
+    compact_dialogues_logs,
+    get_dialogue_path,
+    load_dialogues,
+    load_user_personas,
+    save_dialogue,
+)
 from chat_checker.models.breakdowns import (
     BreakdownAnnotation,
     BreakdownDecision,
@@ -20,6 +31,7 @@ from chat_checker.models.breakdowns import (
 from chat_checker.models.chatbot import Chatbot, ChatbotType
 from chat_checker.models.dialogue import (
     Dialogue,
+    DialogueStorageFormat,
     DialogueTurn,
     FinishReason,
     SpeakerRole,
@@ -32,6 +44,7 @@ from chat_checker.user_simulation.autotod_multiwoz_simulator import (
 )
 from chat_checker.user_simulation.user_simulator_base import (
     UserSimulatorBase,
+    UserSimulatorResponse,
 )
 from chat_checker.user_simulation.persona_simulator.persona_simulator import (
     PersonaSimulator,
@@ -39,17 +52,167 @@ from chat_checker.user_simulation.persona_simulator.persona_simulator import (
 from chat_checker.user_simulation.test_user_simulator.test_user_simulator import (
     TestUserSimulator,
 )
-from chat_checker.utils.llm_utils import compute_total_usage, DEFAULT_LLM
+from chat_checker.utils.llm_utils import compute_total_usage, get_default_llm
 from chat_checker.utils.misc_utils import (
     compute_run_statistics,
     compute_chat_statistics,
+    load_env_file,
 )
 from chat_checker.breakdown_detection.breakdown_taxonomy import breakdown_taxonomy
 from chat_checker.utils.prompt_utils import generate_chat_history_str
+from chat_checker.utils import yaml_utils
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
 
 BASE_DIR = Path(__file__).parent
 
 DEFAULT_MAX_USER_TURNS = 10
+RUN_INFO_FILE_NAME = "simulation_run_info.yaml"
+
+PERSONA_USER_TYPES = [
+    UserType.STANDARD_PERSONAS,
+    UserType.CHALLENGING_PERSONAS,
+    UserType.ADVERSARIAL_PERSONAS,
+    UserType.ALL_PERSONAS,
+]
+
+
+def _save_simulation_prompt(
+    dialogue_base_dir: Path,
+    run_number: int,
+    turn_id: int,
+    simulator_response: UserSimulatorResponse,
+) -> None:
+    prompt_dir = f"{dialogue_base_dir}/simulation_prompts/run_{run_number}"
+    os.makedirs(prompt_dir, exist_ok=True)
+    prompt_str = ""
+    if simulator_response.prompt_messages:
+        for message in simulator_response.prompt_messages:
+            prompt_str += f"{message['role']}: {message['content']}\n\n"
+    else:
+        prompt_str = "No prompt messages."
+    with open(f"{prompt_dir}/turn_{turn_id}_prompt.txt", "w+", encoding="utf-8") as f:
+        f.write(prompt_str)
+
+
+def _add_simulation_usage(
+    total_simulation_usage: UsageCost, model_response: "ModelResponse"
+) -> None:
+    usage = compute_total_usage([model_response])
+    total_simulation_usage.prompt_tokens += usage.prompt_tokens
+    total_simulation_usage.completion_tokens += usage.completion_tokens
+    total_simulation_usage.total_tokens += usage.prompt_tokens + usage.completion_tokens
+    total_simulation_usage.cost += usage.cost
+
+
+def _create_chatbot_error_turn(
+    turn_id: int, chatbot_response: str, error: Optional[str]
+) -> DialogueTurn:
+    return DialogueTurn(
+        turn_id=turn_id,
+        role=SpeakerRole.DIALOGUE_SYSTEM,
+        content=chatbot_response,
+        breakdown_annotation=BreakdownAnnotation(
+            reasoning=f"Received error: {error}",
+            score=0,
+            decision=BreakdownDecision.BREAKDOWN,
+            breakdown_types=["Chatbot Crash"],
+        ),
+    )
+
+
+def _print_finish_reason(finish_reason: Optional[FinishReason]) -> FinishReason:
+    print("--- Conversation End ---")
+    if finish_reason == FinishReason.CHATBOT_ENDED:
+        print("# Conversation ended by chatbot.")
+    elif finish_reason == FinishReason.USER_ENDED:
+        print("# Conversation ended by user.")
+    elif finish_reason == FinishReason.USER_SIMULATOR_ERROR:
+        print("# Conversation ended due to an error in the user simulator.")
+    elif finish_reason == FinishReason.CHATBOT_ERROR:
+        print("# Conversation ended due to an error in the chatbot.")
+    else:
+        finish_reason = FinishReason.MAX_TURNS_REACHED
+        print("# Conversation ended. Maximum number of user messages reached.")
+    return finish_reason
+
+
+def _save_simulated_dialogue(
+    user_name: str,
+    dialogue_base_dir: Path,
+    run_number: int,
+    chat_history: list[DialogueTurn],
+    finish_reason: FinishReason,
+    error: Optional[str],
+    start_time: datetime,
+    end_time: datetime,
+    total_simulation_usage: UsageCost,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+) -> Dialogue:
+    chat_stats = compute_chat_statistics(chat_history)
+
+    chat_stats = {
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "duration": (end_time - start_time).total_seconds(),
+        **chat_stats,
+    }
+
+    cost_stats = {
+        "total_prompt_tokens": total_simulation_usage.prompt_tokens,
+        "total_completion_tokens": total_simulation_usage.completion_tokens,
+        "total_tokens": total_simulation_usage.total_tokens,
+        "cost": total_simulation_usage.cost,
+    }
+
+    dialogue_file_name = f"dialogue_{run_number}"
+    dialogue_id = f"{user_name}_dialogue_{run_number}"
+    os.makedirs(dialogue_base_dir, exist_ok=True)
+    if storage_format == DialogueStorageFormat.YAML:
+        # Write the dialogue to a text file for reading alongside the yaml file
+        dialogue_text_file = f"{dialogue_base_dir}/{dialogue_file_name}.txt"
+        dialogue_str = generate_chat_history_str(
+            chat_history, user_tag="USER", chatbot_tag="CHATBOT"
+        )
+        with open(dialogue_text_file, "w", encoding="utf-8") as file:
+            file.write("Chat history:\n")
+            file.write(dialogue_str)
+            file.write(f"\n\n# Finish reason: {finish_reason}")
+            file.write("\n\n")
+
+    dialogue = Dialogue(
+        dialogue_id=dialogue_id,
+        path=get_dialogue_path(dialogue_base_dir, dialogue_file_name, storage_format),
+        # All dialogues of a run share the JSONL log in the run directory
+        storage_file=(
+            dialogue_base_dir.parent / DIALOGUES_LOG_FILE_NAME
+            if storage_format == DialogueStorageFormat.JSONL
+            else None
+        ),
+        user_name=user_name,
+        chat_history=chat_history,
+        finish_reason=finish_reason,
+        error=error,
+        chat_statistics=chat_stats,
+        simulation_cost_statistics=cost_stats,
+    )
+    save_dialogue(dialogue)
+    return dialogue
+
+
+def _get_completed_dialogue(
+    completed_dialogues: Optional[dict[Path, Dialogue]],
+    dialogue_base_dir: Path,
+    run_number: int,
+    storage_format: DialogueStorageFormat,
+) -> Optional[Dialogue]:
+    if not completed_dialogues:
+        return None
+    return completed_dialogues.get(
+        get_dialogue_path(dialogue_base_dir, f"dialogue_{run_number}", storage_format)
+    )
 
 
 def simulate_dialogues(
@@ -62,13 +225,22 @@ def simulate_dialogues(
     max_user_turns: int,
     runs_per_user: int = 1,
     save_prompt=False,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
 ) -> list[Dialogue]:
     dialogues: list[Dialogue] = []
     for i in range(runs_per_user):
+        completed_dialogue = _get_completed_dialogue(
+            completed_dialogues, dialogue_base_dir, i + 1, storage_format
+        )
+        if completed_dialogue is not None:
+            print(f"Run {i + 1}/{runs_per_user} was already completed, skipping it")
+            dialogues.append(completed_dialogue)
+            continue
         print(f"Run {i + 1}/{runs_per_user}")
         start_time = datetime.now()
         chat_history: list[DialogueTurn] = []
-        model_responses: list[ModelResponse] = []
+        model_responses: list["ModelResponse"] = []
         user_simulator.set_up_session(**user_simulator_setup_kwargs)
         first_chatbot_message = chatbot_client.set_up_chat()
         print("--- Conversation Start ---")
@@ -102,27 +274,14 @@ def simulate_dialogues(
             turn_id = turn_id + 1
             print(f"{turn_id}. USER: {simulator_response.response_message}")
             if save_prompt:
-                prompt_dir = f"{dialogue_base_dir}/simulation_prompts/run_{i + 1}"
-                os.makedirs(prompt_dir, exist_ok=True)
-                prompt_str = ""
-                if simulator_response.prompt_messages:
-                    for message in simulator_response.prompt_messages:
-                        prompt_str += f"{message['role']}: {message['content']}\n\n"
-                else:
-                    prompt_str = "No prompt messages."
-                with open(
-                    f"{prompt_dir}/turn_{turn_id}_prompt.txt", "w+", encoding="utf-8"
-                ) as f:
-                    f.write(prompt_str)
+                _save_simulation_prompt(
+                    dialogue_base_dir, i + 1, turn_id, simulator_response
+                )
             if simulator_response.model_response is not None:
                 model_responses.append(simulator_response.model_response)
-                usage = compute_total_usage([simulator_response.model_response])
-                total_simulation_usage.prompt_tokens += usage.prompt_tokens
-                total_simulation_usage.completion_tokens += usage.completion_tokens
-                total_simulation_usage.total_tokens += (
-                    usage.prompt_tokens + usage.completion_tokens
+                _add_simulation_usage(
+                    total_simulation_usage, simulator_response.model_response
                 )
-                total_simulation_usage.cost += usage.cost
             user_ended_conversation = simulator_response.is_end
             user_message_empty = (
                 simulator_response.response_message is None
@@ -150,18 +309,9 @@ def simulate_dialogues(
 
             turn_id = turn_id + 1
             if finish_reason == FinishReason.CHATBOT_ERROR:
-                error_chatbot_turn = DialogueTurn(
-                    turn_id=turn_id,
-                    role=SpeakerRole.DIALOGUE_SYSTEM,
-                    content=chatbot_response,
-                    breakdown_annotation=BreakdownAnnotation(
-                        reasoning=f"Received error: {error}",
-                        score=0,
-                        decision=BreakdownDecision.BREAKDOWN,
-                        breakdown_types=["Chatbot Crash"],
-                    ),
+                chat_history.append(
+                    _create_chatbot_error_turn(turn_id, chatbot_response, error)
                 )
-                chat_history.append(error_chatbot_turn)
                 break
             else:
                 chatbot_turn = DialogueTurn(
@@ -175,73 +325,163 @@ def simulate_dialogues(
                 finish_reason = FinishReason.CHATBOT_ENDED
                 break
         end_time = datetime.now()
-        print("--- Conversation End ---")
-        if finish_reason == FinishReason.CHATBOT_ENDED:
-            print("# Conversation ended by chatbot.")
-        elif finish_reason == FinishReason.USER_ENDED:
-            print("# Conversation ended by user.")
-        elif finish_reason == FinishReason.USER_SIMULATOR_ERROR:
-            print("# Conversation ended due to an error in the user simulator.")
-        elif finish_reason == FinishReason.CHATBOT_ERROR:
-            print("# Conversation ended due to an error in the chatbot.")
-        else:
-            finish_reason = FinishReason.MAX_TURNS_REACHED
-            print("# Conversation ended. Maximum number of user messages reached.")
+        finish_reason = _print_finish_reason(finish_reason)
         chatbot_client.tear_down_chat()
         user_simulator.tear_down_session()
 
-        chat_stats = compute_chat_statistics(chat_history)
+        dialogue = _save_simulated_dialogue(
+            user_name,
+            dialogue_base_dir,
+            i + 1,
+            chat_history,
+            finish_reason,
+            error,
+            start_time,
+            end_time,
+            total_simulation_usage,
+            storage_format=storage_format,
+        )
+        dialogues.append(dialogue)
+    return dialogues
 
-        chat_stats = {
-            "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            "duration": (end_time - start_time).total_seconds(),
-            **chat_stats,
-        }
 
-        cost_stats = {
-            "total_prompt_tokens": total_simulation_usage.prompt_tokens,
-            "total_completion_tokens": total_simulation_usage.completion_tokens,
-            "total_tokens": total_simulation_usage.total_tokens,
-            "cost": total_simulation_usage.cost,
-        }
+async def asimulate_dialogues(
+    run_id: str,
+    user_name: str,
+    dialogue_base_dir: Path,
+    chatbot_client: AsyncChatbotClientInterface,
+    user_simulator: UserSimulatorBase,
+    user_simulator_setup_kwargs: dict,
+    max_user_turns: int,
+    runs_per_user: int = 1,
+    save_prompt=False,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
+) -> list[Dialogue]:
+    """Asyncio version of simulate_dialogues.
 
-        # Write the dialogue to a text file
-        dialogue_file_name = f"dialogue_{i + 1}"
-        dialogue_id = f"{user_name}_dialogue_{i + 1}"
-        os.makedirs(dialogue_base_dir, exist_ok=True)
-        dialogue_text_file = f"{dialogue_base_dir}/{dialogue_file_name}.txt"
-        dialogue_str = generate_chat_history_str(
-            chat_history, user_tag="USER", chatbot_tag="CHATBOT"
+    The runs of one user are simulated one after another, but many of these coroutines can be driven concurrently on a single event loop.
+    """
+    dialogues: list[Dialogue] = []
+    for i in range(runs_per_user):
+        completed_dialogue = _get_completed_dialogue(
+            completed_dialogues, dialogue_base_dir, i + 1, storage_format
         )
-        with open(dialogue_text_file, "w", encoding="utf-8") as file:
-            file.write("Chat history:\n")
-            file.write(dialogue_str)
-            file.write(f"\n\n# Finish reason: {finish_reason}")
-            file.write("\n\n")
-
-        # Write dialogue to a yaml file
-        dialogue_yaml = dialogue_base_dir / f"{dialogue_file_name}.yaml"
-        dialogue = Dialogue(
-            dialogue_id=dialogue_id,
-            path=dialogue_yaml,
-            user_name=user_name,
-            chat_history=chat_history,
-            finish_reason=finish_reason,
-            error=error,
-            chat_statistics=chat_stats,
-            simulation_cost_statistics=cost_stats,
+        if completed_dialogue is not None:
+            print(
+                f"[{user_name}] Run {i + 1}/{runs_per_user} was already completed, skipping it"
+            )
+            dialogues.append(completed_dialogue)
+            continue
+        print(f"[{user_name}] Run {i + 1}/{runs_per_user}")
+        start_time = datetime.now()
+        chat_history: list[DialogueTurn] = []
+        await user_simulator.aset_up_session(**user_simulator_setup_kwargs)
+        first_chatbot_message = await chatbot_client.set_up_chat()
+        if first_chatbot_message:
+            turn_id = 1
+            first_turn = DialogueTurn(
+                turn_id=turn_id,
+                role=SpeakerRole.DIALOGUE_SYSTEM,
+                content=first_chatbot_message,
+            )
+            chat_history.append(first_turn)
+            print(f"[{user_name}] {turn_id}. Chatbot: {first_chatbot_message}")
+        else:
+            turn_id = 0
+        total_simulation_usage = UsageCost(
+            prompt_tokens=0,
+            completion_tokens=0,
+            total_tokens=0,
+            cost=0.0,
         )
-
-        with open(dialogue_yaml, "w", encoding="utf-8") as file:
-            yaml.safe_dump(
-                dialogue.model_dump(),
-                file,
-                indent=4,
-                sort_keys=False,
-                allow_unicode=True,
+        finish_reason = None
+        error = None
+        for _ in range(max_user_turns):
+            try:
+                simulator_response = await user_simulator.agenerate_response(
+                    chat_history
+                )
+            except Exception as e:
+                print(f"[{user_name}] Error in getting simulated response: {e}")
+                finish_reason = FinishReason.USER_SIMULATOR_ERROR
+                error = str(e)
+                break
+            turn_id = turn_id + 1
+            print(
+                f"[{user_name}] {turn_id}. USER: {simulator_response.response_message}"
             )
+            if save_prompt:
+                _save_simulation_prompt(
+                    dialogue_base_dir, i + 1, turn_id, simulator_response
+                )
+            if simulator_response.model_response is not None:
+                _add_simulation_usage(
+                    total_simulation_usage, simulator_response.model_response
+                )
+            user_ended_conversation = simulator_response.is_end
+            user_message_empty = (
+                simulator_response.response_message is None
+                or simulator_response.response_message == ""
+            )
+            if not user_message_empty:
+                user_simulator_turn = DialogueTurn(
+                    turn_id=turn_id,
+                    role=SpeakerRole.USER,
+                    content=simulator_response.response_message,
+                )
+                chat_history.append(user_simulator_turn)
+            if user_ended_conversation or user_message_empty:
+                finish_reason = FinishReason.USER_ENDED
+                break
+            try:
+                (
+                    chatbot_response,
+                    chatbot_ended_conversation,
+                ) = await chatbot_client.get_response(
+                    simulator_response.response_message
+                )
+            except Exception as e:
+                print(f"[{user_name}] Error in getting chatbot response: {e}")
+                finish_reason = FinishReason.CHATBOT_ERROR
+                error = str(e)
+                chatbot_response = finish_reason
+
+            turn_id = turn_id + 1
+            if finish_reason == FinishReason.CHATBOT_ERROR:
+                chat_history.append(
+                    _create_chatbot_error_turn(turn_id, chatbot_response, error)
+                )
+                break
+            else:
+                chatbot_turn = DialogueTurn(
+                    turn_id=turn_id,
+                    role=SpeakerRole.DIALOGUE_SYSTEM,
+                    content=chatbot_response,
+                )
+                chat_history.append(chatbot_turn)
+            print(f"[{user_name}] {turn_id}. CHATBOT: {chatbot_response}")
+            if chatbot_ended_conversation:
+                finish_reason = FinishReason.CHATBOT_ENDED
+                break
+        end_time = datetime.now()
+        print(f"[{user_name}] Run {i + 1}/{runs_per_user}:")
+        finish_reason = _print_finish_reason(finish_reason)
+        await chatbot_client.tear_down_chat()
+        await user_simulator.atear_down_session()
 
+        dialogue = _save_simulated_dialogue(
+            user_name,
+            dialogue_base_dir,
+            i + 1,
+            chat_history,
+            finish_reason,
+            error,
+            start_time,
+            end_time,
+            total_simulation_usage,
+            storage_format=storage_format,
+        )
         dialogues.append(dialogue)
     return dialogues
 
@@ -254,6 +494,8 @@ def run_autotod_multiwoz_simulator(
     n_dialogues: int,
     seed: Optional[int] = None,
     runs_per_user=1,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
 ) -> list[Dialogue]:
     print(
         f"Simulating {n_dialogues} dialogues with AutoTOD simulator for chatbot {chatbot.id}..."
@@ -266,6 +508,20 @@ def run_autotod_multiwoz_simulator(
     if seed is not None:
         random.seed(seed)
     sampled_dialogue_ids = random.sample(mwoz_dialogue_ids, n_dialogues)
+    started_dialogue_ids = _load_started_mwoz_dialogue_ids(run_base_dir)
+    if started_dialogue_ids:
+        # A resumed run keeps the scenarios of the slots that were already started (a new sample differs without a seed)
+        unused_dialogue_ids = (
+            dialogue_id
+            for dialogue_id in mwoz_dialogue_ids
+            if dialogue_id not in started_dialogue_ids.values()
+            and dialogue_id not in sampled_dialogue_ids
+        )
+        for i, dialogue_id in enumerate(sampled_dialogue_ids):
+            if i + 1 in started_dialogue_ids:
+                sampled_dialogue_ids[i] = started_dialogue_ids[i + 1]
+            elif dialogue_id in started_dialogue_ids.values():
+                sampled_dialogue_ids[i] = next(unused_dialogue_ids)
 
     all_simulated_dialogues = []
     for i, mwoz_dialogue_id in tqdm(enumerate(sampled_dialogue_ids)):
@@ -285,7 +541,9 @@ def run_autotod_multiwoz_simulator(
         }
         user_info_file = f"{dialogue_base_dir}/user_info.yaml"
         with open(user_info_file, "w", encoding="utf-8") as f:
-            yaml.safe_dump(user_info, f, indent=4, sort_keys=False, allow_unicode=True)
+            yaml_utils.safe_dump(
+                user_info, f, indent=4, sort_keys=False, allow_unicode=True
+            )
 
         user_simulator = AutotodMultiwozSimulator(
             multiwoz_dialogue_id=mwoz_dialogue_id, seed=seed
@@ -301,11 +559,43 @@ def run_autotod_multiwoz_simulator(
             max_user_turns=max_user_turns,
             runs_per_user=runs_per_user,
             save_prompt=False,
+            storage_format=storage_format,
+            completed_dialogues=completed_dialogues,
         )
         all_simulated_dialogues.extend(dialogues)
     return all_simulated_dialogues
 
 
+def _load_started_mwoz_dialogue_ids(run_base_dir: Path) -> dict[int, str]:
+    """Map the number of every AutoTOD dialogue slot that was already started in the run to its MultiWOZ dialogue ID."""
+    started_dialogue_ids: dict[int, str] = {}
+    for user_info_file in run_base_dir.glob("*_autotod_mwoz_*/user_info.yaml"):
+        with open(user_info_file, "r", encoding="utf-8") as f:
+            user_info = yaml_utils.safe_load(f)
+        dialogue_num = int(user_info_file.parent.name.split("_")[0])
+        started_dialogue_ids[dialogue_num] = user_info["mwoz_dialogue_id"]
+    return started_dialogue_ids
+
+
+def _get_tester_user_name(
+    run_base_dir: Path, breakdown_key: str, full_breakdown_key: str
+) -> str:
+    tester_dirs = sorted(
+        d for d in run_base_dir.iterdir() if d.is_dir() and d.name.endswith("_tester")
+    )
+    for tester_dir in tester_dirs:
+        tester_info_file = tester_dir / "info.yaml"
+        if not tester_info_file.exists():
+            continue
+        with open(tester_info_file, "r", encoding="utf-8") as f:
+            tester_info = yaml_utils.safe_load(f)
+        if tester_info.get("breakdown_key") == full_breakdown_key:
+            # The breakdown was already tested before the run was resumed
+            return tester_dir.name
+    # Number the testers in the order they are simulated, formatted with 2 digits
+    return f"{len(tester_dirs) + 1:02}_{breakdown_key}_tester"
+
+
 def simulate_testers(
     run_id: str,
     chatbot: Chatbot,
@@ -316,8 +606,10 @@ def simulate_testers(
     max_user_turn_length: Optional[str] = None,
     runs_per_breakdown=1,
     save_prompt=False,
-    user_simulator_llm: str = DEFAULT_LLM,
+    user_simulator_llm: Optional[str] = None,
     seed: Optional[int] = None,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
 ) -> List[Dialogue]:
     run_base_dir = chatbot.base_directory / "runs" / run_id
     keys = breakdowns_to_test.split(".") if breakdowns_to_test != "" else []
@@ -358,21 +650,14 @@ def simulate_testers(
                 save_prompt=save_prompt,
                 user_simulator_llm=user_simulator_llm,
                 seed=seed,
+                storage_format=storage_format,
+                completed_dialogues=completed_dialogues,
             )
             all_simulated_dialogues.extend(dialogues)
         elif type(bd) is BreakdownDescription:
             print(f"Simulating testers for breakdown: {bd.title}")
             full_breakdown_key = breakdowns_to_test + "." + key
-            # Determine the number of tester directories already present in the run directory
-            tester_dirs = [
-                d
-                for d in os.listdir(run_base_dir.as_posix())
-                if os.path.isdir(f"{run_base_dir}/{d}") and d.endswith("_tester")
-            ]
-            tester_number = len(tester_dirs) + 1
-            # Format the tester number to have 2 digits
-            tester_number_str = f"{tester_number:02}"
-            user_name = f"{tester_number_str}_{key}_tester"
+            user_name = _get_tester_user_name(run_base_dir, key, full_breakdown_key)
             dialogue_base_dir = run_base_dir / user_name
             os.makedirs(dialogue_base_dir, exist_ok=True)
             tester_instructions = bd.tester_instructions
@@ -387,7 +672,7 @@ def simulate_testers(
             }
             tester_info_file = f"{dialogue_base_dir}/info.yaml"
             with open(tester_info_file, "w", encoding="utf-8") as f:
-                yaml.safe_dump(
+                yaml_utils.safe_dump(
                     tester_info, f, indent=4, sort_keys=False, allow_unicode=True
                 )
 
@@ -411,25 +696,16 @@ def simulate_testers(
                 max_user_turns,
                 runs_per_user=runs_per_breakdown,
                 save_prompt=save_prompt,
+                storage_format=storage_format,
+                completed_dialogues=completed_dialogues,
             )
             all_simulated_dialogues.extend(dialogues)
     return all_simulated_dialogues
 
 
-def simulate_user_personas(
-    run_id: str,
-    chatbot: Chatbot,
-    chatbot_client: ChatbotClientInterface,
-    user_type: UserType,
-    persona_id: Optional[str],
-    max_user_messages: int,
-    typical_user_turn_length: Optional[str] = None,
-    max_user_turn_length: Optional[str] = None,
-    runs_per_persona: int = 1,
-    save_prompt=False,
-    user_simulator_llm: str = DEFAULT_LLM,
-    seed: Optional[int] = None,
-) -> List[Dialogue]:
+def select_personas_to_simulate(
+    chatbot: Chatbot, user_type: UserType, persona_id: Optional[str]
+) -> list[Persona]:
     available_user_personas = load_user_personas(chatbot)
     print(f"Available user personas: {available_user_personas}")
 
@@ -466,59 +742,269 @@ def simulate_user_personas(
         else:
             error_str = f"User type {user_type} not recognized."
             raise ValueError(error_str)
+    return personas_to_simulate
+
+
+def _prepare_persona_simulation(
+    run_id: str,
+    chatbot: Chatbot,
+    user_persona: Persona,
+    typical_user_turn_length: Optional[str] = None,
+    max_user_turn_length: Optional[str] = None,
+    user_simulator_llm: Optional[str] = None,
+    seed: Optional[int] = None,
+) -> tuple[Path, PersonaSimulator]:
+    current_persona_id: str = user_persona.persona_id
+    print(f"Simulating user persona: {current_persona_id}")
+    print(
+        yaml_utils.safe_dump(
+            user_persona.model_dump(),
+            indent=4,
+            sort_keys=False,
+            allow_unicode=True,
+        )
+    )
+    dialogue_base_dir = chatbot.base_directory / "runs" / run_id / current_persona_id
+    os.makedirs(dialogue_base_dir, exist_ok=True)
+    # Store persona info in a yaml file
+    persona_info_file = f"{dialogue_base_dir}/persona_info.yaml"
+    persona_info = {"run_id": run_id, "persona": user_persona.model_dump()}
+    with open(persona_info_file, "w", encoding="utf-8") as f:
+        yaml_utils.safe_dump(
+            persona_info, f, indent=4, sort_keys=False, allow_unicode=True
+        )
+
+    # Each persona gets its own simulator instance as simulators hold per-session state
+    user_simulator = PersonaSimulator(
+        user_persona,
+        chatbot.info,
+        model=user_simulator_llm,
+        typical_user_turn_length=typical_user_turn_length,
+        max_user_turn_length=max_user_turn_length,
+        seed=seed,
+    )
+    return dialogue_base_dir, user_simulator
+
+
+def simulate_user_persona(
+    run_id: str,
+    chatbot: Chatbot,
+    chatbot_client: ChatbotClientInterface,
+    user_persona: Persona,
+    max_user_messages: int,
+    typical_user_turn_length: Optional[str] = None,
+    max_user_turn_length: Optional[str] = None,
+    runs_per_persona: int = 1,
+    save_prompt=False,
+    user_simulator_llm: Optional[str] = None,
+    seed: Optional[int] = None,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
+) -> List[Dialogue]:
+    dialogue_base_dir, user_simulator = _prepare_persona_simulation(
+        run_id,
+        chatbot,
+        user_persona,
+        typical_user_turn_length=typical_user_turn_length,
+        max_user_turn_length=max_user_turn_length,
+        user_simulator_llm=user_simulator_llm,
+        seed=seed,
+    )
+    user_simulator_setup_kwargs: dict = {}
+
+    return simulate_dialogues(
+        run_id,
+        user_persona.persona_id,
+        dialogue_base_dir,
+        chatbot_client,
+        user_simulator,
+        user_simulator_setup_kwargs,
+        max_user_messages,
+        runs_per_user=runs_per_persona,
+        save_prompt=save_prompt,
+        storage_format=storage_format,
+        completed_dialogues=completed_dialogues,
+    )
+
+
+def simulate_user_personas(
+    run_id: str,
+    chatbot: Chatbot,
+    chatbot_client: ChatbotClientInterface,
+    user_type: UserType,
+    persona_id: Optional[str],
+    max_user_messages: int,
+    typical_user_turn_length: Optional[str] = None,
+    max_user_turn_length: Optional[str] = None,
+    runs_per_persona: int = 1,
+    save_prompt=False,
+    user_simulator_llm: Optional[str] = None,
+    seed: Optional[int] = None,
+    chatbot_client_factory: Optional[Callable[[], ChatbotClientInterface]] = None,
+    concurrency: int = 1,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
+) -> List[Dialogue]:
+    personas_to_simulate = select_personas_to_simulate(chatbot, user_type, persona_id)
 
     print(
         f"Simulating {len(personas_to_simulate)} user personas for chatbot {chatbot.id}..."
     )
-    all_simulated_dialogues = []
-    for user_persona in tqdm(personas_to_simulate):
-        current_persona_id: str = user_persona.persona_id
-        print(f"Simulating user persona: {current_persona_id}")
-        print(
-            yaml.safe_dump(
-                user_persona.model_dump(),
-                indent=4,
-                sort_keys=False,
-                allow_unicode=True,
+    if concurrency <= 1:
+        all_simulated_dialogues = []
+        for user_persona in tqdm(personas_to_simulate):
+            dialogues = simulate_user_persona(
+                run_id,
+                chatbot,
+                chatbot_client,
+                user_persona,
+                max_user_messages,
+                typical_user_turn_length=typical_user_turn_length,
+                max_user_turn_length=max_user_turn_length,
+                runs_per_persona=runs_per_persona,
+                save_prompt=save_prompt,
+                user_simulator_llm=user_simulator_llm,
+                seed=seed,
+                storage_format=storage_format,
+                completed_dialogues=completed_dialogues,
             )
+            all_simulated_dialogues.extend(dialogues)
+        return all_simulated_dialogues
+
+    if chatbot_client_factory is None:
+        raise ValueError(
+            "A chatbot client factory is required to simulate personas concurrently."
         )
-        dialogue_base_dir = (
-            chatbot.base_directory / "runs" / run_id / current_persona_id
-        )
-        os.makedirs(dialogue_base_dir, exist_ok=True)
-        # Store persona info in a yaml file
-        persona_info_file = f"{dialogue_base_dir}/persona_info.yaml"
-        persona_info = {"run_id": run_id, "persona": user_persona.model_dump()}
-        with open(persona_info_file, "w", encoding="utf-8") as f:
-            yaml.safe_dump(
-                persona_info, f, indent=4, sort_keys=False, allow_unicode=True
-            )
+    # Each worker thread lazily creates its own chatbot client so that chat sessions are never shared between threads
+    worker_state = threading.local()
+    # The clients of all workers, closed when the pool exits
+    worker_chatbot_clients: list[ChatbotClientInterface] = []
+    worker_chatbot_clients_lock = threading.Lock()
 
-        user_simulator = PersonaSimulator(
+    def simulate_persona_in_worker(user_persona: Persona) -> list[Dialogue]:
+        if not hasattr(worker_state, "chatbot_client"):
+            worker_state.chatbot_client = chatbot_client_factory()
+            with worker_chatbot_clients_lock:
+                worker_chatbot_clients.append(worker_state.chatbot_client)
+        return simulate_user_persona(
+            run_id,
+            chatbot,
+            worker_state.chatbot_client,
             user_persona,
-            chatbot.info,
-            model=user_simulator_llm,
+            max_user_messages,
             typical_user_turn_length=typical_user_turn_length,
             max_user_turn_length=max_user_turn_length,
+            runs_per_persona=runs_per_persona,
+            save_prompt=save_prompt,
+            user_simulator_llm=user_simulator_llm,
             seed=seed,
+            storage_format=storage_format,
+            completed_dialogues=completed_dialogues,
         )
-        user_simulator_setup_kwargs: dict = {}
 
-        dialogues = simulate_dialogues(
-            run_id,
-            current_persona_id,
-            dialogue_base_dir,
-            chatbot_client,
-            user_simulator,
-            user_simulator_setup_kwargs,
-            max_user_messages,
-            runs_per_user=runs_per_persona,
-            save_prompt=save_prompt,
-        )
-        all_simulated_dialogues.extend(dialogues)
+    print(f"Running {concurrency} persona simulations concurrently...")
+    all_simulated_dialogues = []
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            # executor.map preserves the persona order, so the run statistics are the same as in sequential mode
+            for dialogues in tqdm(
+                executor.map(simulate_persona_in_worker, personas_to_simulate),
+                total=len(personas_to_simulate),
+            ):
+                all_simulated_dialogues.extend(dialogues)
+    finally:
+        # The pool has exited, so no worker uses its client anymore
+        for worker_chatbot_client in worker_chatbot_clients:
+            worker_chatbot_client.close()
     return all_simulated_dialogues
 
 
+async def asimulate_user_personas(
+    run_id: str,
+    chatbot: Chatbot,
+    chatbot_client_factory: Callable[[], AsyncChatbotClientInterface],
+    user_type: UserType,
+    persona_id: Optional[str],
+    max_user_messages: int,
+    typical_user_turn_length: Optional[str] = None,
+    max_user_turn_length: Optional[str] = None,
+    runs_per_persona: int = 1,
+    save_prompt=False,
+    user_simulator_llm: Optional[str] = None,
+    seed: Optional[int] = None,
+    concurrency: int = 1,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None,
+) -> List[Dialogue]:
+    personas_to_simulate = select_personas_to_simulate(chatbot, user_type, persona_id)
+    print(
+        f"Simulating {len(personas_to_simulate)} user personas for chatbot {chatbot.id} on an asyncio event loop (concurrency: {concurrency})..."
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def simulate_persona(user_persona: Persona) -> list[Dialogue]:
+        async with semaphore:
+            dialogue_base_dir, user_simulator = _prepare_persona_simulation(
+                run_id,
+                chatbot,
+                user_persona,
+                typical_user_turn_length=typical_user_turn_length,
+                max_user_turn_length=max_user_turn_length,
+                user_simulator_llm=user_simulator_llm,
+                seed=seed,
+            )
+            # Every dialogue coroutine gets its own chatbot client as clients hold per-chat state
+            chatbot_client = chatbot_client_factory()
+            try:
+                return await asimulate_dialogues(
+                    run_id,
+                    user_persona.persona_id,
+                    dialogue_base_dir,
+                    chatbot_client,
+                    user_simulator,
+                    {},
+                    max_user_messages,
+                    runs_per_user=runs_per_persona,
+                    save_prompt=save_prompt,
+                    storage_format=storage_format,
+                    completed_dialogues=completed_dialogues,
+                )
+            finally:
+                await chatbot_client.aclose()
+
+    # gather returns the results in persona order, so the run statistics match the sequential mode
+    dialogues_per_persona = await asyncio.gather(
+        *[simulate_persona(user_persona) for user_persona in personas_to_simulate]
+    )
+    return [dialogue for dialogues in dialogues_per_persona for dialogue in dialogues]
+
+
+def _load_run_info(chatbot: Chatbot, run_id: str) -> dict:
+    run_info_file = chatbot.base_directory / "runs" / run_id / RUN_INFO_FILE_NAME
+    if not run_info_file.exists():
+        raise ValueError(
+            f"Can not resume run {run_id}: {run_info_file} does not exist."
+        )
+    with open(run_info_file, "r", encoding="utf-8") as f:
+        return yaml_utils.safe_load(f)
+
+
+def _load_completed_dialogues(
+    chatbot: Chatbot, run_id: str, storage_format: DialogueStorageFormat
+) -> dict[Path, Dialogue]:
+    """Load the dialogues that were completed before the run was interrupted, keyed by their path."""
+    if storage_format == DialogueStorageFormat.JSONL:
+        # Drop a record cut off by the interruption, the next record would be appended to it otherwise
+        compact_dialogues_logs(
+            [chatbot.base_directory / "runs" / run_id / DIALOGUES_LOG_FILE_NAME]
+        )
+    try:
+        _, dialogues = load_dialogues(chatbot.base_directory, run_id)
+    except FileNotFoundError:
+        return {}
+    return {dialogue.path: dialogue for dialogue in dialogues}
+
+
 def run(
     chatbot: Chatbot,
     user_type: UserType,
@@ -527,21 +1013,61 @@ def run(
     run_prefix: Optional[str] = None,
     debug=True,
     seed: Optional[int] = None,
+    concurrency: int = 1,
+    use_async: bool = False,
+    storage_format: DialogueStorageFormat = DialogueStorageFormat.YAML,
+    resume_run_id: Optional[str] = None,
 ) -> str:
-    test_run_id = f"{user_type}_{datetime.now().strftime('%Y-%m-%d')}_{datetime.now().strftime('%H-%M-%S')}"
-    if seed is not None:
-        test_run_id += f"_seed_{seed}"
-    if run_prefix:
-        test_run_id = f"{run_prefix}_{test_run_id}"
+    """
+    Simulate the dialogues of a new run or complete an interrupted one.
+
+    Args:
+        resume_run_id (Optional[str]): The ID of an interrupted run to complete instead of starting a new run. The run continues with the settings stored in its run info (user_type, selector, runs_per_user, run_prefix, debug, seed and storage_format are ignored) and only the dialogues that are missing are simulated.
+
+    Returns:
+        str: The ID of the run.
+    """
+    load_env_file()
+    resumed_run_info: Optional[dict] = None
+    if resume_run_id:
+        resumed_run_info = _load_run_info(chatbot, resume_run_id)
+        user_type = UserType(resumed_run_info["user_type"])
+        selector = resumed_run_info["selector"]
+        runs_per_user = resumed_run_info["runs_per_user"]
+        debug = resumed_run_info["debug"]
+        seed = resumed_run_info["seed"]
+        # Runs from before the storage formats were introduced are stored as YAML
+        storage_format = DialogueStorageFormat(
+            resumed_run_info.get("storage_format", DialogueStorageFormat.YAML)
+        )
+        test_run_id = resume_run_id
+        print(f"Resuming test run: {test_run_id}")
     else:
-        test_run_id = f"run_{test_run_id}"
-    print(f"Test run ID: {test_run_id}")
+        test_run_id = f"{user_type}_{datetime.now().strftime('%Y-%m-%d')}_{datetime.now().strftime('%H-%M-%S')}"
+        if seed is not None:
+            test_run_id += f"_seed_{seed}"
+        if run_prefix:
+            test_run_id = f"{run_prefix}_{test_run_id}"
+        else:
+            test_run_id = f"run_{test_run_id}"
+        print(f"Test run ID: {test_run_id}")
+    if use_async and user_type not in PERSONA_USER_TYPES:
+        raise ValueError(
+            f"Asyncio simulation is only supported for persona user types, not for {user_type}."
+        )
 
-    typical_user_turn_length = chatbot.user_simulation_config.typical_user_turn_length
-    max_user_turn_length = chatbot.user_simulation_config.max_user_turn_length
-    max_user_turns = (
-        chatbot.user_simulation_config.max_user_turns or DEFAULT_MAX_USER_TURNS
-    )
+    if resumed_run_info is not None:
+        typical_user_turn_length = resumed_run_info["typical_user_turn_length"]
+        max_user_turn_length = resumed_run_info["max_user_turn_length"]
+        max_user_turns = resumed_run_info["max_user_messages"]
+    else:
+        typical_user_turn_length = (
+            chatbot.user_simulation_config.typical_user_turn_length
+        )
+        max_user_turn_length = chatbot.user_simulation_config.max_user_turn_length
+        max_user_turns = (
+            chatbot.user_simulation_config.max_user_turns or DEFAULT_MAX_USER_TURNS
+        )
     print(f"Max user turns set to: {max_user_turns}")
 
     print("Initializing chatbot...")
@@ -549,16 +1075,48 @@ def run(
     client_module = SourceFileLoader(
         "chatbot_client", f"{chatbot.base_directory}/chatbot_client.py"
     ).load_module()
-    chatbot_client: ChatbotClientInterface = client_module.ChatbotClient()
-    chatbot_client.set_up_class()
+    adapter_executor: Optional[ThreadPoolExecutor] = None
+    if use_async:
+        async_chatbot_client_class: Optional[type[AsyncChatbotClientInterface]] = (
+            getattr(client_module, "AsyncChatbotClient", None)
+        )
+        if async_chatbot_client_class is not None:
+            async_chatbot_client_factory: Callable[[], AsyncChatbotClientInterface] = (
+                async_chatbot_client_class
+            )
+            async_chatbot_client_class.set_up_class()
+        else:
+            # Fall back to the synchronous client whose blocking calls are run in a bounded executor
+            print(
+                "No AsyncChatbotClient found, running the synchronous ChatbotClient in a thread pool..."
+            )
+            chatbot_client_class: type[ChatbotClientInterface] = (
+                client_module.ChatbotClient
+            )
+            chatbot_client_class.set_up_class()
+            adapter_executor = ThreadPoolExecutor(max_workers=concurrency)
+
+            def async_chatbot_client_factory() -> AsyncChatbotClientInterface:
+                assert adapter_executor is not None
+                return SyncChatbotClientAdapter(
+                    chatbot_client_class(), adapter_executor
+                )
+    else:
+        chatbot_client_class = client_module.ChatbotClient
+        chatbot_client = chatbot_client_class()
+        chatbot_client.set_up_class()
 
-    if user_type == UserType.AUTOTOD_MULTIWOZ_SCENARIOS:
+    if resumed_run_info is not None:
+        user_simulator_llm = resumed_run_info["user_simulator_llm"]
+    elif user_type == UserType.AUTOTOD_MULTIWOZ_SCENARIOS:
         # For the AutoTOD-SIM we always use gpt-3.5-turbo-1106 based on the usage of gpt-3.5-turbo in the AutoTOD paper (https://github.com/DaDaMrX/AutoTOD)
         user_simulator_llm = "gpt-3.5-turbo-1106"
     else:
-        user_simulator_llm = os.getenv("CHAT_CHECKER_USER_SIMULATOR_LLM", DEFAULT_LLM)
+        user_simulator_llm = os.getenv(
+            "CHAT_CHECKER_USER_SIMULATOR_LLM", get_default_llm()
+        )
 
-    run_info = {
+    run_info = resumed_run_info or {
         "run_id:": test_run_id,
         "chatbot_id": chatbot.id,
         "chatbot_info": chatbot.info.model_dump(),
@@ -571,13 +1129,28 @@ def run(
         "debug": debug,
         "user_simulator_llm": user_simulator_llm,
         "seed": seed,
+        "concurrency": concurrency,
+        "use_async": use_async,
+        "storage_format": storage_format,
     }
+    completed_dialogues: Optional[dict[Path, Dialogue]] = None
+    if resumed_run_info is not None:
+        run_info["resumed_at"] = [
+            *run_info.get("resumed_at", []),
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        ]
+        completed_dialogues = _load_completed_dialogues(
+            chatbot, test_run_id, storage_format
+        )
+        print(
+            f"Found {len(completed_dialogues)} completed dialogues, simulating the missing ones..."
+        )
 
     run_base_dir = chatbot.base_directory / "runs" / test_run_id
     os.makedirs(run_base_dir, exist_ok=True)
-    run_info_file = run_base_dir / "simulation_run_info.yaml"
+    run_info_file = run_base_dir / RUN_INFO_FILE_NAME
     with open(run_info_file, "w", encoding="utf-8") as f:
-        yaml.safe_dump(run_info, f, indent=4, sort_keys=False, allow_unicode=True)
+        yaml_utils.safe_dump(run_info, f, indent=4, sort_keys=False, allow_unicode=True)
     print(f"Run info saved to {run_info_file}")
 
     if user_type == UserType.TESTERS:
@@ -593,6 +1166,8 @@ def run(
             save_prompt=debug,
             user_simulator_llm=user_simulator_llm,
             seed=seed,
+            storage_format=storage_format,
+            completed_dialogues=completed_dialogues,
         )
     elif user_type == UserType.AUTOTOD_MULTIWOZ_SCENARIOS:
         all_simulated_dialogues = run_autotod_multiwoz_simulator(
@@ -603,13 +1178,30 @@ def run(
             n_dialogues=int(selector or 1),
             runs_per_user=runs_per_user,
             seed=seed,
+            storage_format=storage_format,
+            completed_dialogues=completed_dialogues,
         )
-    elif user_type in [
-        UserType.STANDARD_PERSONAS,
-        UserType.CHALLENGING_PERSONAS,
-        UserType.ADVERSARIAL_PERSONAS,
-        UserType.ALL_PERSONAS,
-    ]:
+    elif user_type in PERSONA_USER_TYPES and use_async:
+        all_simulated_dialogues = asyncio.run(
+            asimulate_user_personas(
+                test_run_id,
+                chatbot,
+                async_chatbot_client_factory,
+                user_type,
+                selector or None,
+                max_user_turns,
+                typical_user_turn_length,
+                max_user_turn_length=max_user_turn_length,
+                runs_per_persona=runs_per_user,
+                save_prompt=debug,
+                user_simulator_llm=user_simulator_llm,
+                seed=seed,
+                concurrency=concurrency,
+                storage_format=storage_format,
+                completed_dialogues=completed_dialogues,
+            )
+        )
+    elif user_type in PERSONA_USER_TYPES:
         all_simulated_dialogues = simulate_user_personas(
             test_run_id,
             chatbot,
@@ -623,19 +1215,30 @@ def run(
             save_prompt=debug,
             user_simulator_llm=user_simulator_llm,
             seed=seed,
+            chatbot_client_factory=chatbot_client_class,
+            concurrency=concurrency,
+            storage_format=storage_format,
+            completed_dialogues=completed_dialogues,
         )
     else:
         raise ValueError(f"User type {user_type} not recognized.")
-    chatbot_client.tear_down_class()
+    if use_async and async_chatbot_client_class is not None:
+        async_chatbot_client_class.tear_down_class()
+    else:
+        if not use_async:
+            chatbot_client.close()
+        chatbot_client_class.tear_down_class()
+    if adapter_executor is not None:
+        adapter_executor.shutdown()
 
-    # Compute statistics
+    # Compute statistics (over all dialogues of the run, including the ones completed before a resume)
     run_stats = compute_run_statistics(all_simulated_dialogues)
 
     # Save the run statistics in the run info file
     run_info["chat_statistics"] = run_stats["run_chat_statistics"]
     run_info["simulation_cost_statistics"] = run_stats["run_cost_statistics"]
     with open(run_info_file, "w", encoding="utf-8") as f:
-        yaml.safe_dump(run_info, f, indent=4, sort_keys=False, allow_unicode=True)
+        yaml_utils.safe_dump(run_info, f, indent=4, sort_keys=False, allow_unicode=True)
     print(f"Run stats saved to {run_info_file}")
 
     print(f"Run {test_run_id} completed.")
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, List, Optional
 
 import requests
 
@@ -11,6 +11,9 @@ from chat_checker.user_simulation.simulator_woz_test import (
     chat_with_user_simulator,
 )
 
+if TYPE_CHECKING:
+    import httpx
+
 
 class AutotodMultiwozSimulator(UserSimulatorBase):
     base_url = "http://127.0.0.1:8083"
@@ -25,14 +28,26 @@ class AutotodMultiwozSimulator(UserSimulatorBase):
         super().__init__(model, temperature, seed)
         self.mwoz_dialogue_id = multiwoz_dialogue_id
         self.session = None
+        self.async_session: Optional["httpx.AsyncClient"] = None
 
-    def set_up_session(self, **kwargs):
-        self.session = requests.Session()
-        payload = {
+    def _get_init_payload(self) -> dict[str, Any]:
+        return {
             "dialogue_id": self.mwoz_dialogue_id,
             "model_name": self.model,
         }
-        response = self.session.post(f"{self.base_url}/init-session", json=payload)
+
+    @staticmethod
+    def _get_answer_payload(chat_history: List[DialogueTurn]) -> dict[str, Any]:
+        if chat_history:
+            chatbot_message = chat_history[-1].content
+            return {"chatbot_message": chatbot_message}
+        return {"chatbot_message": ""}
+
+    def set_up_session(self, **kwargs):
+        self.session = requests.Session()
+        response = self.session.post(
+            f"{self.base_url}/init-session", json=self._get_init_payload()
+        )
         response.raise_for_status()
         data = response.json()
         self.mwoz_dialogue_id = data.get("dialogue_id", self.mwoz_dialogue_id)
@@ -41,19 +56,50 @@ class AutotodMultiwozSimulator(UserSimulatorBase):
         self.mwoz_dialogue_id = None
         self.session = None
 
+    async def aset_up_session(self, **kwargs):
+        # Only imported by the async simulation
+        import httpx
+
+        # Like the requests session, the client keeps the session cookies and does not time out (the simulator answers are LLM-generated)
+        self.async_session = httpx.AsyncClient(base_url=self.base_url, timeout=None)
+        response = await self.async_session.post(
+            "/init-session", json=self._get_init_payload()
+        )
+        response.raise_for_status()
+        data = response.json()
+        self.mwoz_dialogue_id = data.get("dialogue_id", self.mwoz_dialogue_id)
+
+    async def atear_down_session(self):
+        if self.async_session:
+            await self.async_session.aclose()
+        self.mwoz_dialogue_id = None
+        self.async_session = None
+
     def generate_response(
         self, chat_history: List[DialogueTurn]
     ) -> UserSimulatorResponse:
         if not self.session:
             raise ValueError("Session not set up.")
-        if chat_history:
-            chatbot_message = chat_history[-1].content
-            payload = {"chatbot_message": chatbot_message}
-        else:
-            payload = {"chatbot_message": ""}
-        response = self.session.post(f"{self.base_url}/get-answer", json=payload)
+        response = self.session.post(
+            f"{self.base_url}/get-answer", json=self._get_answer_payload(chat_history)
+        )
         response.raise_for_status()
-        chatbot_response: dict = response.json()
+        return self._parse_answer(response.json())
+
+    async def agenerate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        if not self.async_session:
+            raise ValueError("Session not set up.")
+        response = await self.async_session.post(
+            "/get-answer",
+            json=self._get_answer_payload(chat_history),
+        )
+        response.raise_for_status()
+        return self._parse_answer(response.json())
+
+    @staticmethod
+    def _parse_answer(chatbot_response: dict) -> UserSimulatorResponse:
         return UserSimulatorResponse(
             response_message=chatbot_response.get("user_answer", ""),
             is_end=chatbot_response.get("is_end", False),
@@ -1,11 +1,4 @@
-from typing import List, Optional
-import yaml
-
-from openai.types.chat import ChatCompletionMessageParam
-from litellm import (
-    completion,
-)
-from litellm.types.utils import ModelResponse, Choices
+from typing import TYPE_CHECKING, List, Optional
 
 from chat_checker.user_simulation.prompt_components import (
     END_CONVERSATION_INSTRUCTION,
@@ -20,16 +13,18 @@ from chat_checker.user_simulation.persona_simulator.persona_simulator_prompts im
     SYSTEM_PROMPT,
     USER_PROMPT,
 )
-from chat_checker.utils.llm_utils import DEFAULT_LLM
-from chat_checker.utils.misc_utils import get_matching_api_key
-from chat_checker.utils.prompt_utils import (
-    generate_chat_history_str,
-)
+from chat_checker.utils.llm_gateway import acompletion, completion
+from chat_checker.utils.llm_utils import get_default_llm
 from chat_checker.user_simulation.user_simulator_base import (
     OurUserSimulatorBase,
     UserSimulatorBase,
     UserSimulatorResponse,
 )
+from chat_checker.utils import yaml_utils
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+    from openai.types.chat import ChatCompletionMessageParam
 
 
 class PersonaSimulator(OurUserSimulatorBase):
@@ -37,12 +32,13 @@ class PersonaSimulator(OurUserSimulatorBase):
         self,
         user_persona: Persona,
         chatbot_info: ChatbotInfo,
-        model: str = DEFAULT_LLM,
+        model: Optional[str] = None,
         temperature: Optional[float] = None,
         seed: Optional[int] = None,
         typical_user_turn_length: Optional[str] = None,
         max_user_turn_length: Optional[str] = None,
     ):
+        model = model or get_default_llm()
         super().__init__(
             chatbot_info,
             model,
@@ -53,14 +49,12 @@ class PersonaSimulator(OurUserSimulatorBase):
         )
         self.user_persona = user_persona
 
-    def generate_response(
-        self, chat_history: List[DialogueTurn]
-    ) -> UserSimulatorResponse:
+    def _build_system_prompt(self) -> str:
         persona_model = {
             "profile": self.user_persona.profile,
             "task": self.user_persona.task,
         }
-        persona_str = yaml.safe_dump(
+        persona_str = yaml_utils.safe_dump(
             persona_model, indent=4, sort_keys=False, allow_unicode=True
         )
         if self.typical_user_turn_length is not None:
@@ -77,7 +71,7 @@ class PersonaSimulator(OurUserSimulatorBase):
         else:
             max_turn_length_constraint = ""
 
-        system_prompt = SYSTEM_PROMPT.format(
+        return SYSTEM_PROMPT.format(
             persona_type=self.user_persona.type,
             chatbot_info=self.chatbot_info.dump_as_yaml_without_task(),
             persona_str=persona_str,
@@ -85,27 +79,26 @@ class PersonaSimulator(OurUserSimulatorBase):
             end_conversation_instruction=END_CONVERSATION_INSTRUCTION,
             max_turn_length_constraint=max_turn_length_constraint,
         )
-        chat_history_str = generate_chat_history_str(
-            chat_history, user_tag="YOU", chatbot_tag="CHATBOT"
-        )
+
+    def _build_messages(
+        self, chat_history: List[DialogueTurn]
+    ) -> List["ChatCompletionMessageParam"]:
+        chat_history_str = self._render_chat_history(chat_history)
 
         user_prompt = USER_PROMPT.format(
             chat_history_str=chat_history_str, turn_number=len(chat_history) + 1
         )
 
-        messages: List[ChatCompletionMessageParam] = [
-            {"role": "system", "content": system_prompt},
+        messages: List["ChatCompletionMessageParam"] = [
+            {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_prompt},
         ]
+        return messages
 
-        response: ModelResponse = completion(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            seed=self.seed,
-            api_key=get_matching_api_key(self.model).get_secret_value(),
-            drop_params=True,
-        )
+    def _parse_response(
+        self, response: "ModelResponse", messages: List["ChatCompletionMessageParam"]
+    ) -> UserSimulatorResponse:
+        from litellm.types.utils import Choices, ModelResponse
 
         # for type-checking
         assert isinstance(response, ModelResponse)
@@ -126,3 +119,27 @@ class PersonaSimulator(OurUserSimulatorBase):
             prompt_messages=messages,
             model_response=response,
         )
+
+    def generate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        messages = self._build_messages(chat_history)
+        response: "ModelResponse" = completion(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            seed=self.seed,
+        )
+        return self._parse_response(response, messages)
+
+    async def agenerate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        messages = self._build_messages(chat_history)
+        response: "ModelResponse" = await acompletion(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            seed=self.seed,
+        )
+        return self._parse_response(response, messages)
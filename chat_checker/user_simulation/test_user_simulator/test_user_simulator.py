@@ -1,11 +1,5 @@
 from pathlib import Path
-from typing import List, Optional
-
-from openai.types.chat import ChatCompletionMessageParam
-from litellm import (
-    completion,
-)
-from litellm.types.utils import ModelResponse, Choices
+from typing import TYPE_CHECKING, List, Optional
 
 from chat_checker.models.breakdowns import BreakdownDescription
 from chat_checker.models.chatbot import ChatbotInfo
@@ -20,16 +14,18 @@ from chat_checker.user_simulation.user_simulator_base import (
     UserSimulatorBase,
     UserSimulatorResponse,
 )
-from chat_checker.utils.llm_utils import DEFAULT_LLM
-from chat_checker.utils.misc_utils import get_matching_api_key
-from chat_checker.utils.prompt_utils import (
-    generate_chat_history_str,
-)
+from chat_checker.utils.llm_gateway import acompletion, completion
+from chat_checker.utils.llm_utils import get_default_llm
 from chat_checker.user_simulation.test_user_simulator.test_user_simulator_prompts import (
     SYSTEM_PROMPT,
     USER_PROMPT,
 )
 
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+    from openai.types.chat import ChatCompletionMessageParam
+
+
 BASE_DIR = Path(__file__).parent
 
 
@@ -38,12 +34,13 @@ class TestUserSimulator(OurUserSimulatorBase):
         self,
         target_breakdown: BreakdownDescription,
         chatbot_info: ChatbotInfo,
-        model: str = DEFAULT_LLM,
+        model: Optional[str] = None,
         seed: Optional[int] = None,
         temperature: Optional[float] = None,
         typical_user_turn_length: Optional[str] = None,
         max_user_turn_length: Optional[str] = None,
     ):
+        model = model or get_default_llm()
         # Note: by default temperature is left at the default for more diverse responses
         super().__init__(
             chatbot_info,
@@ -55,9 +52,7 @@ class TestUserSimulator(OurUserSimulatorBase):
         )
         self.target_breakdown = target_breakdown
 
-    def generate_response(
-        self, chat_history: List[DialogueTurn]
-    ) -> UserSimulatorResponse:
+    def _build_system_prompt(self) -> str:
         if self.typical_user_turn_length is not None:
             specific_length_guidance = SPECIFIC_LENGTH_GUIDANCE.format(
                 typical_user_turn_length=self.typical_user_turn_length
@@ -72,7 +67,7 @@ class TestUserSimulator(OurUserSimulatorBase):
         else:
             max_turn_length_constraint = ""
 
-        system_prompt = SYSTEM_PROMPT.format(
+        return SYSTEM_PROMPT.format(
             error_type=self.target_breakdown.title,
             chatbot_info=self.chatbot_info.dump_as_yaml_without_task(),
             tester_instructions=self.target_breakdown.tester_instructions,
@@ -81,11 +76,10 @@ class TestUserSimulator(OurUserSimulatorBase):
             end_conversation_instruction=END_CONVERSATION_INSTRUCTION,
         )
 
-        chat_history_str = generate_chat_history_str(
-            chat_history,
-            user_tag="YOU",
-            chatbot_tag="CHATBOT",
-        )
+    def _build_messages(
+        self, chat_history: List[DialogueTurn]
+    ) -> List["ChatCompletionMessageParam"]:
+        chat_history_str = self._render_chat_history(chat_history)
         turn_number = len(chat_history) + 1
 
         user_prompt = USER_PROMPT.format(
@@ -93,19 +87,16 @@ class TestUserSimulator(OurUserSimulatorBase):
             turn_number=turn_number,
         )
 
-        messages: List[ChatCompletionMessageParam] = [
-            {"role": "system", "content": system_prompt},
+        messages: List["ChatCompletionMessageParam"] = [
+            {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_prompt},
         ]
+        return messages
 
-        response: ModelResponse = completion(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            seed=self.seed,
-            api_key=get_matching_api_key(self.model).get_secret_value(),
-            drop_params=True,
-        )
+    def _parse_response(
+        self, response: "ModelResponse", messages: List["ChatCompletionMessageParam"]
+    ) -> UserSimulatorResponse:
+        from litellm.types.utils import Choices, ModelResponse
 
         # for type-checking
         assert isinstance(response, ModelResponse)
@@ -129,3 +120,27 @@ class TestUserSimulator(OurUserSimulatorBase):
             prompt_messages=messages,
             model_response=response,
         )
+
+    def generate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        messages = self._build_messages(chat_history)
+        response: "ModelResponse" = completion(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            seed=self.seed,
+        )
+        return self._parse_response(response, messages)
+
+    async def agenerate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        messages = self._build_messages(chat_history)
+        response: "ModelResponse" = await acompletion(
+            model=self.model,
+            messages=messages,
+            temperature=self.temperature,
+            seed=self.seed,
+        )
+        return self._parse_response(response, messages)
@@ -1,22 +1,24 @@
 from abc import ABC, abstractmethod
+import asyncio
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Any
-
-from litellm.types.utils import ModelResponse
-from openai.types.chat import (
-    ChatCompletionMessageParam,
-)
+from functools import cached_property
+from typing import TYPE_CHECKING, List, Optional, Tuple, Any
 
 from chat_checker.models.chatbot import ChatbotInfo
 from chat_checker.models.dialogue import DialogueTurn
+from chat_checker.utils.prompt_utils import ChatHistoryRenderer
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+    from openai.types.chat import ChatCompletionMessageParam
 
 
 @dataclass
 class UserSimulatorResponse:
     response_message: str
     is_end: bool
-    prompt_messages: Optional[List[ChatCompletionMessageParam]] = None
-    model_response: Optional[ModelResponse] = None
+    prompt_messages: Optional[List["ChatCompletionMessageParam"]] = None
+    model_response: Optional["ModelResponse"] = None
     summaries: Optional[List[str]] = None
 
 
@@ -66,6 +68,38 @@ class UserSimulatorBase(ABC):
         """Tear down the current session."""
         pass
 
+    async def aset_up_session(self, **kwargs: Any) -> None:
+        """Asynchronously set up a new session for the user simulator.
+
+        By default, the synchronous set_up_session is run in a worker thread.
+
+        Args:
+            **kwargs: Additional arguments to set up the session.
+        """
+        await asyncio.to_thread(self.set_up_session, **kwargs)
+
+    async def agenerate_response(
+        self, chat_history: List[DialogueTurn]
+    ) -> UserSimulatorResponse:
+        """Asynchronously generate a response to the given chat history.
+
+        By default, the synchronous generate_response is run in a worker thread. Subclasses should override this with a native async implementation.
+
+        Args:
+            chat_history (List[DialogueTurn]): History of the conversation with the chatbot so far.
+
+        Returns:
+            UserSimulatorResponse: The response generated by the user simulator.
+        """
+        return await asyncio.to_thread(self.generate_response, chat_history)
+
+    async def atear_down_session(self) -> None:
+        """Asynchronously tear down the current session.
+
+        By default, the synchronous tear_down_session is run in a worker thread.
+        """
+        await asyncio.to_thread(self.tear_down_session)
+
     @staticmethod
     def handle_model_response_end(response_message: str) -> Tuple[str, bool]:
         """Check if the response message indicates the end of the conversation.
@@ -117,9 +151,33 @@ class OurUserSimulatorBase(UserSimulatorBase):
         self.chatbot_info = chatbot_info
         self.typical_user_turn_length = typical_user_turn_length
         self.max_user_turn_length = max_user_turn_length
+        self.history_renderer = ChatHistoryRenderer(
+            user_tag="YOU", chatbot_tag="CHATBOT"
+        )
+
+    @abstractmethod
+    def _build_system_prompt(self) -> str:
+        """Build the system prompt of the simulator."""
+        pass
+
+    @cached_property
+    def system_prompt(self) -> str:
+        # Built once per simulator, which also keeps the prompt prefix identical for provider-side prompt caching
+        return self._build_system_prompt()
+
+    def _render_chat_history(self, chat_history: List[DialogueTurn]) -> str:
+        # Only the turns added since the previous call are formatted
+        self.history_renderer.sync(chat_history)
+        return self.history_renderer.render()
 
     def set_up_session(self, **kwargs: Any) -> None:
         pass
 
     def tear_down_session(self) -> None:
         pass
+
+    async def aset_up_session(self, **kwargs: Any) -> None:
+        self.set_up_session(**kwargs)
+
+    async def atear_down_session(self) -> None:
+        self.tear_down_session()
@@ -0,0 +1,131 @@
+"""
+Benchmark of the import time of the CLI and the runners.
+
+Every measurement runs in a fresh interpreter with `python -X importtime`, so it is not affected by modules imported earlier.
+Usage: python -m chat_checker.utils.import_time_benchmark [--repeats N] [--top N] [--max-cli-seconds S]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+DEFAULT_TARGETS = [
+    "chat_checker.cli.application",
+    "chat_checker.simulation_runner",
+    "chat_checker.breakdown_identification_runner",
+    "chat_checker.rating_runner",
+    "chat_checker.persona_generation.persona_generator",
+]
+CLI_MODULE = "chat_checker.cli.application"
+# Dependencies that take long to import and should only be loaded when they are used
+HEAVY_MODULES = ["litellm", "openai", "matplotlib", "numpy", "lexical_diversity"]
+
+
+def measure_import(module: str) -> Tuple[float, List[str], List[Tuple[float, str]]]:
+    """
+    Import the module in a fresh interpreter.
+    Args:
+        module (str): The name of the module to import.
+    Returns:
+        Tuple[float, List[str], List[Tuple[float, str]]]: The total import time in seconds, the names of all imported modules and the cumulative import time in seconds of the modules directly imported by the module.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    imported_modules: List[str] = []
+    # The children of a module are listed before the module itself with one more level of indentation
+    pending_direct_imports: List[Tuple[float, str]] = []
+    direct_imports: List[Tuple[float, str]] = []
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <module name indented by 2 spaces per level>"
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+        name = name[1:].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        seconds = int(cumulative) / 1e6
+        imported_modules.append(name)
+        if depth == 1:
+            pending_direct_imports.append((seconds, name))
+        elif depth == 0:
+            if name == module:
+                total = seconds
+                direct_imports = pending_direct_imports
+            pending_direct_imports = []
+    return total, imported_modules, direct_imports
+
+
+def find_loaded_heavy_modules(imported_modules: List[str]) -> List[str]:
+    loaded = {name.split(".")[0] for name in imported_modules}
+    return [module for module in HEAVY_MODULES if module in loaded]
+
+
+def benchmark_module(module: str, repeats: int, top: int) -> float:
+    measurements = [measure_import(module) for _ in range(repeats)]
+    totals = [total for total, _, _ in measurements]
+    median_total = statistics.median(totals)
+    # Report the breakdown of the run closest to the median
+    _, imported_modules, direct_imports = min(
+        measurements, key=lambda m: abs(m[0] - median_total)
+    )
+    print(
+        f"{module}: median {median_total:.3f}s (min {min(totals):.3f}s, max {max(totals):.3f}s, {repeats} runs)"
+    )
+    heavy_modules = find_loaded_heavy_modules(imported_modules)
+    print(f"  heavy dependencies loaded: {', '.join(heavy_modules) or 'none'}")
+    for seconds, name in sorted(direct_imports, reverse=True)[:top]:
+        print(f"  {seconds:8.3f}s  {name}")
+    return median_total
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        default=DEFAULT_TARGETS,
+        help="Modules to benchmark (default: the CLI and the runners)",
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=5, help="Number of fresh imports per module"
+    )
+    parser.add_argument(
+        "--top", type=int, default=8, help="Number of slowest imports to list"
+    )
+    parser.add_argument(
+        "--max-cli-seconds",
+        type=float,
+        default=None,
+        help="Fail if the median import time of the CLI exceeds this limit (e.g. for CI)",
+    )
+    args = parser.parse_args(argv)
+
+    cli_time: Optional[float] = None
+    for module in args.modules:
+        median_total = benchmark_module(module, args.repeats, args.top)
+        if module == CLI_MODULE:
+            cli_time = median_total
+
+    if args.max_cli_seconds is not None:
+        if cli_time is None:
+            cli_time = benchmark_module(CLI_MODULE, args.repeats, args.top)
+        if cli_time > args.max_cli_seconds:
+            print(
+                f"The CLI import time of {cli_time:.3f}s exceeds the limit of {args.max_cli_seconds:.3f}s"
+            )
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
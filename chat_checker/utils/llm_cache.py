@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Optional
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
+DEFAULT_CACHE_FILE_NAME = "llm_cache.sqlite"
+MAX_CACHE_SIZE_ENV_VAR = "CHAT_CHECKER_LLM_CACHE_MAX_MB"
+DEFAULT_MAX_CACHE_SIZE_MB = 256
+
+
+def _serialize_response_format(response_format: Any) -> Any:
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        return response_format.model_json_schema()
+    return response_format
+
+
+def get_request_fingerprint(
+    model: str,
+    messages: list,
+    response_format: Any = None,
+    seed: Optional[int] = None,
+    temperature: Optional[float] = None,
+) -> str:
+    """Compute the cache key of a request as the SHA-256 hash of all parameters that influence the response."""
+    request = {
+        "model": model,
+        "messages": messages,
+        "response_format": _serialize_response_format(response_format),
+        "seed": seed,
+        "temperature": temperature,
+    }
+    request_json = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(request_json.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent on-disk cache of LLM responses backed by SQLite.
+    The least recently used entries are evicted once the stored responses exceed the maximum size.
+    """
+
+    def __init__(self, path: Path, max_size_bytes: Optional[int] = None):
+        """
+        Args:
+            path (Path): The path of the SQLite database file. Created if it does not exist.
+            max_size_bytes (Optional[int]): The maximum total size of the stored responses in bytes. Read from CHAT_CHECKER_LLM_CACHE_MAX_MB (default: 256 MB) when the cache is created if None, so that the value of the .env file applies.
+        """
+        if max_size_bytes is None:
+            max_size_mb = int(
+                os.getenv(MAX_CACHE_SIZE_ENV_VAR, str(DEFAULT_MAX_CACHE_SIZE_MB))
+            )
+            max_size_bytes = max_size_mb * 1024 * 1024
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # The connection is shared by all worker threads, access is serialized by the lock
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+            )
+
+    def get(self, key: str) -> Optional["ModelResponse"]:
+        from litellm.types.utils import ModelResponse
+
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+        response = ModelResponse(**json.loads(row[0]))
+        response._hidden_params["cache_hit"] = True
+        return response
+
+    def put(self, key: str, response: "ModelResponse") -> None:
+        response_json = response.model_dump_json()
+        size = len(response_json.encode("utf-8"))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response_json, size, time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total_size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+        rows = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_access"
+        ).fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ?", evicted_keys
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,86 @@
+from collections import defaultdict, deque
+from enum import StrEnum
+import json
+import os
+from pathlib import Path
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
+CASSETTE_ENV_VAR = "CHAT_CHECKER_LLM_CASSETTE"
+CASSETTE_MODE_ENV_VAR = "CHAT_CHECKER_LLM_CASSETTE_MODE"
+REPLAY_LATENCY_ENV_VAR = "CHAT_CHECKER_LLM_REPLAY_LATENCY"
+
+
+class CassetteMode(StrEnum):
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+class LLMCassette:
+    """
+    Records LLM responses to a JSONL cassette file or replays them from it.
+    In replay mode, responses are matched by request fingerprint. Requests with the same fingerprint get the recorded responses in recording order, the last one is repeated once they are used up.
+    """
+
+    def __init__(self, path: Path, mode: CassetteMode, replay_latency: float = 0.0):
+        """
+        Args:
+            path (Path): The path of the cassette file. Recorded responses are appended to it.
+            mode (CassetteMode): Whether to record or replay the responses.
+            replay_latency (float): Simulated latency in seconds of every replayed response.
+        """
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self._recorded_responses: dict[str, deque[str]] = defaultdict(deque)
+        if mode == CassetteMode.REPLAY:
+            if not path.exists():
+                raise ValueError(f"Cassette file {path} does not exist.")
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    self._recorded_responses[record["key"]].append(record["response"])
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMCassette"]:
+        """Create the cassette configured by the environment variables. None if no cassette is configured."""
+        cassette_path = os.getenv(CASSETTE_ENV_VAR)
+        if not cassette_path:
+            return None
+        mode = CassetteMode(os.getenv(CASSETTE_MODE_ENV_VAR, CassetteMode.REPLAY))
+        replay_latency = float(os.getenv(REPLAY_LATENCY_ENV_VAR, "0"))
+        return cls(Path(cassette_path), mode, replay_latency)
+
+    def record(self, key: str, response: "ModelResponse") -> None:
+        record = {"key": key, "response": response.model_dump_json()}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def replay(self, key: str) -> "ModelResponse":
+        from litellm.types.utils import ModelResponse
+
+        with self._lock:
+            responses = self._recorded_responses.get(key)
+            if not responses:
+                raise ValueError(
+                    f"No recorded response found in cassette {self.path} for request {key}."
+                )
+            response_json = responses[0] if len(responses) == 1 else responses.popleft()
+        return ModelResponse(**json.loads(response_json))
+
+
+def is_replay_mode() -> bool:
+    """Whether the LLM responses are replayed from a cassette (no API keys needed)."""
+    return (
+        bool(os.getenv(CASSETTE_ENV_VAR))
+        and os.getenv(CASSETTE_MODE_ENV_VAR, CassetteMode.REPLAY) == CassetteMode.REPLAY
+    )
@@ -0,0 +1,450 @@
+import asyncio
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterator, Optional
+
+from chat_checker.utils.llm_cache import LLMResponseCache, get_request_fingerprint
+from chat_checker.utils.llm_cassette import CassetteMode, LLMCassette
+from chat_checker.utils.llm_utils import get_model_capabilities
+from chat_checker.utils.misc_utils import load_env_file
+
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
+MAX_RETRIES_ENV_VAR = "CHAT_CHECKER_LLM_MAX_RETRIES"
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_INITIAL_BACKOFF = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+
+
+@lru_cache(maxsize=None)
+def get_retryable_errors() -> tuple[type[Exception], ...]:
+    # litellm takes seconds to import, so it is only imported once a request is sent
+    import litellm
+
+    return (
+        litellm.RateLimitError,
+        litellm.Timeout,
+        litellm.APIConnectionError,
+        litellm.ServiceUnavailableError,
+        litellm.InternalServerError,
+    )
+
+
+class RequestLimiter:
+    """
+    Caps the number of LLM requests that are in flight at the same time across all threads sharing the limiter.
+    A global cap applies to all requests and optional per-model caps apply to the requests of the respective model.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        max_in_flight_per_model: Optional[dict[str, int]] = None,
+    ):
+        """
+        Args:
+            max_in_flight (Optional[int]): The maximum number of concurrent requests. No limit if None.
+            max_in_flight_per_model (Optional[dict[str, int]]): The maximum number of concurrent requests per model name. No limit for models that are not included.
+        """
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_per_model = max_in_flight_per_model or {}
+        self._semaphore = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        )
+        self._model_semaphores = {
+            model: threading.BoundedSemaphore(limit)
+            for model, limit in self.max_in_flight_per_model.items()
+        }
+        # Semaphores of the same sizes per event loop, so that coroutines wait in order without blocking the loop
+        self._async_semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[Optional[str], asyncio.Semaphore]
+        ] = weakref.WeakKeyDictionary()
+        self._async_semaphores_lock = threading.Lock()
+
+    def _get_semaphores(self, model: Optional[str]) -> list[threading.BoundedSemaphore]:
+        # The model semaphore is acquired first so that requests waiting for a busy model do not block a global slot
+        semaphores = []
+        model_semaphore = self._model_semaphores.get(model) if model else None
+        if model_semaphore is not None:
+            semaphores.append(model_semaphore)
+        if self._semaphore is not None:
+            semaphores.append(self._semaphore)
+        return semaphores
+
+    @contextmanager
+    def limit(self, model: Optional[str] = None) -> Iterator[None]:
+        with ExitStack() as stack:
+            for semaphore in self._get_semaphores(model):
+                stack.enter_context(semaphore)
+            yield
+
+    def _get_async_semaphores(self, model: Optional[str]) -> list[asyncio.Semaphore]:
+        # Same order and sizes as _get_semaphores, the global semaphore has the key None
+        keys: list[Optional[str]] = []
+        if model is not None and model in self._model_semaphores:
+            keys.append(model)
+        if self._semaphore is not None:
+            keys.append(None)
+        with self._async_semaphores_lock:
+            loop_semaphores = self._async_semaphores.setdefault(
+                asyncio.get_running_loop(), {}
+            )
+            return [
+                loop_semaphores.setdefault(
+                    key,
+                    asyncio.Semaphore(
+                        self.max_in_flight_per_model[key]
+                        if key is not None
+                        else self.max_in_flight or 0
+                    ),
+                )
+                for key in keys
+            ]
+
+    @asynccontextmanager
+    async def alimit(self, model: Optional[str] = None) -> AsyncIterator[None]:
+        async with AsyncExitStack() as stack:
+            for async_semaphore, semaphore in zip(
+                self._get_async_semaphores(model), self._get_semaphores(model)
+            ):
+                # Coroutines of the loop queue in order on the asyncio semaphore
+                await stack.enter_async_context(async_semaphore)
+                # The shared semaphore is only contended by worker threads sending requests at the same time
+                await _acquire_without_blocking_loop(semaphore)
+                stack.callback(semaphore.release)
+            yield
+
+
+async def _acquire_without_blocking_loop(semaphore: threading.BoundedSemaphore) -> None:
+    """Acquire a semaphore shared with worker threads, waiting in a thread if it is taken."""
+    if semaphore.acquire(blocking=False):
+        return
+    acquisition = asyncio.ensure_future(asyncio.to_thread(semaphore.acquire))
+    try:
+        await asyncio.shield(acquisition)
+    except asyncio.CancelledError:
+        # The thread still acquires the semaphore, it is released as soon as it does
+        acquisition.add_done_callback(lambda _: semaphore.release())
+        raise
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously up to a budget per minute.
+    Callers reserve their amount up front and are told how long to wait, so waiting callers are served in order.
+    """
+
+    def __init__(self, budget_per_minute: int):
+        self.capacity = float(budget_per_minute)
+        self._refill_rate = budget_per_minute / 60
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self._refill_rate
+        )
+        self._last_refill = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Reserve the given amount and return the number of seconds the caller has to wait before using it.
+        Amounts larger than the capacity are capped so that they only wait for a full bucket.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self._refill_rate
+
+    def adjust(self, amount: float) -> None:
+        """Correct an earlier reservation by the given amount (positive to consume more, negative to give back)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+
+class LLMGateway:
+    """
+    Central entry point for the LLM calls of all stages (user simulation, breakdown detection, dialogue rating and persona generation).
+    Resolves the API key of the model, enforces the configured concurrency and rate limits and retries transient errors with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: Optional[int] = None,
+        max_in_flight_per_model: Optional[dict[str, int]] = None,
+        requests_per_minute: Optional[dict[str, int]] = None,
+        tokens_per_minute: Optional[dict[str, int]] = None,
+        max_retries: Optional[int] = None,
+        initial_backoff: float = DEFAULT_INITIAL_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        response_cache: Optional[LLMResponseCache] = None,
+        cassette: Optional[LLMCassette] = None,
+    ):
+        """
+        Args:
+            max_in_flight (Optional[int]): The maximum number of concurrent requests. No limit if None.
+            max_in_flight_per_model (Optional[dict[str, int]]): The maximum number of concurrent requests per model name.
+            requests_per_minute (Optional[dict[str, int]]): The request rate limit (RPM) per model name.
+            tokens_per_minute (Optional[dict[str, int]]): The token rate limit (TPM) per model name.
+            max_retries (Optional[int]): How often a request is retried after a retryable error. Read from CHAT_CHECKER_LLM_MAX_RETRIES (default: 5) when the gateway is created if None, so that the value of the .env file applies.
+            initial_backoff (float): The upper bound of the first backoff in seconds. Doubles after every retry.
+            max_backoff (float): The maximum backoff in seconds.
+            response_cache (Optional[LLMResponseCache]): Cache for the responses of deterministic requests that opt in with use_cache. No caching if None.
+            cassette (Optional[LLMCassette]): Cassette to record all responses to or to replay them from instead of calling the provider.
+        """
+        self.request_limiter = RequestLimiter(max_in_flight, max_in_flight_per_model)
+        self._request_buckets = {
+            model: TokenBucket(limit)
+            for model, limit in (requests_per_minute or {}).items()
+        }
+        self._token_buckets = {
+            model: TokenBucket(limit)
+            for model, limit in (tokens_per_minute or {}).items()
+        }
+        if max_retries is None:
+            max_retries = int(os.getenv(MAX_RETRIES_ENV_VAR, str(DEFAULT_MAX_RETRIES)))
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.response_cache = response_cache
+        self.cassette = cassette
+
+    def _reserve_rate_limits(
+        self, model: str, messages: list, max_tokens: Optional[int]
+    ) -> tuple[float, int]:
+        """Reserve the request and token budget for a call. Returns the time to wait and the reserved number of tokens."""
+        wait_time = 0.0
+        request_bucket = self._request_buckets.get(model)
+        if request_bucket is not None:
+            wait_time = request_bucket.reserve(1)
+        reserved_tokens = 0
+        token_bucket = self._token_buckets.get(model)
+        if token_bucket is not None:
+            from litellm import token_counter
+
+            reserved_tokens = token_counter(model=model, messages=messages)
+            reserved_tokens += max_tokens or 0
+            wait_time = max(wait_time, token_bucket.reserve(reserved_tokens))
+        return wait_time, reserved_tokens
+
+    def _settle_token_usage(
+        self, model: str, reserved_tokens: int, response: Optional["ModelResponse"]
+    ) -> None:
+        token_bucket = self._token_buckets.get(model)
+        if token_bucket is None:
+            return
+        used_tokens = 0
+        if response is not None and getattr(response, "usage", None):
+            used_tokens = response.usage.total_tokens  # type: ignore
+        token_bucket.adjust(used_tokens - reserved_tokens)
+
+    def _get_backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(
+            0, min(self.max_backoff, self.initial_backoff * 2**attempt)
+        )
+
+    def _prepare_kwargs(self, model: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+        kwargs.setdefault(
+            "api_key", get_model_capabilities(model).get_api_key().get_secret_value()
+        )
+        # drop all params that are not supported by the model (e.g., temperature 0 is not supported by o-series models)
+        kwargs.setdefault("drop_params", True)
+        return kwargs
+
+    def _is_cacheable(self, kwargs: dict[str, Any], use_cache: bool) -> bool:
+        if not use_cache or self.response_cache is None:
+            return False
+        # Only deterministic requests are cached, otherwise repeated sampling would always return the same response
+        return kwargs.get("temperature") == 0 or kwargs.get("seed") is not None
+
+    def _replay(self, request_key: str) -> Optional["ModelResponse"]:
+        if self.cassette is None or self.cassette.mode != CassetteMode.REPLAY:
+            return None
+        return self.cassette.replay(request_key)
+
+    def _store(
+        self, request_key: str, response: "ModelResponse", cacheable: bool
+    ) -> None:
+        if cacheable and self.response_cache:
+            self.response_cache.put(request_key, response)
+        if self.cassette is not None and self.cassette.mode == CassetteMode.RECORD:
+            self.cassette.record(request_key, response)
+
+    def completion(
+        self, model: str, messages: list, use_cache: bool = False, **kwargs: Any
+    ) -> "ModelResponse":
+        request_key = get_request_fingerprint(
+            model,
+            messages,
+            kwargs.get("response_format"),
+            kwargs.get("seed"),
+            kwargs.get("temperature"),
+        )
+        replayed_response = self._replay(request_key)
+        if replayed_response is not None:
+            time.sleep(self.cassette.replay_latency if self.cassette else 0)
+            return replayed_response
+        cacheable = self._is_cacheable(kwargs, use_cache)
+        response = None
+        if cacheable and self.response_cache:
+            response = self.response_cache.get(request_key)
+        if response is None:
+            response = self._send_completion(model, messages, **kwargs)
+        self._store(request_key, response, cacheable)
+        return response
+
+    async def acompletion(
+        self, model: str, messages: list, use_cache: bool = False, **kwargs: Any
+    ) -> "ModelResponse":
+        request_key = get_request_fingerprint(
+            model,
+            messages,
+            kwargs.get("response_format"),
+            kwargs.get("seed"),
+            kwargs.get("temperature"),
+        )
+        replayed_response = self._replay(request_key)
+        if replayed_response is not None:
+            await asyncio.sleep(self.cassette.replay_latency if self.cassette else 0)
+            return replayed_response
+        cacheable = self._is_cacheable(kwargs, use_cache)
+        response = None
+        if cacheable and self.response_cache:
+            response = self.response_cache.get(request_key)
+        if response is None:
+            response = await self._asend_completion(model, messages, **kwargs)
+        self._store(request_key, response, cacheable)
+        return response
+
+    def _send_completion(
+        self, model: str, messages: list, **kwargs: Any
+    ) -> "ModelResponse":
+        import litellm
+        from litellm.types.utils import ModelResponse
+
+        kwargs = self._prepare_kwargs(model, kwargs)
+        attempt = 0
+        while True:
+            wait_time, reserved_tokens = self._reserve_rate_limits(
+                model, messages, kwargs.get("max_tokens")
+            )
+            if wait_time > 0:
+                time.sleep(wait_time)
+            response = None
+            try:
+                with self.request_limiter.limit(model):
+                    response = litellm.completion(
+                        model=model, messages=messages, **kwargs
+                    )
+                # for type-checking
+                assert isinstance(response, ModelResponse)
+                return response
+            except get_retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                backoff = self._get_backoff(attempt)
+                attempt += 1
+                print(
+                    f"LLM request to {model} failed ({type(e).__name__}). Retry {attempt}/{self.max_retries} in {backoff:.1f}s..."
+                )
+                time.sleep(backoff)
+            finally:
+                self._settle_token_usage(model, reserved_tokens, response)
+
+    async def _asend_completion(
+        self, model: str, messages: list, **kwargs: Any
+    ) -> "ModelResponse":
+        import litellm
+        from litellm.types.utils import ModelResponse
+
+        kwargs = self._prepare_kwargs(model, kwargs)
+        attempt = 0
+        while True:
+            wait_time, reserved_tokens = self._reserve_rate_limits(
+                model, messages, kwargs.get("max_tokens")
+            )
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+            response = None
+            try:
+                async with self.request_limiter.alimit(model):
+                    response = await litellm.acompletion(
+                        model=model, messages=messages, **kwargs
+                    )
+                # for type-checking
+                assert isinstance(response, ModelResponse)
+                return response
+            except get_retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                backoff = self._get_backoff(attempt)
+                attempt += 1
+                print(
+                    f"LLM request to {model} failed ({type(e).__name__}). Retry {attempt}/{self.max_retries} in {backoff:.1f}s..."
+                )
+                await asyncio.sleep(backoff)
+            finally:
+                self._settle_token_usage(model, reserved_tokens, response)
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the process-wide gateway. Created on first use, so that a cassette configured in the .env file is applied."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                load_env_file()
+                _gateway = LLMGateway(cassette=LLMCassette.from_env())
+    return _gateway
+
+
+def configure_llm_gateway(**kwargs: Any) -> LLMGateway:
+    """
+    Replace the process-wide gateway by one with the given configuration (see LLMGateway for the arguments).
+    Should be called before any requests are sent, e.g. at the start of a CLI command.
+    """
+    global _gateway
+    # The cassette is configured by environment variables and kept for the new gateway
+    kwargs.setdefault("cassette", get_llm_gateway().cassette)
+    _gateway = LLMGateway(**kwargs)
+    return _gateway
+
+
+def set_llm_response_cache(response_cache: Optional[LLMResponseCache]) -> None:
+    """Set the response cache of the process-wide gateway. Disables caching if None."""
+    get_llm_gateway().response_cache = response_cache
+
+
+def completion(
+    model: str, messages: list, use_cache: bool = False, **kwargs: Any
+) -> "ModelResponse":
+    """
+    Send a completion request through the process-wide gateway. Takes the same arguments as litellm.completion.
+    With use_cache, deterministic requests (temperature 0 or fixed seed) are served from the response cache if available.
+    """
+    return get_llm_gateway().completion(model, messages, use_cache=use_cache, **kwargs)
+
+
+async def acompletion(
+    model: str, messages: list, use_cache: bool = False, **kwargs: Any
+) -> "ModelResponse":
+    """Send an async completion request through the process-wide gateway. Takes the same arguments as completion."""
+    return await get_llm_gateway().acompletion(
+        model, messages, use_cache=use_cache, **kwargs
+    )
@@ -1,15 +1,76 @@
+from dataclasses import dataclass
+from functools import lru_cache
 import os
+from typing import TYPE_CHECKING, Optional
 
-from litellm import (
-    supports_response_schema,
-    get_supported_openai_params,
-    completion_cost,
-)
-from litellm.types.utils import ModelResponse
+from pydantic import SecretStr
 
 from chat_checker.models.llm import UsageCost
+from chat_checker.utils.misc_utils import get_matching_api_key
 
-DEFAULT_LLM = os.getenv("CHAT_CHECKER_DEFAULT_LLM", "gpt-4o-2024-08-06")
+if TYPE_CHECKING:
+    from litellm.types.utils import ModelResponse
+
+DEFAULT_LLM_ENV_VAR = "CHAT_CHECKER_DEFAULT_LLM"
+FALLBACK_DEFAULT_LLM = "gpt-4o-2024-08-06"
+
+
+def get_default_llm() -> str:
+    """
+    Get the model of the stages without a model of their own (CHAT_CHECKER_DEFAULT_LLM).
+    Read at call time, as the CLI imports the modules before a command loads the .env file.
+    """
+    return os.getenv(DEFAULT_LLM_ENV_VAR, FALLBACK_DEFAULT_LLM)
+
+
+@dataclass(frozen=True)
+class ModelCapabilities:
+    model: str
+    # The litellm provider of the model (e.g. "openai"), None if unknown to litellm
+    provider: Optional[str]
+    supports_structured_outputs: bool
+    supports_json_mode: bool
+    # The API key for the model, None if the model is not supported by ChatChecker
+    api_key: Optional[SecretStr]
+
+    def get_api_key(self) -> SecretStr:
+        if self.api_key is None:
+            raise ValueError(f"Model {self.model} is not supported yet.")
+        return self.api_key
+
+
+@lru_cache(maxsize=None)
+def get_model_capabilities(model: str) -> ModelCapabilities:
+    """
+    Resolve the capabilities of a model once. The litellm model introspection is repeated for every request otherwise.
+    Args:
+        model (str): The name of the model.
+    Returns:
+        ModelCapabilities: The capabilities of the model.
+    """
+    from litellm import (
+        get_llm_provider,
+        get_supported_openai_params,
+        supports_response_schema,
+    )
+
+    supports_json_mode = "response_format" in (get_supported_openai_params(model) or [])
+    try:
+        _, provider, _, _ = get_llm_provider(model)
+    except Exception:
+        provider = None
+    try:
+        api_key: Optional[SecretStr] = get_matching_api_key(model)
+    except ValueError:
+        api_key = None
+    return ModelCapabilities(
+        model=model,
+        provider=provider,
+        supports_structured_outputs=supports_json_mode
+        and supports_response_schema(model),
+        supports_json_mode=supports_json_mode,
+        api_key=api_key,
+    )
 
 
 def supports_structured_outputs(model: str) -> bool:
@@ -20,21 +81,48 @@ def supports_structured_outputs(model: str) -> bool:
     Returns:
         bool: True if the model supports structured outputs, False otherwise.
     """
-    supports_response_format = "response_format" in (
-        get_supported_openai_params(model) or []
-    )
-    return supports_response_format and supports_response_schema(model)
+    return get_model_capabilities(model).supports_structured_outputs
 
 
-def compute_total_usage(generations: list[ModelResponse]) -> UsageCost:
+def compute_total_usage(generations: list["ModelResponse"]) -> UsageCost:
+    from litellm import completion_cost
+
     # ModelResponse objects do have the usage attribute (https://docs.litellm.ai/docs/completion/output) it is just not typed in the stub
     prompt_tokens = sum([gen.usage.prompt_tokens for gen in generations])  # type: ignore
     completion_tokens = sum([gen.usage.completion_tokens for gen in generations])  # type: ignore
     total_tokens = sum([gen.usage.total_tokens for gen in generations])  # type: ignore
-    total_cost = sum([completion_cost(gen) for gen in generations])
+    # Cached responses were already paid for when they were first generated
+    cache_hits = [gen._hidden_params.get("cache_hit", False) for gen in generations]
+    total_cost = sum(
+        [
+            completion_cost(gen)
+            for gen, cache_hit in zip(generations, cache_hits)
+            if not cache_hit
+        ]
+    )
     return UsageCost(
         prompt_tokens=prompt_tokens,
         completion_tokens=completion_tokens,
         total_tokens=total_tokens,
         cost=total_cost,
+        cache_hits=sum(cache_hits),
+    )
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    from litellm import cost_per_token
+
+    prompt_cost, completion_cost = cost_per_token(
+        model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+    )
+    return prompt_cost + completion_cost
+
+
+def merge_usage(usages: list[UsageCost]) -> UsageCost:
+    return UsageCost(
+        prompt_tokens=sum([usage.prompt_tokens for usage in usages]),
+        completion_tokens=sum([usage.completion_tokens for usage in usages]),
+        total_tokens=sum([usage.total_tokens for usage in usages]),
+        cost=sum([usage.cost for usage in usages]),
+        cache_hits=sum([usage.cache_hits for usage in usages]),
     )
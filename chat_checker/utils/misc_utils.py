@@ -1,14 +1,13 @@
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 import os
 from pathlib import Path
 import re
-from typing import List, Optional
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, TypeVar
 
-import litellm
 from pydantic import SecretStr
-import numpy as np
-from openai.types.chat import ChatCompletionMessageParam
-from lexical_diversity import lex_div
-
 
 from chat_checker.models.dialogue import (
     Dialogue,
@@ -17,48 +16,61 @@ from chat_checker.models.dialogue import (
     SpeakerRole,
 )
 from chat_checker.models.llm import UsageCost  # type: ignore
+from chat_checker.utils.llm_cassette import is_replay_mode
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
 
 BASE_DIR = Path(__file__).parent
+ENV_FILE_PATH = BASE_DIR.parent / ".env"
+T = TypeVar("T")
+R = TypeVar("R")
 OPENAI_API_KEY_NAME = "CHAT_CHECKER_OPENAI_API_KEY"
 GEMINI_API_KEY_NAME = "CHAT_CHECKER_GEMINI_API_KEY"
 ANTHROPIC_API_KEY_NAME = "CHAT_CHECKER_ANTHROPIC_API_KEY"
 
 
+@lru_cache(maxsize=None)
+def load_env_file() -> None:
+    """
+    Load the environment variables from the .env file of the package (once, overriding the system environment).
+    Called at the start of every CLI command and runner, before any CHAT_CHECKER_* variable is read.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv(ENV_FILE_PATH, override=True)
+
+
 def safe_load_api_key(api_key: str) -> Optional[SecretStr]:
+    load_env_file()
     key = os.getenv(api_key)
     if not key:
         return None
     return SecretStr(key)
 
 
-OPENAI_API_KEY = safe_load_api_key(OPENAI_API_KEY_NAME) or SecretStr(
-    "no_api_key_provided"
-)
-
-GEMINI_API_KEY = safe_load_api_key(GEMINI_API_KEY_NAME) or SecretStr(
-    "no_api_key_provided"
-)
-
-ANTHROPIC_API_KEY = safe_load_api_key(ANTHROPIC_API_KEY_NAME) or SecretStr(
-    "no_api_key_provided"
-)
-
-
 def get_matching_api_key(model_name: str) -> SecretStr:
+    import litellm
+
     if model_name.startswith("claude/"):
-        return ANTHROPIC_API_KEY
+        api_key_name = ANTHROPIC_API_KEY_NAME
     elif model_name.startswith("gemini/"):
-        return GEMINI_API_KEY
+        api_key_name = GEMINI_API_KEY_NAME
     elif (
         model_name in litellm.open_ai_chat_completion_models
         or model_name in litellm.open_ai_text_completion_models
     ):
-        return OPENAI_API_KEY
+        api_key_name = OPENAI_API_KEY_NAME
     else:
         raise ValueError(f"Model {model_name} is not supported yet.")
+    return safe_load_api_key(api_key_name) or SecretStr("no_api_key_provided")
 
 
 def verify_environment(is_cli=False) -> bool:
+    load_env_file()
+    if is_replay_mode():
+        # The responses are replayed from a cassette, so no API key is needed
+        return True
     if not safe_load_api_key(OPENAI_API_KEY_NAME):
         if is_cli:
             print(
@@ -73,6 +85,8 @@ def verify_environment(is_cli=False) -> bool:
 
 
 def five_num_summary(data):
+    import numpy as np
+
     # Filter out nan values
     data = [x for x in data if not np.isnan(x)]
     return {
@@ -126,6 +140,8 @@ def compute_chat_statistics(chat_history: List[DialogueTurn]) -> dict:
 
 
 def compute_run_statistics(dialogues: List[Dialogue]) -> dict:
+    from lexical_diversity import lex_div
+
     num_dialogues = len(dialogues)
     dialogues_with_errors = [
         dialogue for dialogue in dialogues if dialogue.error is not None
@@ -358,12 +374,12 @@ def fill_in_persona_type(user_persona: dict):
 
 
 def compute_analysis_cost_statistics(
-    dialogues: List[Dialogue], total_analysis_usage: UsageCost
+    num_dialogues: int, total_analysis_usage: UsageCost
 ) -> dict:
-    avg_prompt_tokens = total_analysis_usage.prompt_tokens / len(dialogues)
-    avg_completion_tokens = total_analysis_usage.completion_tokens / len(dialogues)
-    avg_total_tokens = total_analysis_usage.total_tokens / len(dialogues)
-    avg_cost = total_analysis_usage.cost / len(dialogues)
+    avg_prompt_tokens = total_analysis_usage.prompt_tokens / num_dialogues
+    avg_completion_tokens = total_analysis_usage.completion_tokens / num_dialogues
+    avg_total_tokens = total_analysis_usage.total_tokens / num_dialogues
+    avg_cost = total_analysis_usage.cost / num_dialogues
     cost_stats = {
         "prompt_tokens": total_analysis_usage.prompt_tokens,
         "completion_tokens": total_analysis_usage.completion_tokens,
@@ -373,12 +389,62 @@ def compute_analysis_cost_statistics(
         "avg_completion_tokens": avg_completion_tokens,
         "avg_total_tokens": avg_total_tokens,
         "avg_cost": avg_cost,
+        "cache_hits": total_analysis_usage.cache_hits,
     }
     return cost_stats
 
 
+class TokenIdSequence:
+    """
+    Memory-efficient token sequence for lexical diversity measures over many dialogues.
+    Only the identity of the tokens matters for MTLD, so every token is stored as a 4-byte id of a shared vocabulary.
+    """
+
+    def __init__(self) -> None:
+        self._vocabulary: dict[str, int] = {}
+        self._token_ids = array("I")
+
+    def __len__(self) -> int:
+        return len(self._token_ids)
+
+    def extend(self, tokens: Iterable[str]) -> None:
+        vocabulary = self._vocabulary
+        self._token_ids.extend(
+            vocabulary.setdefault(token, len(vocabulary)) for token in tokens
+        )
+
+    def mtld(self) -> float:
+        from lexical_diversity import lex_div
+
+        return lex_div.mtld(self._token_ids)
+
+
+def map_in_order(
+    function: Callable[[T], R], items: Iterable[T], workers: int = 1
+) -> Iterator[R]:
+    """
+    Apply the function to the items in a thread pool and yield the results in the order of the items.
+
+    Args:
+        function (Callable[[T], R]): The function to apply.
+        items (Iterable[T]): The items, consumed lazily so that at most 2 * workers items are in flight.
+        workers (int): The number of worker threads. The function is applied in the calling thread if 1.
+    """
+    if workers <= 1:
+        yield from map(function, items)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures: deque[Future[R]] = deque()
+        for item in items:
+            futures.append(executor.submit(function, item))
+            if len(futures) >= 2 * workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+
+
 def write_prompt_to_txt_file(
-    prompt: list[ChatCompletionMessageParam], file: Path
+    prompt: list["ChatCompletionMessageParam"], file: Path
 ) -> None:
     prompt_str = ""
     for message in prompt:
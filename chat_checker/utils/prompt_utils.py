@@ -1,5 +1,82 @@
+from typing import Optional
+
 from chat_checker.models.dialogue import DialogueTurn, SpeakerRole
 
+QUOTED_TURN_FORMAT = '{number}. {tag}: "{content}"'
+UNQUOTED_TURN_FORMAT = "{number}. {tag}: {content}"
+
+
+class ChatHistoryRenderer:
+    """
+    Renders a growing chat history incrementally.
+    Every turn is formatted once when it is added and appended to the rendered text, prefixes of the history are served from line offsets.
+    """
+
+    def __init__(
+        self,
+        user_tag: str,
+        chatbot_tag: str = "CHATBOT",
+        start_number: int = 1,
+        turn_format: str = QUOTED_TURN_FORMAT,
+    ):
+        """
+        Args:
+            user_tag (str): The tag of the user turns.
+            chatbot_tag (str): The tag of the chatbot turns.
+            start_number (int): The number of the first turn.
+            turn_format (str): The format of a turn line with the placeholders number, tag and content.
+        """
+        self.user_tag = user_tag
+        self.chatbot_tag = chatbot_tag
+        self.start_number = start_number
+        self.turn_format = turn_format
+        self.reset()
+
+    def reset(self) -> None:
+        # Role and content of the rendered turns, to detect edits of the history in sync
+        self._rendered_turns: list[tuple[SpeakerRole, str]] = []
+        # End offset of each line in the rendered text, used to hand out prefixes
+        self._line_ends: list[int] = []
+        self._text = ""
+
+    def __len__(self) -> int:
+        return len(self._rendered_turns)
+
+    def append(self, turn: DialogueTurn) -> None:
+        line = self.turn_format.format(
+            number=self.start_number + len(self._rendered_turns),
+            tag=self.user_tag if turn.role == SpeakerRole.USER else self.chatbot_tag,
+            content=turn.content,
+        )
+        if self._text:
+            self._text += "\n"
+        self._text += line
+        self._rendered_turns.append((turn.role, turn.content))
+        self._line_ends.append(len(self._text))
+
+    def extend(self, turns: list[DialogueTurn]) -> None:
+        for turn in turns:
+            self.append(turn)
+
+    def sync(self, chat_history: list[DialogueTurn]) -> None:
+        """Render the turns of the chat history that were added since the last sync. Starts over if the history is not a continuation of the rendered one (e.g. an earlier turn was edited)."""
+        num_turns = len(self._rendered_turns)
+        if len(chat_history) < num_turns or any(
+            turn.role != role or turn.content != content
+            for turn, (role, content) in zip(chat_history, self._rendered_turns)
+        ):
+            self.reset()
+            num_turns = 0
+        self.extend(chat_history[num_turns:])
+
+    def render(self, num_turns: Optional[int] = None) -> str:
+        """Return the rendered history of the first num_turns turns (all turns if None)."""
+        if num_turns is None or num_turns >= len(self._line_ends):
+            return self._text
+        if num_turns <= 0:
+            return ""
+        return self._text[: self._line_ends[num_turns - 1]]
+
 
 def generate_chat_history_str(
     chat_history: list[DialogueTurn],
@@ -7,13 +84,9 @@ def generate_chat_history_str(
     chatbot_tag: str = "CHATBOT",
     start_number: int = 1,
 ) -> str:
-    dialogue_str = "\n".join(
-        [
-            f'{start_number + i}. {user_tag if message.role == SpeakerRole.USER else chatbot_tag}: "{message.content}"'
-            for i, message in enumerate(chat_history)
-        ]
-    )
-    return dialogue_str
+    renderer = ChatHistoryRenderer(user_tag, chatbot_tag, start_number)
+    renderer.extend(chat_history)
+    return renderer.render()
 
 
 # Based on https://github.com/aghassel/LLM-dialogue-breakdown-detection-challenge/blob/main/Preprocessing/data_preprocessing.ipynb (Format Files for LLM Analysis)
@@ -23,10 +96,8 @@ def generate_ghassel_chat_history_str(
     chatbot_tag: str = "Bot",
     start_number: int = 1,
 ) -> str:
-    dialogue_str = "\n".join(
-        [
-            f"{start_number + i}. {user_tag if message.role == SpeakerRole.USER else chatbot_tag}: {message.content}"
-            for i, message in enumerate(chat_history)
-        ]
+    renderer = ChatHistoryRenderer(
+        user_tag, chatbot_tag, start_number, turn_format=UNQUOTED_TURN_FORMAT
     )
-    return dialogue_str
+    renderer.extend(chat_history)
+    return renderer.render()
@@ -0,0 +1,19 @@
+from typing import Any, Optional
+
+import yaml
+
+# Use the libyaml based C implementations if PyYAML was built with them, they are much faster for large runs
+try:
+    from yaml import CSafeDumper as SafeDumper, CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeDumper, SafeLoader  # type: ignore[assignment]
+
+
+def safe_load(stream: Any) -> Any:
+    """Drop-in replacement for yaml.safe_load that uses the C loader if available."""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_dump(data: Any, stream: Optional[Any] = None, **kwargs: Any) -> Any:
+    """Drop-in replacement for yaml.safe_dump that uses the C dumper if available."""
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
@@ -0,0 +1,4 @@
+import os
+
+# Use the model cost map bundled with litellm instead of downloading it on import, so that the tests run offline
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
@@ -0,0 +1,238 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from typing import Optional
+
+from litellm.types.utils import ModelResponse
+import pytest
+
+from chat_checker.breakdown_detection.annotation_store import (
+    BreakdownAnnotationStore,
+    get_context_fingerprint,
+    set_breakdown_annotation_store,
+)
+from chat_checker.breakdown_detection.breakdown_detector import (
+    BreakdownIdentifier,
+    find_dialogue_breakdowns,
+)
+from chat_checker.models.breakdowns import (
+    BreakdownAnnotation,
+    BreakdownDecision,
+    BreakdownProvenance,
+)
+from chat_checker.models.chatbot import ChatbotInfo
+from chat_checker.models.dialogue import DialogueTurn, SpeakerRole
+
+PROVENANCE = BreakdownProvenance(detector_model="gpt-4o", prompt_version="abc123")
+CHATBOT_INFO = ChatbotInfo(
+    name="Echo", description="Repeats the user", available_languages=["English"]
+)
+
+
+def make_chat_history(*contents: str) -> list[DialogueTurn]:
+    return [
+        DialogueTurn(
+            turn_id=turn_id,
+            role=SpeakerRole.DIALOGUE_SYSTEM if turn_id % 2 else SpeakerRole.USER,
+            content=content,
+        )
+        for turn_id, content in enumerate(contents, start=1)
+    ]
+
+
+def make_annotation(reasoning: str) -> BreakdownAnnotation:
+    return BreakdownAnnotation(
+        reasoning=reasoning,
+        score=1.0,
+        decision=BreakdownDecision.NO_BREAKDOWN,
+        breakdown_types=[],
+    )
+
+
+class CountingBreakdownIdentifier(BreakdownIdentifier):
+    """Annotates every turn without an LLM and counts the analyzed turns."""
+
+    def __init__(self):
+        self.analyzed_utterances: list[str] = []
+
+    def identify_breakdowns(
+        self,
+        chat_history,
+        last_bot_utterance,
+        is_task_oriented=True,
+        chatbot_info=None,
+        llm_name="gpt-4o",
+        seed: Optional[int] = 42,
+        chat_history_str=None,
+    ):
+        self.analyzed_utterances.append(last_bot_utterance)
+        return make_annotation(f"Analyzed {last_bot_utterance}"), [], ModelResponse()
+
+
+@pytest.fixture
+def annotation_store(tmp_path):
+    annotation_store = BreakdownAnnotationStore(tmp_path / "annotations.sqlite")
+    set_breakdown_annotation_store(annotation_store)
+    yield annotation_store
+    set_breakdown_annotation_store(None)
+    annotation_store.close()
+
+
+def test_context_fingerprint_is_stable():
+    chat_history = make_chat_history("Hello!", "Hi", "How can I help?")
+    fingerprint = get_context_fingerprint(PROVENANCE, CHATBOT_INFO, chat_history)
+    # Only the roles and contents of the turns are part of the context, not their IDs or annotations
+    other_chat_history = [
+        turn.model_copy(
+            update={
+                "turn_id": turn.turn_id + 10,
+                "breakdown_annotation": make_annotation("Earlier annotation"),
+            }
+        )
+        for turn in chat_history
+    ]
+    assert fingerprint == get_context_fingerprint(
+        PROVENANCE.model_copy(), CHATBOT_INFO.model_copy(), other_chat_history
+    )
+
+
+@pytest.mark.parametrize(
+    "provenance, chatbot_info, chat_history, annotated_turn_index",
+    [
+        (
+            PROVENANCE.model_copy(update={"detector_model": "gpt-4o-mini"}),
+            CHATBOT_INFO,
+            make_chat_history("Hello!", "Hi", "How can I help?"),
+            None,
+        ),
+        (
+            PROVENANCE.model_copy(update={"prompt_version": "def456"}),
+            CHATBOT_INFO,
+            make_chat_history("Hello!", "Hi", "How can I help?"),
+            None,
+        ),
+        (
+            PROVENANCE,
+            None,
+            make_chat_history("Hello!", "Hi", "How can I help?"),
+            None,
+        ),
+        (
+            PROVENANCE,
+            CHATBOT_INFO,
+            make_chat_history("Hello!", "Hey", "How can I help?"),
+            None,
+        ),
+        (
+            PROVENANCE,
+            CHATBOT_INFO,
+            make_chat_history("Hello!", "Hi", "How can I help?"),
+            0,
+        ),
+    ],
+)
+def test_context_fingerprint_changes_with_the_context(
+    provenance, chatbot_info, chat_history, annotated_turn_index
+):
+    fingerprint = get_context_fingerprint(
+        PROVENANCE, CHATBOT_INFO, make_chat_history("Hello!", "Hi", "How can I help?")
+    )
+    assert fingerprint != get_context_fingerprint(
+        provenance, chatbot_info, chat_history, annotated_turn_index
+    )
+
+
+def test_annotation_store_persists_annotations(tmp_path):
+    annotation_store = BreakdownAnnotationStore(tmp_path / "annotations.sqlite")
+    annotation_store.put("key", make_annotation("Stored"))
+    annotation_store.close()
+
+    annotation_store = BreakdownAnnotationStore(tmp_path / "annotations.sqlite")
+    assert annotation_store.get("key") == make_annotation("Stored")
+    assert annotation_store.get("missing") is None
+    annotation_store.close()
+
+
+def test_different_contexts_are_analyzed_concurrently(annotation_store):
+    # Both analyses only finish if they run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+
+    def analyze(key: str):
+        barrier.wait()
+        return make_annotation(f"Analyzed {key}"), key
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(
+            executor.map(
+                lambda key: annotation_store.get_or_analyze(key, lambda: analyze(key)),
+                ["a" * 64, "b" * 64],
+            )
+        )
+
+    assert results == [
+        (make_annotation(f"Analyzed {'a' * 64}"), "a" * 64),
+        (make_annotation(f"Analyzed {'b' * 64}"), "b" * 64),
+    ]
+
+
+def test_concurrent_identical_contexts_are_analyzed_once(annotation_store):
+    analysis_started = threading.Event()
+    finish_analysis = threading.Event()
+    analyzed_keys = []
+
+    def analyze():
+        analyzed_keys.append("key")
+        analysis_started.set()
+        finish_analysis.wait(timeout=5)
+        return make_annotation("Analyzed"), "call"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(annotation_store.get_or_analyze, "key", analyze)
+        analysis_started.wait(timeout=5)
+        second = executor.submit(annotation_store.get_or_analyze, "key", analyze)
+        finish_analysis.set()
+
+    assert first.result() == (make_annotation("Analyzed"), "call")
+    # The waiting caller gets the annotation but not the result of the LLM call
+    assert second.result() == (make_annotation("Analyzed"), None)
+    assert analyzed_keys == ["key"]
+
+
+def test_failed_analysis_is_not_stored(annotation_store):
+    def fail():
+        raise RuntimeError("LLM call failed")
+
+    with pytest.raises(RuntimeError):
+        annotation_store.get_or_analyze("key", fail)
+    assert annotation_store.get("key") is None
+    assert annotation_store.get_or_analyze(
+        "key", lambda: (make_annotation("Analyzed"), "call")
+    ) == (make_annotation("Analyzed"), "call")
+
+
+def test_identical_turn_contexts_are_annotated_once(annotation_store):
+    breakdown_identifier = CountingBreakdownIdentifier()
+    chat_history = make_chat_history("Hello!", "Hi", "How can I help?")
+    find_dialogue_breakdowns(
+        chat_history,
+        chatbot_info=CHATBOT_INFO,
+        breakdown_identifier=breakdown_identifier,
+    )
+    assert breakdown_identifier.analyzed_utterances == ["Hello!", "How can I help?"]
+
+    # Another dialogue with the same greeting only sends its diverging turn to the LLM
+    other_chat_history = make_chat_history("Hello!", "Hey", "How can I help?")
+    model_responses = find_dialogue_breakdowns(
+        other_chat_history,
+        chatbot_info=CHATBOT_INFO,
+        breakdown_identifier=breakdown_identifier,
+    )
+    assert breakdown_identifier.analyzed_utterances == [
+        "Hello!",
+        "How can I help?",
+        "How can I help?",
+    ]
+    assert len(model_responses) == 1
+    assert (
+        other_chat_history[0].breakdown_annotation
+        == chat_history[0].breakdown_annotation
+    )
@@ -0,0 +1,119 @@
+from litellm.types.utils import ModelResponse
+import pytest
+
+from chat_checker.models.breakdowns import BreakdownAnnotation
+from chat_checker.utils import llm_cache
+from chat_checker.utils.llm_cache import (
+    DEFAULT_MAX_CACHE_SIZE_MB,
+    MAX_CACHE_SIZE_ENV_VAR,
+    LLMResponseCache,
+    get_request_fingerprint,
+)
+
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Hello"},
+]
+
+
+def make_response(content: str) -> ModelResponse:
+    return ModelResponse(
+        id=f"response-{content}",
+        model="gpt-4o-mini",
+        choices=[{"message": {"role": "assistant", "content": content}}],
+    )
+
+
+def test_request_fingerprint_is_stable():
+    fingerprint = get_request_fingerprint(
+        "gpt-4o-mini", MESSAGES, BreakdownAnnotation, seed=42, temperature=0
+    )
+    # Equal requests built independently (e.g. in another run) get the same key
+    assert fingerprint == get_request_fingerprint(
+        "gpt-4o-mini",
+        [dict(message) for message in MESSAGES],
+        BreakdownAnnotation,
+        seed=42,
+        temperature=0,
+    )
+    assert len(fingerprint) == 64
+
+
+@pytest.mark.parametrize(
+    "changed_request",
+    [
+        {"model": "gpt-4o"},
+        {"messages": MESSAGES[:1]},
+        {"response_format": None},
+        {"seed": 43},
+        {"temperature": 1},
+    ],
+)
+def test_request_fingerprint_changes_with_any_parameter(changed_request):
+    request = {
+        "model": "gpt-4o-mini",
+        "messages": MESSAGES,
+        "response_format": BreakdownAnnotation,
+        "seed": 42,
+        "temperature": 0,
+    }
+    assert get_request_fingerprint(**request) != get_request_fingerprint(
+        **{**request, **changed_request}
+    )
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    # The entries are ordered by their last access time, a fake clock makes the order independent of the timer resolution
+    now = [1000.0]
+
+    def tick() -> float:
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(llm_cache.time, "time", tick)
+
+
+def test_cache_round_trip(tmp_path):
+    cache = LLMResponseCache(tmp_path / "llm_cache.sqlite")
+    cache.put("key", make_response("cached"))
+    cache.close()
+
+    # The responses persist across cache instances (i.e. across runs)
+    cache = LLMResponseCache(tmp_path / "llm_cache.sqlite")
+    response = cache.get("key")
+    assert response is not None
+    assert response.choices[0].message.content == "cached"
+    assert response._hidden_params["cache_hit"]
+    assert cache.get("missing") is None
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used_entries(tmp_path, fake_clock):
+    response_size = len(make_response("a").model_dump_json().encode("utf-8"))
+    cache = LLMResponseCache(
+        tmp_path / "llm_cache.sqlite", max_size_bytes=int(response_size * 2.5)
+    )
+    cache.put("a", make_response("a"))
+    cache.put("b", make_response("b"))
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") is not None
+    cache.put("c", make_response("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    cache.close()
+
+
+def test_max_size_is_read_when_the_cache_is_created(tmp_path, monkeypatch):
+    monkeypatch.delenv(MAX_CACHE_SIZE_ENV_VAR, raising=False)
+    cache = LLMResponseCache(tmp_path / "llm_cache.sqlite")
+    assert cache.max_size_bytes == DEFAULT_MAX_CACHE_SIZE_MB * 1024 * 1024
+    cache.close()
+
+    # e.g. set by the .env file after the module was imported
+    monkeypatch.setenv(MAX_CACHE_SIZE_ENV_VAR, "1")
+    cache = LLMResponseCache(tmp_path / "llm_cache.sqlite")
+    assert cache.max_size_bytes == 1024 * 1024
+    cache.close()
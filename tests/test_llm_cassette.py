@@ -0,0 +1,88 @@
+from litellm.types.utils import ModelResponse
+import pytest
+
+from chat_checker.utils.llm_cassette import CassetteMode, LLMCassette
+from chat_checker.utils.llm_gateway import LLMGateway
+
+MODEL = "gpt-4o-mini"
+
+
+def make_messages(content: str) -> list:
+    return [{"role": "user", "content": content}]
+
+
+def make_response(content: str) -> ModelResponse:
+    return ModelResponse(
+        model=MODEL,
+        choices=[{"message": {"role": "assistant", "content": content}}],
+    )
+
+
+def record_responses(cassette_path, responses_by_prompt: dict[str, list[str]]):
+    """Record the responses of a fake provider through a gateway in record mode."""
+    gateway = LLMGateway(cassette=LLMCassette(cassette_path, CassetteMode.RECORD))
+    provider_responses = {
+        prompt: iter(responses) for prompt, responses in responses_by_prompt.items()
+    }
+
+    def send_completion(model, messages, **kwargs):
+        return make_response(next(provider_responses[messages[-1]["content"]]))
+
+    gateway._send_completion = send_completion  # type: ignore[method-assign]
+    for prompt, responses in responses_by_prompt.items():
+        for _ in responses:
+            gateway.completion(MODEL, make_messages(prompt), seed=42)
+
+
+def get_content(response: ModelResponse) -> str:
+    return response.choices[0].message.content  # type: ignore
+
+
+def test_record_then_replay(tmp_path):
+    cassette_path = tmp_path / "cassettes" / "run.jsonl"
+    record_responses(cassette_path, {"Hello": ["Hi!"], "Bye": ["Goodbye!"]})
+    assert len(cassette_path.read_text(encoding="utf-8").splitlines()) == 2
+
+    gateway = LLMGateway(cassette=LLMCassette(cassette_path, CassetteMode.REPLAY))
+
+    def send_completion(model, messages, **kwargs):
+        raise AssertionError("The provider must not be called in replay mode")
+
+    gateway._send_completion = send_completion  # type: ignore[method-assign]
+    # Responses are matched by request, not by recording order
+    response = gateway.completion(MODEL, make_messages("Bye"), seed=42)
+    assert get_content(response) == "Goodbye!"
+    response = gateway.completion(MODEL, make_messages("Hello"), seed=42)
+    assert get_content(response) == "Hi!"
+
+
+def test_replay_returns_repeated_requests_in_recording_order(tmp_path):
+    cassette_path = tmp_path / "run.jsonl"
+    record_responses(cassette_path, {"Hello": ["First", "Second"]})
+
+    gateway = LLMGateway(cassette=LLMCassette(cassette_path, CassetteMode.REPLAY))
+    replayed_contents = [
+        get_content(gateway.completion(MODEL, make_messages("Hello"), seed=42))
+        for _ in range(3)
+    ]
+    # The last recorded response is repeated once the recorded ones are used up
+    assert replayed_contents == ["First", "Second", "Second"]
+
+
+def test_replay_miss_raises(tmp_path):
+    cassette_path = tmp_path / "run.jsonl"
+    record_responses(cassette_path, {"Hello": ["Hi!"]})
+
+    gateway = LLMGateway(cassette=LLMCassette(cassette_path, CassetteMode.REPLAY))
+    # Any change of the request (here the seed) changes its fingerprint
+    with pytest.raises(ValueError, match="No recorded response found"):
+        gateway.completion(MODEL, make_messages("Hello"), seed=43)
+    with pytest.raises(ValueError, match="No recorded response found"):
+        gateway.completion(MODEL, make_messages("Hello!"), seed=42)
+    response = gateway.completion(MODEL, make_messages("Hello"), seed=42)
+    assert get_content(response) == "Hi!"
+
+
+def test_replay_of_missing_cassette_raises(tmp_path):
+    with pytest.raises(ValueError, match="does not exist"):
+        LLMCassette(tmp_path / "missing.jsonl", CassetteMode.REPLAY)
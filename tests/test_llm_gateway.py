@@ -0,0 +1,15 @@
+from chat_checker.utils.llm_gateway import (
+    DEFAULT_MAX_RETRIES,
+    MAX_RETRIES_ENV_VAR,
+    LLMGateway,
+)
+
+
+def test_max_retries_is_read_when_the_gateway_is_created(monkeypatch):
+    monkeypatch.delenv(MAX_RETRIES_ENV_VAR, raising=False)
+    assert LLMGateway().max_retries == DEFAULT_MAX_RETRIES
+
+    # e.g. set by the .env file after the module was imported
+    monkeypatch.setenv(MAX_RETRIES_ENV_VAR, "1")
+    assert LLMGateway().max_retries == 1
+    assert LLMGateway(max_retries=3).max_retries == 3
@@ -0,0 +1,14 @@
+from chat_checker.utils.llm_utils import (
+    DEFAULT_LLM_ENV_VAR,
+    FALLBACK_DEFAULT_LLM,
+    get_default_llm,
+)
+
+
+def test_default_llm_is_read_at_call_time(monkeypatch):
+    monkeypatch.delenv(DEFAULT_LLM_ENV_VAR, raising=False)
+    assert get_default_llm() == FALLBACK_DEFAULT_LLM
+
+    # e.g. set by the .env file after the module was imported
+    monkeypatch.setenv(DEFAULT_LLM_ENV_VAR, "gpt-4o-mini")
+    assert get_default_llm() == "gpt-4o-mini"
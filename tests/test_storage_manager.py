@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from chat_checker.data_management.storage_manager import (
+    ANNOTATED_DIALOGUES_LOG_FILE_NAME,
+    DIALOGUES_LOG_FILE_NAME,
+    compact_dialogues_logs,
+    load_dialogues,
+    save_dialogue,
+)
+from chat_checker.models.dialogue import (
+    Dialogue,
+    DialogueTurn,
+    FinishReason,
+    SpeakerRole,
+)
+
+RUN_ID = "test_run"
+
+
+def make_dialogue(
+    path: Path, storage_file: Optional[Path] = None, num_turns: int = 2
+) -> Dialogue:
+    return Dialogue(
+        dialogue_id=path.name,
+        path=path,
+        storage_file=storage_file,
+        user_name="persona_1",
+        chat_history=[
+            DialogueTurn(
+                turn_id=turn_id,
+                role=SpeakerRole.USER if turn_id % 2 else SpeakerRole.DIALOGUE_SYSTEM,
+                content=f"Turn {turn_id} of {path.name}",
+            )
+            for turn_id in range(1, num_turns + 1)
+        ],
+        finish_reason=FinishReason.MAX_TURNS_REACHED,
+    )
+
+
+def read_log_lines(dialogues_log: Path) -> list[str]:
+    return dialogues_log.read_text(encoding="utf-8").splitlines()
+
+
+def test_jsonl_write_compaction_and_reload_round_trip(tmp_path):
+    run_dir = tmp_path / "runs" / RUN_ID
+    run_dir.mkdir(parents=True)
+    dialogues_log = run_dir / DIALOGUES_LOG_FILE_NAME
+    first = make_dialogue(run_dir / "persona_1" / "dialogue_1", dialogues_log)
+    second = make_dialogue(run_dir / "persona_1" / "dialogue_2", dialogues_log)
+    assert save_dialogue(first) == dialogues_log
+    save_dialogue(second)
+    # Saving a dialogue again appends a record that supersedes the earlier one
+    updated_first = make_dialogue(first.path, dialogues_log, num_turns=4)
+    save_dialogue(updated_first)
+    records = [json.loads(line) for line in read_log_lines(dialogues_log)]
+    assert [record["path"] for record in records] == [
+        "persona_1/dialogue_1",
+        "persona_1/dialogue_2",
+        "persona_1/dialogue_1",
+    ]
+
+    _, dialogues = load_dialogues(tmp_path, RUN_ID)
+    assert dialogues == [updated_first, second]
+
+    # A record cut off by an interrupted run is dropped by the compaction
+    with open(dialogues_log, "a", encoding="utf-8") as f:
+        f.write('{"path": "persona_1/dialogue_3", "dialogue_id"')
+    compact_dialogues_logs([dialogues_log])
+    assert len(read_log_lines(dialogues_log)) == 2
+    _, compacted_dialogues = load_dialogues(tmp_path, RUN_ID)
+    assert compacted_dialogues == [updated_first, second]
+
+
+def test_jsonl_annotated_dialogues_are_saved_to_a_separate_log(tmp_path):
+    run_dir = tmp_path / "runs" / RUN_ID
+    run_dir.mkdir(parents=True)
+    dialogues_log = run_dir / DIALOGUES_LOG_FILE_NAME
+    dialogue = make_dialogue(run_dir / "persona_1" / "dialogue_1", dialogues_log)
+    save_dialogue(dialogue)
+
+    assert (
+        save_dialogue(dialogue, annotated=True)
+        == run_dir / ANNOTATED_DIALOGUES_LOG_FILE_NAME
+    )
+    assert len(read_log_lines(dialogues_log)) == 1
+
+
+def test_json_and_yaml_dialogues_round_trip(tmp_path):
+    dialogue_dir = tmp_path / "runs" / RUN_ID / "persona_1"
+    dialogue_dir.mkdir(parents=True)
+    json_dialogue = make_dialogue(dialogue_dir / "dialogue_1.json")
+    yaml_dialogue = make_dialogue(dialogue_dir / "dialogue_2.yaml")
+    save_dialogue(json_dialogue)
+    save_dialogue(yaml_dialogue)
+
+    _, dialogues = load_dialogues(tmp_path, RUN_ID)
+    assert dialogues == [json_dialogue, yaml_dialogue]
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_parallel_loading_keeps_the_order_and_skips_corrupt_files(
+    tmp_path, capsys, use_processes
+):
+    run_dir = tmp_path / "runs" / RUN_ID
+    dialogues = []
+    for persona_index in range(1, 4):
+        persona_dir = run_dir / f"persona_{persona_index}"
+        persona_dir.mkdir(parents=True)
+        for dialogue_index in range(1, 4):
+            dialogue = make_dialogue(persona_dir / f"dialogue_{dialogue_index}.yaml")
+            save_dialogue(dialogue)
+            dialogues.append(dialogue)
+    corrupt_file = run_dir / "persona_2" / "dialogue_2.yaml"
+    corrupt_file.write_text("dialogue_id: [unclosed", encoding="utf-8")
+    expected_dialogues = [
+        dialogue for dialogue in dialogues if dialogue.path != corrupt_file
+    ]
+
+    _, sequential_dialogues = load_dialogues(tmp_path, RUN_ID)
+    _, parallel_dialogues = load_dialogues(
+        tmp_path, RUN_ID, workers=4, use_processes=use_processes
+    )
+
+    assert sequential_dialogues == expected_dialogues
+    assert parallel_dialogues == expected_dialogues
+    assert f"{corrupt_file}: " in capsys.readouterr().out